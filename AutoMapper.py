@@ -0,0 +1,238 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Auto Mapper
+#
+#   PURPOSE: Suggest Py MI Lab attributes for Granta MI Schema attributes by name similarity
+#
+#   The template attribute names are indexed once into a TF-IDF weighted matrix of word tokens and character trigrams. Schema
+#   attribute names (with units stripped) are scored against it in batches with a single matrix product, restricted to the
+#   attributes allowed for the section (point/string for single values, point array for functional X/Y, anything but a
+#   dictionary for tabular columns).
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import math
+import re
+
+import numpy as np
+
+from SchemaParser import split_units
+
+# Set Scoring Defaults
+CATEGORY_WEIGHT = 0.35      # Weight of the category name relative to the attribute name in "Category - Attribute"
+NGRAM = 3                   # Character n-gram length
+BATCH_SIZE = 1024           # Number of schema names scored per matrix product
+THRESHOLD = 0.45            # Minimum score for auto_map to fill a mapping
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+#==================================================================================================================================================================
+# FEATURES
+
+# Split a name into lowercase word tokens
+def tokenize(name):
+    return _TOKEN.findall(name.lower())
+
+# Get the weighted word and character n-gram features of a name
+def name_features(name, weight=1.0, features=None):
+    if features == None:
+        features = {}
+    for token in tokenize(name):
+        key = 'w:' + token
+        features[key] = features.get(key, 0.0) + weight
+        padded = ' ' + token + ' '
+        for i in range(len(padded) - NGRAM + 1):
+            key = 'c:' + padded[i:i+NGRAM]
+            features[key] = features.get(key, 0.0) + weight
+    return features
+
+# Get the features of a Py MI Lab "Category - Attribute" name
+def template_features(name):
+    cat, sep, att = name.partition(' - ')
+    if sep == '':
+        return name_features(name)
+    features = name_features(att)
+    return name_features(cat, CATEGORY_WEIGHT, features)
+
+# Get the features of a Granta MI attribute name with any units stripped
+def schema_features(name):
+    if name == None:
+        return {}
+    return name_features(split_units(str(name).strip())[0])
+
+#==================================================================================================================================================================
+# AUTO MAPPER
+
+class AutoMapper:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.names = list(catalog.types.keys())
+        self.columns = {}
+        for j in range(len(self.names)):
+            self.columns[self.names[j]] = j
+
+        # Build the feature vocabulary and document frequencies
+        docs = [template_features(name) for name in self.names]
+        self.vocab = {}
+        df = []
+        for doc in docs:
+            for key in doc:
+                if key not in self.vocab:
+                    self.vocab[key] = len(self.vocab)
+                    df.append(0)
+                df[self.vocab[key]] = df[self.vocab[key]] + 1
+
+        # Inverse document frequency
+        N = len(docs)
+        self.idf = np.array([math.log((1 + N)/(1 + d)) + 1.0 for d in df], dtype=np.float32)
+        self._idf = self.idf.tolist()
+        self.default_idf = math.log(1 + N) + 1.0
+
+        # Build the normalized template matrix (features x attributes)
+        rows, cols, vals = [], [], []
+        for j in range(N):
+            for key, w in docs[j].items():
+                rows.append(self.vocab[key])
+                cols.append(j)
+                vals.append(w)
+        self.matrix = np.zeros((len(self.vocab), N), dtype=np.float32)
+        np.add.at(self.matrix, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), np.array(vals, dtype=np.float32))
+        self.matrix = self.matrix*self.idf[:, None]
+        norms = np.linalg.norm(self.matrix, axis=0)
+        norms[norms == 0] = 1.0
+        self.matrix = self.matrix/norms
+
+        # Precompute the candidate columns of each catalog view
+        self._views = {}
+
+    # Get the template sub-matrix and names allowed for a catalog view
+    def _view(self, view):
+        if view.label not in self._views:
+            names = view.options[1:]
+            idx = np.array([self.columns[name] for name in names], dtype=np.int64)
+            self._views[view.label] = (names, np.ascontiguousarray(self.matrix[:, idx]))
+        return self._views[view.label]
+
+    # Build the normalized query matrix for a batch of schema names
+    def _queries(self, names):
+        Q = np.zeros((len(names), len(self.vocab)), dtype=np.float32)
+        norms = np.zeros(len(names), dtype=np.float32)
+        rows, cols, vals = [], [], []
+        for i in range(len(names)):
+            total = 0.0
+            for key, w in schema_features(names[i]).items():
+                if key in self.vocab:
+                    k = self.vocab[key]
+                    w = w*self._idf[k]
+                    rows.append(i)
+                    cols.append(k)
+                    vals.append(w)
+                else:
+                    # -- Features not in any template name only count toward the norm
+                    w = w*self.default_idf
+                total = total + w*w
+            norms[i] = math.sqrt(total)
+        if len(rows) > 0:
+            Q[np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)] = np.array(vals, dtype=np.float32)
+        norms[norms == 0] = 1.0
+        return Q/norms[:, None]
+
+    # Score schema names against the attributes of a catalog view
+    # -- Returns the candidate names and a (schema names x candidates) cosine similarity matrix
+    # -- Repeated names (e.g. 'Time' in every functional attribute) are only scored once
+    def score(self, names, view):
+        candidates, M = self._view(view)
+        unique = list(dict.fromkeys(names))
+        scores = np.empty((len(unique), len(candidates)), dtype=np.float32)
+        for start in range(0, len(unique), BATCH_SIZE):
+            batch = unique[start:start+BATCH_SIZE]
+            scores[start:start+len(batch)] = self._queries(batch) @ M
+        if len(unique) < len(names):
+            row = {}
+            for i in range(len(unique)):
+                row[unique[i]] = i
+            scores = scores[np.array([row[name] for name in names], dtype=np.int64)]
+        return candidates, scores
+
+    # Rank the best candidates for each schema name
+    # -- Returns a list of [(Py MI Lab attribute, score), ...] per schema name, best first
+    def suggest(self, names, view, top_k=5):
+        candidates, scores = self.score(names, view)
+        if len(names) == 0 or len(candidates) == 0:
+            return [[] for name in names]
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k-1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        return [[(candidates[best[i, j]], float(best_scores[i, j])) for j in range(k)] for i in range(len(names))]
+
+    # Rank suggestions for every mapping slot in the schema
+    # -- Returns a dictionary with the same layout as the configuration holding suggestion lists instead of attributes
+    def suggest_config(self, Atts, top_k=3):
+        Suggestions = {'Single Value':{}, 'Functional':{}, 'Tabular':{}}
+
+        # -- Single Attributes
+        atts = list(Atts['Single Value'].keys())
+        ranked = self.suggest(atts, self.catalog.single, top_k)
+        for i in range(len(atts)):
+            Suggestions['Single Value'][atts[i]] = ranked[i]
+
+        # -- Functional Attributes (X and Y variables scored in one batch)
+        atts = list(Atts['Functional'].keys())
+        names = []
+        for att in atts:
+            names.extend(Atts['Functional'][att]['Variables'])
+        ranked = self.suggest(names, self.catalog.functional, top_k)
+        for i in range(len(atts)):
+            Suggestions['Functional'][atts[i]] = {'X':ranked[2*i], 'Y':ranked[2*i+1]}
+
+        # -- Tabular Attributes (all columns scored in one batch)
+        atts = list(Atts['Tabular'].keys())
+        names = []
+        for att in atts:
+            names.extend(Atts['Tabular'][att]['Columns'])
+        ranked = self.suggest(names, self.catalog.tabular, top_k)
+        k = 0
+        for att in atts:
+            num_cols = len(Atts['Tabular'][att]['Columns'])
+            Suggestions['Tabular'][att] = ranked[k:k+num_cols]
+            k = k + num_cols
+
+        return Suggestions
+
+    # Fill the mappings of a configuration with the best suggestion scoring at least the threshold
+    # -- Existing mappings are kept unless overwrite = True. Returns the number of mappings filled.
+    def auto_map(self, Config, Atts, threshold=THRESHOLD, overwrite=False):
+        Suggestions = self.suggest_config(Atts, top_k=1)
+        filled = 0
+
+        def best(ranked, current):
+            if len(ranked) == 0 or ranked[0][1] < threshold:
+                return current, False
+            if current not in ('', None) and not overwrite:
+                return current, False
+            return ranked[0][0], ranked[0][0] != current
+
+        # -- Single Attributes
+        for att, ranked in Suggestions['Single Value'].items():
+            Config['Single Value'][att], changed = best(ranked, Config['Single Value'][att])
+            filled = filled + changed
+
+        # -- Functional Attributes
+        for att, ranked in Suggestions['Functional'].items():
+            for var in ('X', 'Y'):
+                Config['Functional'][att][var], changed = best(ranked[var], Config['Functional'][att][var])
+                filled = filled + changed
+
+        # -- Tabular Attributes
+        for att, ranked in Suggestions['Tabular'].items():
+            PyCols = Config['Tabular'][att]['PyCols']
+            for j in range(min(len(PyCols), len(ranked))):
+                PyCols[j], changed = best(ranked[j], PyCols[j])
+                filled = filled + changed
+
+        return filled
@@ -0,0 +1,42 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Benchmark Timing
+#
+#   PURPOSE: Time a function for the benchmark commands (SchemaBenchmark, CurveDecimation) without either of them importing the
+#            other
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import time
+
+# Set Timing Defaults
+MIN_SAMPLE = 0.05       # Minimum duration of a timing sample in seconds
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Time a function
+# -- Fast functions are called in a loop so each sample takes at least MIN_SAMPLE seconds, and the first (warm-up) call is only
+#    kept as a sample when it is that slow
+# -- Returns the time per call of each sample in seconds and the result of the last call
+def time_call(func, repeat, min_time=None):
+    if min_time == None:
+        min_time = MIN_SAMPLE
+    start = time.perf_counter()
+    result = func()
+    first = time.perf_counter() - start
+
+    times = []
+    number = 1
+    if first >= min_time:
+        times.append(first)
+    else:
+        number = int(min_time/max(first, 1e-7)) + 1
+    while len(times) < repeat:
+        start = time.perf_counter()
+        for k in range(number):
+            result = func()
+        times.append((time.perf_counter() - start)/number)
+    return times, result
@@ -0,0 +1,100 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Category Pickers
+#
+#   PURPOSE: Pick Py MI Lab attributes in two stages, first the template category and then the attribute within it, so each
+#            widget only sends the browser the attributes of one category instead of the full option list
+#
+#   The row editors draw one selectbox (or multiselect) per mapping, and every one of them carried every allowed Py MI Lab
+#   attribute, so a large schema sent the same few hundred names to the browser hundreds of times per rerun. A category picker
+#   is a small category selectbox next to an attribute selectbox holding only that category (see OptionView.categories).
+#
+#   The attribute widget keeps the key and values of the single selectbox it replaces, so the code that saves the mappings
+#   reads it the same way, but only shows the attribute part of each name; the category widget uses the same key with
+#   CATEGORY_SUFFIX. The category shown is the category of the current mapping, or the category last chosen while nothing is
+#   mapped. Choosing another category only browses it: the current mapping stays selected, under its full name, at the top of
+#   the attribute widget until an attribute of the new category is picked. Naming attribute multiselects keep the full names, since they can hold attributes of several categories.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import streamlit as st
+
+# Set Picker Defaults
+PICKER_MIN_OPTIONS = 100        # Catalogs with more single value options than this use category pickers by default
+CATEGORY_SUFFIX = '_cat'
+CATEGORY_WIDTHS = [0.4, 0.6]    # Widths of the category and attribute widgets
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the label of an attribute within its category
+# -- The category is shown by the category widget, so only the attribute part of "Category - Attribute" is sent
+def attribute_label(name):
+    return name.partition(' - ')[2]
+
+# Get the category shown for a mapping
+def current_category(view, value, key):
+    category = view.category_of(value)
+    if category == None:
+        category = st.session_state.get(key + CATEGORY_SUFFIX)
+    if category not in view.categories:
+        category = next(iter(view.categories), None)
+    return category
+
+# Create the category selectbox of a picker
+def category_box(label, view, category, key, label_visibility):
+    categories = list(view.categories.keys())
+    return st.selectbox(label + ' Category', categories, index=categories.index(category), key=key + CATEGORY_SUFFIX,
+                        label_visibility=label_visibility)
+
+# Pick a Py MI Lab attribute
+# -- view: catalog OptionView with the allowed Py MI Lab attributes
+# -- value: current mapping ('' for unmapped, None to show the placeholder)
+# -- enabled: False draws one selectbox with the full option list
+# -- Returns the selected attribute
+def attribute_picker(label, view, value, key, enabled=True, label_visibility='visible', placeholder=None):
+    kwargs = {'key':key, 'label_visibility':label_visibility}
+    if placeholder != None:
+        kwargs['placeholder'] = placeholder
+    if not enabled or len(view.categories) == 0:
+        return st.selectbox(label, view.options, index=None if value == None else view.index(value), **kwargs)
+
+    category = current_category(view, value, key)
+    grid = st.columns(CATEGORY_WIDTHS)
+    with grid[0]:
+        category = category_box(label, view, category, key, label_visibility)
+    options = view.categories[category]
+    label_of = attribute_label
+    if value == None:
+        index = None
+    else:
+        if value not in options:
+            # -- Browsing another category keeps the current mapping
+            options = [value] + options
+            label_of = lambda name: name if name == value else attribute_label(name)
+        index = options.index(value)
+    with grid[1]:
+        return st.selectbox(label, options, index=index, format_func=label_of, **kwargs)
+
+# Pick several Py MI Lab attributes
+# -- values: current selection (None for an empty selection)
+# -- The attributes already selected stay in the options whatever the category, so they are kept when the category changes
+def attributes_picker(label, view, values, key, enabled=True, label_visibility='visible', placeholder=None):
+    values = list(values) if values != None else []
+    kwargs = {'key':key, 'label_visibility':label_visibility}
+    if placeholder != None:
+        kwargs['placeholder'] = placeholder
+    if not enabled or len(view.categories) == 0:
+        return st.multiselect(label, view.options, default=values, **kwargs)
+
+    category = current_category(view, values[0] if len(values) > 0 else None, key)
+    if st.session_state.get(key + CATEGORY_SUFFIX) in view.categories:
+        category = st.session_state[key + CATEGORY_SUFFIX]
+    grid = st.columns(CATEGORY_WIDTHS)
+    with grid[0]:
+        category = category_box(label, view, category, key, label_visibility)
+    options = list(dict.fromkeys(values + view.categories[category][1:]))
+    with grid[1]:
+        return st.multiselect(label, options, default=values, **kwargs)
@@ -0,0 +1,260 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Configuration File Format
+#
+#   PURPOSE: Read and write configuration files in the legacy JSON layout and in the compact, versioned layout
+#
+#   Legacy JSON is the Config dictionary as is (see SchemaConfig). The compact layout stores Atts once, packed into columns, and
+#   every mapping by position against it, so Granta MI names and tabular columns are not repeated. Each Py MI Lab attribute is
+#   stored once in the Names table and referred to by its index (0 is the empty mapping), and the fingerprint of the template the
+#   names were chosen from is recorded so a configuration made against a different template can be detected on load:
+#       {'Format':FORMAT_NAME, 'Version':1, 'Template':fingerprint, 'Names':['', name, ...], 'Atts':packed Atts,
+#        'Single Value':[id, ...], 'Functional':[[x id, y id], ...], 'Tabular':[[id, ...], ...],
+#        'Columns':{att:GrantaCols} (only where they differ from Atts), 'Placement':{...}, 'Extra':{other Config keys}}
+#
+#   The binary encoding is the compact layout behind a short header, compressed with zlib, about ten times smaller than the
+#   legacy JSON. Loading any of the formats is bound by building the Config objects rather than by parsing: json, pickle and
+#   marshal all take 5 to 7 ms to rebuild a 4,000 attribute configuration, so no encoding of it can load several times faster.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import hashlib
+import json
+import zlib
+
+# Set Format Identifiers
+FORMAT_NAME = 'PyMILab Schema Configuration'
+FORMAT_VERSION = 1
+MAGIC = b'PMLC'             # First bytes of a binary configuration file
+FORMATS = {'json':'.json', 'compact':'.json', 'binary':'.pmlc'}
+SECTIONS = ('Single Value', 'Functional', 'Tabular', 'Placement', 'Atts')
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the fingerprint of a set of Py MI Lab templates from the attribute names and types of a TemplateCatalog
+def template_fingerprint(Catalog):
+    h = hashlib.sha1()
+    for name, att_type in Catalog.types.items():
+        h.update(f'{name}\t{att_type}\n'.encode('utf-8'))
+    return h.hexdigest()[:16]
+
+# Pack Atts into columns
+# -- {'Single Value':[names, values], 'Functional':[names, variables, units], 'Tabular':[names, columns, units]}
+# -- Atts with any other entries are kept as they are
+def pack_atts(Atts):
+    for entry in Atts['Functional'].values():
+        if entry.keys() != {'Variables', 'Units'}:
+            return Atts
+    for entry in Atts['Tabular'].values():
+        if entry.keys() != {'Columns', 'Units'}:
+            return Atts
+    return {'Single Value':[list(Atts['Single Value'].keys()), list(Atts['Single Value'].values())],
+            'Functional':[list(Atts['Functional'].keys()),
+                          [entry['Variables'] for entry in Atts['Functional'].values()],
+                          [entry['Units'] for entry in Atts['Functional'].values()]],
+            'Tabular':[list(Atts['Tabular'].keys()),
+                       [entry['Columns'] for entry in Atts['Tabular'].values()],
+                       [entry['Units'] for entry in Atts['Tabular'].values()]]}
+
+# Unpack Atts from columns
+def unpack_atts(Packed):
+    if isinstance(Packed['Single Value'], dict):
+        return Packed
+    names, values = Packed['Single Value']
+    Atts = {'Single Value':dict(zip(names, values))}
+    names, variables, units = Packed['Functional']
+    Atts['Functional'] = {names[i]:{'Variables':variables[i], 'Units':units[i]} for i in range(len(names))}
+    names, columns, units = Packed['Tabular']
+    Atts['Tabular'] = {names[i]:{'Columns':columns[i], 'Units':units[i]} for i in range(len(names))}
+    return Atts
+
+# Encode a configuration in the compact layout
+# -- pack: pack Atts into columns (ConfigWriter packs and encodes them once per schema instead)
+def encode_compact(Config, template=None, pack=True):
+    Atts = Config['Atts']
+    Names = ['']
+    ids = {'':0}
+
+    # -- Intern a Py MI Lab attribute name (None is kept)
+    def ref(name):
+        if name == None:
+            return None
+        if name not in ids:
+            ids[name] = len(Names)
+            Names.append(name)
+        return ids[name]
+
+    Doc = {'Format':FORMAT_NAME,
+           'Version':FORMAT_VERSION,
+           'Template':template,
+           'Names':Names,
+           'Atts':pack_atts(Atts) if pack else Atts}
+
+    # -- Single Attributes
+    Single = Config.get('Single Value', {})
+    Doc['Single Value'] = [ref(Single.get(att, '')) for att in Atts['Single Value']]
+
+    # -- Functional Attributes
+    Functional = Config.get('Functional', {})
+    Doc['Functional'] = []
+    for att in Atts['Functional']:
+        mapping = Functional.get(att, {})
+        Doc['Functional'].append([ref(mapping.get('X', '')), ref(mapping.get('Y', ''))])
+
+    # -- Tabular Attributes (Granta MI columns only where they differ from Atts)
+    Tabular = Config.get('Tabular', {})
+    Doc['Tabular'] = []
+    Doc['Columns'] = {}
+    for att in Atts['Tabular']:
+        mapping = Tabular.get(att, {'GrantaCols':Atts['Tabular'][att]['Columns'], 'PyCols':[]})
+        Doc['Tabular'].append([ref(name) for name in mapping['PyCols']])
+        if list(mapping['GrantaCols']) != list(Atts['Tabular'][att]['Columns']):
+            Doc['Columns'][att] = mapping['GrantaCols']
+
+    # -- Record Placement (conditional and naming attributes)
+    if 'Placement' in Config:
+        Doc['Placement'] = {}
+        for level, rows in Config['Placement'].items():
+            Doc['Placement'][level] = []
+            for row in rows:
+                row = list(row)
+                if len(row) > 1:
+                    row[1] = ref(row[1])
+                if len(row) > 4 and row[4] != None:
+                    row[4] = [ref(name) for name in row[4]]
+                Doc['Placement'][level].append(row)
+
+    # -- Everything else (e.g. Fingerprints) is kept as is
+    Doc['Extra'] = {key:value for key, value in Config.items() if key not in SECTIONS}
+    return Doc
+
+# Decode a configuration from the compact layout
+def decode_compact(Doc):
+    if Doc.get('Version', 0) > FORMAT_VERSION:
+        raise ValueError(f"Configuration format version {Doc.get('Version')} is newer than this tool supports ({FORMAT_VERSION})")
+    Atts = unpack_atts(Doc['Atts'])
+
+    # -- References are looked up in a dictionary of the Names, so None (stored as is) stays None and a reference outside the
+    #    Names is rejected (a list index would wrap negative references around)
+    lookup = dict(enumerate(Doc['Names']))
+    lookup[None] = None
+
+    # -- Resolve several lists of references at once
+    def resolve(lists):
+        try:
+            return [list(map(lookup.__getitem__, refs)) for refs in lists]
+        except KeyError as e:
+            raise ValueError(f'Corrupt configuration: name reference {e.args[0]!r} is not in Names')
+        except TypeError:
+            raise ValueError('Corrupt configuration: name references must be integers')
+
+    def name(ref):
+        return resolve([[ref]])[0][0]
+
+    Config = {}
+
+    # -- Single Attributes
+    Config['Single Value'] = dict(zip(Atts['Single Value'], resolve([Doc['Single Value']])[0]))
+
+    # -- Functional Attributes (the [x id, y id] pairs are resolved as a column of X and a column of Y references)
+    columns = list(zip(*Doc['Functional'])) or [[], []]
+    if len(columns) != 2:
+        raise ValueError('Corrupt configuration: functional mappings must be [x id, y id] pairs')
+    xs, ys = resolve(columns)
+    Config['Functional'] = {att:{'X':x, 'Y':y} for att, x, y in zip(Atts['Functional'], xs, ys)}
+
+    # -- Tabular Attributes
+    Config['Tabular'] = {}
+    Columns = Doc.get('Columns', {})
+    for (att, entry), PyCols in zip(Atts['Tabular'].items(), resolve(Doc['Tabular'])):
+        Config['Tabular'][att] = {'GrantaCols':list(Columns.get(att, entry['Columns'])),
+                                  'PyCols':PyCols}
+
+    Config['Atts'] = Atts
+
+    # -- Record Placement
+    if 'Placement' in Doc:
+        Config['Placement'] = {}
+        for level, rows in Doc['Placement'].items():
+            Config['Placement'][level] = []
+            for row in rows:
+                row = list(row)
+                if len(row) > 1:
+                    row[1] = name(row[1])
+                if len(row) > 4 and row[4] != None:
+                    row[4] = resolve([row[4]])[0]
+                Config['Placement'][level].append(row)
+
+    Config.update(Doc.get('Extra', {}))
+    return Config
+
+# Check if a decoded JSON document is in the compact layout
+def is_compact(Doc):
+    return isinstance(Doc, dict) and Doc.get('Format') == FORMAT_NAME
+
+# Read a configuration file in any format
+# -- Returns the configuration and the fingerprint of the template it was made against (None for legacy files)
+def read_config(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if data[:len(MAGIC)] == MAGIC:
+        if len(data) <= len(MAGIC):
+            raise ValueError('Corrupt binary configuration')
+        version = data[len(MAGIC)]
+        if version > FORMAT_VERSION:
+            raise ValueError(f'Configuration format version {version} is newer than this tool supports ({FORMAT_VERSION})')
+        try:
+            Doc = json.loads(zlib.decompress(data[len(MAGIC)+1:]))
+        except zlib.error as e:
+            raise ValueError(f'Corrupt binary configuration: {e}')
+    else:
+        Doc = json.loads(data)
+    if is_compact(Doc):
+        return decode_compact(Doc), Doc.get('Template')
+    return Doc, None
+
+#==================================================================================================================================================================
+# CONFIGURATION WRITER
+# Encodes configurations for download, reusing the encoded Atts between reruns since they only change when a schema is loaded
+
+class ConfigWriter:
+    def __init__(self, template=None):
+        self.template = template
+        self._atts = None
+        self._atts_json = {}
+        self._binary = (None, None)
+
+    # Get the encoded Atts, re-encoding only when a different Atts dictionary is written
+    def atts_json(self, Atts, packed=False):
+        if Atts is not self._atts:
+            self._atts = Atts
+            self._atts_json = {}
+        if packed not in self._atts_json:
+            self._atts_json[packed] = json.dumps(pack_atts(Atts) if packed else Atts, separators=(',', ':'))
+        return self._atts_json[packed]
+
+    # Encode a dictionary as compact JSON with its 'Atts' value taken from the cache
+    def _dumps(self, Doc, packed=False):
+        parts = []
+        for key, value in Doc.items():
+            text = self.atts_json(value, packed) if key == 'Atts' else json.dumps(value, separators=(',', ':'))
+            parts.append(json.dumps(key) + ':' + text)
+        return '{' + ','.join(parts) + '}'
+
+    # Encode a configuration
+    # -- fmt: 'json' (legacy layout), 'compact' or 'binary'
+    def dumps(self, Config, fmt='json'):
+        if fmt == 'json':
+            return self._dumps(Config).encode('utf-8')
+        text = self._dumps(encode_compact(Config, self.template, pack=False), packed=True).encode('utf-8')
+        if fmt == 'compact':
+            return text
+        if fmt == 'binary':
+            # -- Only compress again when the configuration changed
+            if text != self._binary[0]:
+                self._binary = (text, MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(text, 6))
+            return self._binary[1]
+        raise ValueError(f"Unknown configuration format '{fmt}', expected one of {', '.join(FORMATS)}")
@@ -0,0 +1,257 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Configuration Journal
+#
+#   PURPOSE: Save every edit of the configuration in progress to the server disk as it is made, so a session that drops can be
+#            restored, and serialize the configuration for download only when it changed
+#
+#   Each session has a journal made of two files in JOURNAL_DIR:
+#       <session>.base.json     snapshot of the whole configuration at some version
+#       <session>.journal       one JSON line per rerun that changed the configuration, appended after the snapshot:
+#                               {'v':version, 't':time, 'ops':[[section, key, value], [section, key], ...]}
+#   An op with a value sets Config[section][key] (the whole section when key is None) and an op without one removes it. Single
+#   value, functional, tabular and decimation entries are compared one attribute at a time against a copy of what was last
+#   written, so an edit only writes the entries it changed; record placement and any other key are written whole when changed.
+#
+#   After COMPACT_LINES lines (or when Atts changes) the snapshot is rewritten and the journal emptied. A session is restored by
+#   reading the snapshot and replaying the journal lines with a later version; a line cut off by a crash is ignored.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+
+# Set Journal Defaults
+# -- The journal directory can be moved with the SCHEMA_JOURNAL_DIR environment variable
+JOURNAL_DIR = os.environ.get('SCHEMA_JOURNAL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'schemaconfiguration', 'journal'))
+COMPACT_LINES = 100                 # Journal lines written before the snapshot is rewritten
+MAX_AGE = 7*24*3600                 # Seconds after the last edit before a journal is removed
+ENTRY_SECTIONS = ('Single Value', 'Functional', 'Tabular', 'Decimation')
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+logger = logging.getLogger(__name__)
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Check that a session ID is safe to use in a file name
+def valid_session(session_id):
+    return isinstance(session_id, str) and _SESSION_ID.match(session_id) != None
+
+# Get the snapshot and journal paths of a session
+def journal_paths(session_id, journal_dir=None):
+    if not valid_session(session_id):
+        raise ValueError(f"Invalid session ID '{session_id}'")
+    journal_dir = journal_dir if journal_dir != None else JOURNAL_DIR
+    return (os.path.join(journal_dir, session_id + '.base.json'),
+            os.path.join(journal_dir, session_id + '.journal'))
+
+# Apply journal ops to a configuration
+def apply_ops(Config, ops):
+    for op in ops:
+        section, key = op[0], op[1]
+        if len(op) > 2:
+            if key == None:
+                Config[section] = op[2]
+            else:
+                Config.setdefault(section, {})[key] = op[2]
+        elif key == None:
+            Config.pop(section, None)
+        elif isinstance(Config.get(section), dict):
+            Config[section].pop(key, None)
+    return Config
+
+# Restore the configuration of a session from its journal
+# -- Returns (Config, {'version', 'saved', 'lines'}) or (None, None) when the session has no journal
+def restore_config(session_id, journal_dir=None):
+    if not valid_session(session_id):
+        return None, None
+    base_path, journal_path = journal_paths(session_id, journal_dir)
+    try:
+        with open(base_path, encoding='utf-8') as f:
+            Base = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError):
+        logger.warning('Ignoring unreadable configuration snapshot of session %s', session_id)
+        return None, None
+
+    # Replay the edits made after the snapshot
+    Config = Base['Config']
+    Info = {'version':Base['v'], 'saved':Base['t'], 'lines':0}
+    try:
+        with open(journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    Entry = json.loads(line)
+                except ValueError:
+                    # -- Line cut off by a crash, nothing after it was written
+                    logger.warning('Journal of session %s ends with an incomplete line', session_id)
+                    break
+                if Entry['v'] <= Info['version']:
+                    continue
+                apply_ops(Config, Entry['ops'])
+                Info['version'] = Entry['v']
+                Info['saved'] = Entry['t']
+                Info['lines'] = Info['lines'] + 1
+    except FileNotFoundError:
+        pass
+    return Config, Info
+
+# Get when the configuration of a session was last saved
+# -- Returns None when the session has no journal
+def journal_saved(session_id, journal_dir=None):
+    if not valid_session(session_id):
+        return None
+    times = []
+    for path in journal_paths(session_id, journal_dir):
+        try:
+            times.append(os.path.getmtime(path))
+        except OSError:
+            pass
+    return max(times) if len(times) > 0 else None
+
+# Remove the journals of sessions not edited for max_age seconds
+# -- Returns the number of files removed
+def cleanup_journals(journal_dir=None, max_age=MAX_AGE):
+    journal_dir = journal_dir if journal_dir != None else JOURNAL_DIR
+    removed = 0
+    if not os.path.isdir(journal_dir):
+        return removed
+    cutoff = time.time() - max_age
+    for name in os.listdir(journal_dir):
+        if not (name.endswith('.base.json') or name.endswith('.journal')):
+            continue
+        path = os.path.join(journal_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed = removed + 1
+        except OSError:
+            pass
+    return removed
+
+#==================================================================================================================================================================
+# CONFIGURATION JOURNAL
+
+class ConfigJournal:
+    # -- session_id: ID of the session to journal (a new one is made when None)
+    def __init__(self, session_id=None, journal_dir=None):
+        self.session_id = session_id if session_id != None else secrets.token_urlsafe(12)
+        self.journal_dir = journal_dir if journal_dir != None else JOURNAL_DIR
+        self.base_path, self.journal_path = journal_paths(self.session_id, self.journal_dir)
+        self.version = 0
+        self.lines = 0
+        self.compactions = 0
+        self._shadow = {}
+        self._atts = None
+        self._dumps = {}
+        self._lock = threading.Lock()
+
+    # Start the journal from a configuration (a new or restored one)
+    def start(self, Config, version=0):
+        self.version = version
+        self.compact(Config)
+        return self
+
+    # Record the changes made to the configuration since the last call
+    # -- Returns the number of entries changed
+    def sync(self, Config):
+        with self._lock:
+            if Config.get('Atts') is not self._atts:
+                # -- A different schema: the whole configuration is rewritten
+                self._compact(Config)
+                return len(Config)
+            ops = self.diff(Config)
+            if len(ops) == 0:
+                return 0
+            self.version = self.version + 1
+            text = json.dumps({'v':self.version, 't':time.time(), 'ops':ops}, separators=(',', ':'))
+
+            # -- The shadow is updated from the encoded ops, so it holds copies the app cannot edit in place
+            apply_ops(self._shadow, json.loads(text)['ops'])
+            try:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write(text + '\n')
+            except OSError:
+                logger.warning('Unable to write the configuration journal of session %s', self.session_id)
+            self.lines = self.lines + 1
+            if self.lines >= COMPACT_LINES:
+                self._compact(Config)
+            return len(ops)
+
+    # Get the ops that turn the last written configuration into this one
+    def diff(self, Config):
+        ops = []
+        for section, value in Config.items():
+            if section == 'Atts':
+                continue
+            old = self._shadow.get(section)
+            if section in ENTRY_SECTIONS and isinstance(value, dict) and isinstance(old, dict):
+                for key, entry in value.items():
+                    if key not in old or old[key] != entry:
+                        ops.append([section, key, entry])
+                for key in old.keys() - value.keys():
+                    ops.append([section, key])
+            elif section not in self._shadow or old != value:
+                ops.append([section, None, value])
+        for section in self._shadow.keys() - Config.keys():
+            ops.append([section, None])
+        return ops
+
+    # Rewrite the snapshot and empty the journal
+    def compact(self, Config):
+        with self._lock:
+            self._compact(Config)
+
+    def _compact(self, Config):
+        self.version = self.version + 1
+        text = json.dumps({'v':self.version, 't':time.time(), 'Config':Config}, separators=(',', ':'))
+        try:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            tmp = self.base_path + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, self.base_path)
+
+            # -- Lines older than the snapshot are skipped on restore, so a crash before the journal is emptied is harmless
+            open(self.journal_path, 'w').close()
+        except OSError:
+            logger.warning('Unable to write the configuration snapshot of session %s', self.session_id)
+        self._shadow = {section:value for section, value in json.loads(text)['Config'].items() if section != 'Atts'}
+        self._atts = Config.get('Atts')
+        self.lines = 0
+        self.compactions = self.compactions + 1
+
+    # Encode the configuration for download
+    # -- Only encoded again when the journal recorded a change since the last call (call after sync)
+    def dumps(self, Config, Writer, fmt='json'):
+        key = (self.version, fmt, Writer.template)
+        if key not in self._dumps:
+            self._dumps = {k:v for k, v in self._dumps.items() if k[0] == self.version}
+            self._dumps[key] = Writer.dumps(Config, fmt)
+        return self._dumps[key]
+
+    # Remove the journal files of the session
+    def discard(self):
+        for path in (self.base_path, self.journal_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # Get the journal counters
+    def stats(self):
+        try:
+            size = os.path.getsize(self.journal_path)
+        except OSError:
+            size = 0
+        return {'version':self.version, 'lines':self.lines, 'journal_bytes':size, 'compactions':self.compactions}
@@ -0,0 +1,326 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Configuration Validator
+#
+#   PURPOSE: Check a configuration against a set of Py MI Lab templates (and optionally its Granta MI Schema) before it is used
+#
+#   Every mapping of the configuration is collected in one pass and each distinct Py MI Lab attribute is checked once against the
+#   template catalog, so a configuration is validated in time proportional to its size rather than its size times the number of
+#   template attributes. The checks are:
+#       structure       the Single Value, Functional, Tabular and Atts sections exist and match each other
+#       mappings        every mapped Py MI Lab attribute exists in the templates and has a type allowed in its section
+#       placement       record placement levels are numbered in order and every row is well formed
+#       decimation      every functional curve decimation setting names a functional attribute and a known method
+#       schema          Atts matches the attributes read from the schema workbook, when one is given
+#
+#   Issues are dictionaries so they can be written to a machine-readable report:
+#       {'severity':'error'/'warning', 'code':..., 'section':..., 'attribute':..., 'field':..., 'value':..., 'message':...}
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+from CurveDecimation import check_settings
+from PlacementEngine import NOT_EQUAL, PLACEHOLDER
+from SchemaConfig import init_config
+from SchemaUpdate import count_changes, diff_atts, format_diff
+
+# Set Issue Severities
+ERROR = 'error'
+WARNING = 'warning'
+
+SECTIONS = ('Single Value', 'Functional', 'Tabular')
+PLACEMENT_ROW = 6           # [IF, attribute, '='/'≠', value, naming attributes, format]
+STRUCTURE_CODES = ('missing-section', 'missing-mapping', 'malformed-mapping', 'column-mismatch', 'unknown-schema-attribute')
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Create an issue
+def issue(severity, code, message, section=None, attribute=None, field=None, value=None):
+    return {'severity':severity, 'code':code, 'section':section, 'attribute':attribute, 'field':field, 'value':value,
+            'message':message}
+
+# Collect every Py MI Lab mapping of a configuration
+# -- Returns a list of (section, attribute, field, name) with field None for single values, 'X'/'Y' for functional attributes and
+#    the Granta MI column for tabular attributes
+def collect_mappings(Config):
+    mappings = []
+
+    # -- Single Attributes
+    for att, name in Config.get('Single Value', {}).items():
+        mappings.append(('Single Value', att, None, name))
+
+    # -- Functional Attributes
+    for att, mapping in Config.get('Functional', {}).items():
+        if isinstance(mapping, dict):
+            mappings.append(('Functional', att, 'X', mapping.get('X')))
+            mappings.append(('Functional', att, 'Y', mapping.get('Y')))
+
+    # -- Tabular Attributes
+    for att, mapping in Config.get('Tabular', {}).items():
+        if isinstance(mapping, dict):
+            for col, name in zip(mapping.get('GrantaCols', []), mapping.get('PyCols', [])):
+                mappings.append(('Tabular', att, col, name))
+
+    return mappings
+
+# Get the catalog view of the Py MI Lab attributes allowed in a section
+def section_view(Catalog, section):
+    if section == 'Single Value':
+        return Catalog.single
+    if section == 'Functional':
+        return Catalog.functional
+    return Catalog.tabular
+
+#==================================================================================================================================================================
+# CHECKS
+
+# Check that the configuration sections exist and match Atts
+def check_structure(Config):
+    issues = []
+    for section in SECTIONS + ('Atts',):
+        if not isinstance(Config.get(section), dict):
+            issues.append(issue(ERROR, 'missing-section', f"Configuration has no '{section}' section", section))
+    if len(issues) > 0:
+        return issues
+
+    Atts = Config['Atts']
+    for section in SECTIONS:
+        if not isinstance(Atts.get(section), dict):
+            issues.append(issue(ERROR, 'missing-section', f"Atts has no '{section}' section", section))
+            continue
+        mapped = Config[section].keys()
+        schema = Atts[section].keys()
+        for att in schema - mapped:
+            issues.append(issue(ERROR, 'missing-mapping', f"'{att}' is in Atts but has no {section} mapping", section, att))
+        for att in mapped - schema:
+            issues.append(issue(ERROR, 'unknown-schema-attribute', f"'{att}' is mapped but is not a {section} attribute in Atts", section, att))
+
+    # -- Functional mappings have an X and Y
+    for att, mapping in Config['Functional'].items():
+        if not isinstance(mapping, dict) or 'X' not in mapping or 'Y' not in mapping:
+            issues.append(issue(ERROR, 'malformed-mapping', f"Functional mapping of '{att}' needs an X and a Y", 'Functional', att))
+
+    # -- Tabular mappings have one Py MI Lab attribute per Granta MI column, matching the columns in Atts
+    for att, mapping in Config['Tabular'].items():
+        if not isinstance(mapping, dict) or 'GrantaCols' not in mapping or 'PyCols' not in mapping:
+            issues.append(issue(ERROR, 'malformed-mapping', f"Tabular mapping of '{att}' needs GrantaCols and PyCols", 'Tabular', att))
+            continue
+        if len(mapping['GrantaCols']) != len(mapping['PyCols']):
+            issues.append(issue(ERROR, 'malformed-mapping', f"Tabular mapping of '{att}' has {len(mapping['GrantaCols'])} columns but " +
+                                f"{len(mapping['PyCols'])} Py MI Lab attributes", 'Tabular', att))
+        if isinstance(Atts.get('Tabular'), dict) and att in Atts['Tabular']:
+            if list(mapping['GrantaCols']) != list(Atts['Tabular'][att].get('Columns', [])):
+                issues.append(issue(ERROR, 'column-mismatch', f"Tabular mapping columns of '{att}' do not match the columns in Atts", 'Tabular', att))
+    return issues
+
+# Check that every mapped Py MI Lab attribute exists and has a type allowed in its section
+# -- Each distinct attribute is looked up once per section
+def check_mappings(Config, Catalog):
+    issues = []
+    mappings = collect_mappings(Config)
+
+    # Classify the distinct names of each section
+    status = {}
+    for section in SECTIONS:
+        view = section_view(Catalog, section)
+        names = {name for sec, att, field, name in mappings if sec == section and isinstance(name, str) and name != ''}
+        for name in names:
+            if name not in Catalog.types:
+                status[(section, name)] = 'unknown-attribute'
+            elif name not in view:
+                status[(section, name)] = 'incompatible-type'
+
+    # Report every location of the bad names
+    for section, att, field, name in mappings:
+        if isinstance(name, str) or name == None:
+            code = status.get((section, name))
+        else:
+            code = 'unknown-attribute'
+        if code == None:
+            continue
+        where = f"'{att}'" if field == None else f"'{att}' ({field})"
+        if code == 'unknown-attribute':
+            message = f"{where} is mapped to '{name}', which is not in the Py MI Lab templates"
+        else:
+            message = f"{where} is mapped to '{name}' of type '{Catalog.type_of(name)}', which is not allowed for {section} attributes"
+        issues.append(issue(ERROR, code, message, section, att, field, name))
+    return issues
+
+# Check the record placement rules
+def check_placement(Config, Catalog):
+    issues = []
+    Placement = Config.get('Placement')
+    if Placement == None:
+        return issues
+    if not isinstance(Placement, dict):
+        return [issue(ERROR, 'malformed-placement', 'Placement must map level names to lists of rows', 'Placement')]
+
+    # Levels are named 'Level 1', 'Level 2', ... in order
+    expected = [f'Level {m+1}' for m in range(len(Placement))]
+    if set(Placement.keys()) != set(expected):
+        issues.append(issue(ERROR, 'level-names', f"Placement levels must be named {', '.join(expected)}", 'Placement', value=list(Placement.keys())))
+
+    for level, rows in Placement.items():
+        if not isinstance(rows, list) or len(rows) == 0:
+            issues.append(issue(ERROR, 'malformed-placement', f'{level} has no rows', 'Placement', level))
+            continue
+        conditional = len(rows) > 1
+        for n in range(len(rows)):
+            row = rows[n]
+            where = f'{level} row {n+1}'
+            if not isinstance(row, list) or len(row) != PLACEMENT_ROW:
+                issues.append(issue(ERROR, 'malformed-placement', f'{where} must have {PLACEMENT_ROW} entries', 'Placement', level, n, row))
+                continue
+
+            # -- Conditional attribute (checked on every row, a single row level keeps it until a second row is added)
+            if row[1] not in (None, ''):
+                if row[1] not in Catalog.types:
+                    issues.append(issue(ERROR, 'unknown-attribute', f"{where} conditional attribute '{row[1]}' is not in the Py MI Lab templates",
+                                        'Placement', level, n, row[1]))
+                elif row[1] not in Catalog.single:
+                    issues.append(issue(ERROR, 'incompatible-type', f"{where} conditional attribute '{row[1]}' is not a single value attribute",
+                                        'Placement', level, n, row[1]))
+
+            # -- Condition (only used when the level has more than one row)
+            if conditional and row[1] not in (None, ''):
+                if row[2] not in ('=', NOT_EQUAL):
+                    issues.append(issue(ERROR, 'malformed-placement', f"{where} comparison must be '=' or '{NOT_EQUAL}'", 'Placement', level, n, row[2]))
+                if row[3] in (None, ''):
+                    issues.append(issue(WARNING, 'empty-condition', f'{where} has no conditional value', 'Placement', level, n))
+
+            # -- Naming attributes and format
+            naming = row[4] if row[4] != None else []
+            if not isinstance(naming, list):
+                issues.append(issue(ERROR, 'malformed-placement', f'{where} naming attributes must be a list', 'Placement', level, n, naming))
+                continue
+            if len(naming) == 0:
+                issues.append(issue(WARNING, 'no-naming-attribute', f'{where} has no naming attribute, records matching it are not placed in a folder',
+                                    'Placement', level, n))
+            for name in naming:
+                if name not in Catalog.types:
+                    issues.append(issue(ERROR, 'unknown-attribute', f"{where} naming attribute '{name}' is not in the Py MI Lab templates",
+                                        'Placement', level, n, name))
+                elif name not in Catalog.single:
+                    issues.append(issue(ERROR, 'incompatible-type', f"{where} naming attribute '{name}' is not a single value attribute",
+                                        'Placement', level, n, name))
+            if row[5] not in (None, '') and PLACEHOLDER not in row[5]:
+                issues.append(issue(WARNING, 'constant-format', f"{where} format '{row[5]}' has no {PLACEHOLDER}, every record gets the same folder name",
+                                    'Placement', level, n, row[5]))
+    return issues
+
+# Check the decimation settings of the functional attributes
+def check_decimation(Config):
+    issues = []
+    Decimation = Config.get('Decimation', {})
+    if not isinstance(Decimation, dict):
+        return [issue(ERROR, 'malformed-decimation', 'Decimation must map functional attributes to their settings', 'Decimation')]
+    for att, Settings in Decimation.items():
+        if att not in Config['Functional']:
+            issues.append(issue(WARNING, 'unknown-schema-attribute', f"'{att}' has decimation settings but is not a Functional attribute",
+                                'Decimation', att))
+        for problem in check_settings(Settings):
+            issues.append(issue(ERROR, 'malformed-decimation', f"Decimation of '{att}': {problem}", 'Decimation', att, value=Settings))
+    return issues
+
+# Check that Atts matches the attributes read from the schema workbook
+def check_schema(Config, Schema_Atts):
+    Diff = diff_atts(Config['Atts'], Schema_Atts)
+    if count_changes(Diff) == 0:
+        return []
+    return [issue(WARNING, 'schema-mismatch', f'Atts differs from the schema workbook: {line}', 'Atts') for line in format_diff(Diff)]
+
+#==================================================================================================================================================================
+# VALIDATION
+
+# Validate a configuration
+# -- Catalog: TemplateCatalog of the template version to check against
+# -- Schema_Atts: attributes read from the schema workbook (optional)
+# -- Returns the list of issues, errors first
+def validate_config(Config, Catalog, Schema_Atts=None):
+    if not isinstance(Config, dict):
+        return [issue(ERROR, 'malformed-config', 'Configuration must be a JSON object')]
+    issues = check_structure(Config)
+    if any(item['code'] == 'missing-section' for item in issues):
+        # -- The mappings cannot be checked without the sections
+        return issues
+    issues.extend(check_mappings(Config, Catalog))
+    issues.extend(check_placement(Config, Catalog))
+    issues.extend(check_decimation(Config))
+    if Schema_Atts != None and isinstance(Config.get('Atts'), dict):
+        issues.extend(check_schema(Config, Schema_Atts))
+    issues.sort(key=lambda item: item['severity'] != ERROR)
+    return issues
+
+# Count the issues of each severity
+def count_issues(issues):
+    return {ERROR:sum(1 for item in issues if item['severity'] == ERROR),
+            WARNING:sum(1 for item in issues if item['severity'] == WARNING)}
+
+# Clear the mappings reported as unknown or incompatible so the configuration can be loaded
+# -- Returns the number of mappings cleared
+def clear_invalid(Config, issues):
+    cleared = 0
+    for item in issues:
+        if item['code'] not in ('unknown-attribute', 'incompatible-type'):
+            continue
+        section, att, field = item['section'], item['attribute'], item['field']
+        if section == 'Single Value':
+            Config[section][att] = ''
+        elif section == 'Functional':
+            Config[section][att][field] = ''
+        elif section == 'Tabular':
+            mapping = Config[section][att]
+            for j in range(len(mapping['GrantaCols'])):
+                if mapping['GrantaCols'][j] == field and mapping['PyCols'][j] == item['value']:
+                    mapping['PyCols'][j] = ''
+        elif section == 'Placement':
+            row = Config[section][att][field]
+            if row[1] == item['value']:
+                row[1] = None
+            if isinstance(row[4], list) and item['value'] in row[4]:
+                row[4] = [name for name in row[4] if name != item['value']]
+        cleared = cleared + 1
+    return cleared
+
+# Repair the sections and mappings reported as missing or malformed from Atts, as apply_config does for a new schema
+# -- Missing sections and mappings are re-initialised, the X or Y of a functional mapping and the Py MI Lab attribute of each
+#    tabular column that still exists are kept, and mappings of attributes that are not in Atts are removed
+# -- Call after clear_invalid, with the same issues
+# -- Returns the number of entries repaired, or None when Atts is missing or malformed and the configuration cannot be repaired
+def repair_structure(Config, issues):
+    Atts = Config.get('Atts') if isinstance(Config, dict) else None
+    if not isinstance(Atts, dict) or any(not isinstance(Atts.get(section), dict) for section in SECTIONS):
+        return None
+    for section in ('Functional', 'Tabular'):
+        if any(not isinstance(entry, dict) for entry in Atts[section].values()):
+            return None
+    Empty = init_config(Atts)
+
+    repaired = set()
+    for item in issues:
+        code, section, att = item['code'], item['section'], item['attribute']
+        if code not in STRUCTURE_CODES or section not in SECTIONS or (section, att) in repaired:
+            continue
+        if code == 'missing-section':
+            Config[section] = Empty[section]
+        elif code == 'unknown-schema-attribute' or att not in Empty[section]:
+            Config[section].pop(att, None)
+        elif code == 'missing-mapping' or section == 'Single Value':
+            Config[section][att] = Empty[section][att]
+        elif section == 'Functional':
+            mapping = Config[section][att]
+            Entry = Empty[section][att]
+            if isinstance(mapping, dict):
+                Entry.update({field:mapping[field] for field in ('X', 'Y') if field in mapping})
+            Config[section][att] = Entry
+        else:
+            mapping = Config[section][att]
+            Entry = Empty[section][att]
+            if isinstance(mapping, dict) and isinstance(mapping.get('GrantaCols'), list) and isinstance(mapping.get('PyCols'), list):
+                prev_cols = dict(zip(mapping['GrantaCols'], mapping['PyCols']))
+                Entry['PyCols'] = [prev_cols.get(col, '') for col in Entry['GrantaCols']]
+            Config[section][att] = Entry
+        repaired.add((section, att))
+    return len(repaired)
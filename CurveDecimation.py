@@ -0,0 +1,239 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Curve Decimation
+#
+#   PURPOSE: Reduce long functional curves (X and Y point arrays) to the number of points Granta MI needs before they are
+#            written to an import workbook, keeping the shape of the curve
+#
+#   Decimation is set per functional attribute in the configuration:
+#       Config['Decimation'][att] = {'Method':'lttb'/'minmax'/'tolerance', 'Points':target number of points, 'Tolerance':Y units}
+#   Attributes without settings are written with every point. The methods are:
+#       lttb        Largest-Triangle-Three-Buckets: one point per bucket, the one making the largest triangle with the point kept
+#                   in the previous bucket and the mean of the next bucket. Follows the visual shape of the curve.
+#       minmax      The lowest and highest Y of each bucket. Keeps every peak and valley, e.g. the extremes of cyclic data.
+#       tolerance   Ramer-Douglas-Peucker: the fewest points for which no removed point is further than Tolerance (in Y) from
+#                   the line between the points kept around it. Points is an optional upper limit.
+#   The first and last points are always kept, and point pairs where X or Y is not a finite number are dropped.
+#
+#   Every method works on whole arrays with NumPy. The buckets are laid out as one padded matrix, and the steps that depend on
+#   earlier choices (the previous point of LTTB, the segments of Ramer-Douglas-Peucker) are repeated over the whole matrix or
+#   curve until nothing changes, which gives the same points as the point by point algorithms.
+#
+#   Usage (throughput benchmark):
+#       python CurveDecimation.py [--lengths 10000 100000 1000000] [--points 1000] [--tolerance 2] [--repeat 3]
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import argparse
+import sys
+
+import numpy as np
+
+from BenchmarkTiming import time_call
+
+# Set the Decimation Methods
+METHODS = ('lttb', 'minmax', 'tolerance')
+METHOD_LABELS = {'':'None', 'lttb':'Largest triangle (LTTB)', 'minmax':'Min/max per bucket', 'tolerance':'Tolerance (RDP)'}
+DEFAULT_POINTS = 1000       # Target number of points when the settings do not give one
+MIN_POINTS = 3              # Fewest points a curve can be reduced to (first, last and one in between)
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Check the decimation settings of an attribute
+# -- Returns a list of problems (empty when the settings can be used)
+def check_settings(Settings):
+    if not isinstance(Settings, dict):
+        return ['settings must be a dictionary with a Method']
+    problems = []
+    method = Settings.get('Method')
+    if method not in METHODS:
+        problems.append(f"method '{method}' must be one of {', '.join(METHODS)}")
+    points = Settings.get('Points')
+    if points != None and (isinstance(points, bool) or not isinstance(points, int) or points < MIN_POINTS):
+        problems.append(f'points must be a whole number of at least {MIN_POINTS}')
+    tolerance = Settings.get('Tolerance')
+    if method == 'tolerance':
+        if isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)) or tolerance < 0:
+            problems.append('the tolerance method needs a Tolerance of 0 or more')
+    return problems
+
+# Lay out the points between the first and last point in buckets
+# -- Returns the (buckets x width) matrix of point indices, with padding cells repeating the first index of their bucket, the
+#    mask of real cells, and the first and end index of each bucket
+def bucket_matrix(length, num_buckets):
+    edges = (np.arange(num_buckets + 1)*((length - 2)/num_buckets)).astype(np.int64) + 1
+    starts = edges[:-1]
+    ends = edges[1:]
+    width = int((ends - starts).max())
+    index = starts[:, None] + np.arange(width)[None, :]
+    valid = index < ends[:, None]
+    index = np.where(valid, index, starts[:, None])
+    return index, valid, starts, ends
+
+# Get the indices of the points kept by Largest-Triangle-Three-Buckets
+def lttb_indices(x, y, points):
+    length = len(x)
+    if points >= length or length <= 2:
+        return np.arange(length)
+    num_buckets = max(points, MIN_POINTS) - 2
+    index, valid, starts, ends = bucket_matrix(length, num_buckets)
+    bx = x[index]
+    by = y[index]
+
+    # -- Mean of each bucket, the last bucket is followed by the last point
+    sums_x = np.concatenate(([0.0], np.cumsum(x)))
+    sums_y = np.concatenate(([0.0], np.cumsum(y)))
+    mean_x = (sums_x[ends] - sums_x[starts])/(ends - starts)
+    mean_y = (sums_y[ends] - sums_y[starts])/(ends - starts)
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    # Pick the point of each bucket with the largest triangle against its anchor (the point kept in the previous bucket)
+    def pick(rows, anchor_x, anchor_y):
+        area = np.abs((anchor_x[:, None] - next_x[rows, None])*(by[rows] - anchor_y[:, None]) -
+                      (anchor_x[:, None] - bx[rows])*(next_y[rows, None] - anchor_y[:, None]))
+        area[~valid[rows]] = -1.0
+        return index[rows, np.argmax(area, axis=1)]
+
+    # -- First guess: the mean of the previous bucket stands in for the point kept there
+    rows = np.arange(num_buckets)
+    kept = pick(rows, np.append(x[0], mean_x[:-1]), np.append(y[0], mean_y[:-1]))
+
+    # -- Repeat for the buckets whose anchor changed until no choice changes; bucket k is final after k passes at the most
+    while len(rows) > 0:
+        anchors = np.append(0, kept[:-1])[rows]
+        chosen = pick(rows, x[anchors], y[anchors])
+        changed = rows[chosen != kept[rows]]
+        kept[rows] = chosen
+        rows = changed[changed + 1 < num_buckets] + 1
+    return np.concatenate(([0], kept, [length - 1]))
+
+# Get the indices of the lowest and highest point of each bucket
+def minmax_indices(y, points):
+    length = len(y)
+    if points >= length or length <= 2:
+        return np.arange(length)
+    num_buckets = max((points - 2)//2, 1)
+    index, valid, starts, ends = bucket_matrix(length, num_buckets)
+    by = y[index]
+    low = index[np.arange(num_buckets), np.argmin(np.where(valid, by, np.inf), axis=1)]
+    high = index[np.arange(num_buckets), np.argmax(np.where(valid, by, -np.inf), axis=1)]
+    return np.unique(np.concatenate(([0], low, high, [length - 1])))
+
+# Get the indices of the points kept by Ramer-Douglas-Peucker with a Y tolerance
+# -- Every segment further than the tolerance from a point between its ends is split at that point in the same pass, and only the
+#    points of the segments split in a pass are looked at again
+# -- points: upper limit on the number of points kept (the furthest points are kept first when the limit is reached)
+def tolerance_indices(x, y, tolerance, points=None):
+    length = len(x)
+    if length <= 2:
+        return np.arange(length)
+    kept = np.array([0, length - 1])
+    active = np.arange(length)
+    while len(active) > 0 and (points == None or len(kept) < points):
+        # -- Segment of each point and its distance in Y from the line between the ends of the segment
+        segment = np.minimum(np.searchsorted(kept, active, side='right') - 1, len(kept) - 2)
+        x0 = x[kept[segment]]
+        y0 = y[kept[segment]]
+        dx = x[kept[segment + 1]] - x0
+        slope = np.divide(y[kept[segment + 1]] - y0, dx, out=np.zeros(len(active)), where=dx != 0)
+        distance = np.abs(y[active] - y0 - slope*(x[active] - x0))
+        distance[active == kept[segment]] = 0.0
+
+        # -- Split every segment whose furthest point is beyond the tolerance at that point
+        starts = np.flatnonzero(np.diff(segment, prepend=-1))
+        furthest = np.maximum.reduceat(distance, starts)
+        split = furthest > tolerance
+        if not split.any():
+            break
+        group = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(active)))
+        mask = split[group] & (distance == furthest[group])
+        first = np.unique(group[mask], return_index=True)[1]
+        new = active[mask][first]
+        if points != None and len(kept) + len(new) > points:
+            new = new[np.argsort(-distance[mask][first], kind='stable')[:points - len(kept)]]
+        kept = np.union1d(kept, new)
+        active = active[split[group]]
+    return kept
+
+# Decimate a functional curve
+# -- Settings: decimation settings of the attribute (see check_settings), None keeps every point
+# -- Returns the X and Y values kept; values that are not numeric arrays are returned as they are
+def decimate(x, y, Settings):
+    if Settings == None or x is None or y is None:
+        return x, y
+    try:
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+    except (TypeError, ValueError):
+        return x, y
+
+    # -- Pair up the points and drop the pairs that are not finite
+    length = min(len(x), len(y))
+    x = x[:length]
+    y = y[:length]
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x = x[finite]
+        y = y[finite]
+
+    method = Settings.get('Method')
+    points = Settings.get('Points')
+    if method == 'lttb':
+        index = lttb_indices(x, y, points if points != None else DEFAULT_POINTS)
+    elif method == 'minmax':
+        index = minmax_indices(y, points if points != None else DEFAULT_POINTS)
+    elif method == 'tolerance':
+        index = tolerance_indices(x, y, float(Settings.get('Tolerance', 0.0)), points)
+    else:
+        raise ValueError(f"Unknown decimation method '{method}'")
+    return x[index], y[index]
+
+#==================================================================================================================================================================
+# BENCHMARK
+
+# Generate a synthetic load curve: a ramp with cycles, a few spikes and noise
+def synthetic_curve(length, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0.0, 1000.0, length)
+    y = 50*x/1000 + 10*np.sin(x/15) + 3*np.sin(x/1.7) + rng.normal(0.0, 0.3, length)
+    spikes = rng.integers(0, length, max(length//20000, 1))
+    y[spikes] = y[spikes] + rng.normal(0.0, 20.0, len(spikes))
+    return x, y
+
+# Time every method on curves of each length
+# -- Returns a list of {'method', 'length', 'points', 'seconds'} results (best of repeat runs)
+def run_benchmark(lengths, points, tolerance, repeat, log=print):
+    results = []
+    for length in lengths:
+        x, y = synthetic_curve(length, seed=length)
+        for method in METHODS:
+            Settings = {'Method':method, 'Points':points, 'Tolerance':tolerance}
+            if method == 'tolerance':
+                Settings['Points'] = None
+            times, (kept_x, kept_y) = time_call(lambda: decimate(x, y, Settings), repeat)
+            best = min(times)
+            results.append({'method':method, 'length':length, 'points':len(kept_x), 'seconds':best})
+            log(f'  {method:<10}{length:>10} points -> {len(kept_x):>7}  {best*1000:9.2f} ms/curve  {1/best:9.1f} curves/s  ' +
+                f'{length/best/1e6:7.1f} M points/s')
+    return results
+
+#==================================================================================================================================================================
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the decimation of functional curves')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10000, 100000, 1000000], help='numbers of points per curve')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS, help='target number of points (lttb and minmax)')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='Y tolerance of the tolerance method')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each benchmark (the best is reported)')
+    args = parser.parse_args(argv)
+
+    run_benchmark(args.lengths, args.points, args.tolerance, args.repeat)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Grid Editor
+#
+#   PURPOSE: Paginated grid editor for the Single Value and Functional attribute mappings
+#
+#   Only the visible page of attributes is sent to the browser as a single data editor, instead of one text input and one or two
+#   selectboxes per attribute. The grid can be searched and filtered by attribute name and reads and writes the same
+#   Config['Single Value'] and Config['Functional'] structures as the row editor.
+#
+#   Streamlit makes the id of a data editor from its data, so the table given to the editor must not change while it is shown or
+#   the edits made since the last rerun are dropped. Each grid keeps a snapshot of the table of the view (page, page size, filter
+#   and search) it shows in session state, and only the cells edited in the grid (edited_rows) are written to the configuration.
+#   The snapshot, and the rows it shows, are kept until the view changes or the configuration is changed outside the grid.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import hashlib
+
+import pandas as pd
+import streamlit as st
+
+# Set Grid Defaults
+PAGE_SIZES = [25, 50, 100, 250]
+FILTERS = ['All', 'Mapped', 'Unmapped']
+GRID_MIN_ROWS = 50      # Sections with more attributes than this open in the grid editor by default
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get a mapped value from the configuration
+# -- field = None for single value attributes, 'X' or 'Y' for functional attributes
+def get_value(Section, att, field):
+    if field == None:
+        return Section[att]
+    return Section[att][field]
+
+# Set a mapped value in the configuration
+def set_value(Section, att, field, value):
+    if field == None:
+        Section[att] = value
+    else:
+        Section[att][field] = value
+
+# Filter the attributes by name and mapping status
+def filter_atts(Section, atts, fields, search, status):
+    search = search.strip().lower()
+    rows = []
+    for att in atts:
+        if search != '' and search not in att.lower():
+            continue
+        if status != 'All':
+            mapped = any(get_value(Section, att, field) not in ('', None) for _, field in fields)
+            if mapped != (status == 'Mapped'):
+                continue
+        rows.append(att)
+    return rows
+
+# Get the cell values of a snapshot with its edits applied
+# -- edits: edited_rows of the data editor ({row:{column label:value}})
+def snapshot_values(Snapshot, label, edits):
+    values = list(Snapshot['table'][label])
+    for row, Edit in edits.items():
+        if label in Edit and int(row) < len(values):
+            value = Edit[label]
+            values[int(row)] = '' if value == None or value != value else value
+    return values
+
+# Check that a snapshot still shows the configuration
+# -- False when the configuration was changed outside the grid (auto-mapping, a loaded configuration) since the last edits
+def snapshot_current(Snapshot, Section, fields):
+    if any(att not in Section for att in Snapshot['atts']):
+        return False
+    for label, field in fields:
+        values = snapshot_values(Snapshot, label, Snapshot['applied'])
+        if values != [get_value(Section, att, field) for att in Snapshot['atts']]:
+            return False
+    return True
+
+# Create the grid editor for a section of the configuration
+# -- Config: configuration dictionary, edited in place
+# -- section: 'Single Value' or 'Functional'
+# -- atts: list of schema attribute names
+# -- fields: list of (column label, field) pairs, see get_value
+# -- view: catalog OptionView with the allowed Py MI Lab attributes
+# -- key: prefix of the widget keys
+def mapping_grid(Config, section, atts, fields, view, key):
+    Section = Config[section]
+
+    # Create the search and filter controls
+    controls = st.columns([0.5, 0.2, 0.15, 0.15])
+    with controls[0]:
+        search = st.text_input('Search', placeholder='Filter by database attribute name', key=f'{key}_search')
+    with controls[1]:
+        status = st.selectbox('Show', FILTERS, key=f'{key}_status')
+    with controls[2]:
+        page_size = st.selectbox('Rows per page', PAGE_SIZES, key=f'{key}_page_size')
+
+    # Get the visible rows
+    rows = filter_atts(Section, atts, fields, search, status)
+    num_pages = max(1, -(-len(rows) // page_size))
+    with controls[3]:
+        page = st.number_input('Page', min_value=1, max_value=num_pages, value=1, step=1, key=f'{key}_page')
+    page = min(page, num_pages)
+
+    # Get the snapshot of the view
+    # -- The rows of a view are kept while it is shown, so mapping an attribute with the Unmapped filter does not move the rows
+    digest = hashlib.md5(search.strip().lower().encode('utf-8')).hexdigest()[:12]
+    view_key = f'{key}_grid_{page}_{page_size}_{status}_{digest}'
+    Snapshot = st.session_state.get(f'{key}_snapshot')
+    if Snapshot == None or Snapshot['view'] != view_key or not snapshot_current(Snapshot, Section, fields):
+        page_atts = rows[(page-1)*page_size:page*page_size]
+        table = {'Database Attribute':page_atts}
+        for label, field in fields:
+            table[label] = [get_value(Section, att, field) for att in page_atts]
+        version = Snapshot['version'] + 1 if Snapshot != None else 0
+        Snapshot = {'view':view_key, 'atts':page_atts, 'table':table, 'applied':{}, 'version':version}
+        st.session_state[f'{key}_snapshot'] = Snapshot
+    page_atts = Snapshot['atts']
+    st.caption(f'Showing {len(page_atts)} of {len(rows)} matching attributes ({len(atts)} total)')
+    if len(page_atts) == 0:
+        return
+
+    # Create the table
+    # -- A new snapshot of the same view gets a new editor key, so the edits of the old one are not applied to it
+    column_config = {'Database Attribute':st.column_config.TextColumn('Database Attribute', disabled=True)}
+    for label, field in fields:
+        column_config[label] = st.column_config.SelectboxColumn(label, options=view.options, required=False)
+    editor_key = f"{view_key}_{Snapshot['version']}"
+    st.data_editor(pd.DataFrame(Snapshot['table']), column_config=column_config, hide_index=True, use_container_width=True,
+                   num_rows='fixed', key=editor_key)
+
+    # Save the data
+    # -- edited_rows holds every edit made since the snapshot was taken, so the cells edited earlier are written again unchanged
+    edits = st.session_state[editor_key].get('edited_rows', {})
+    for label, field in fields:
+        values = snapshot_values(Snapshot, label, edits)
+        for row, Edit in edits.items():
+            if label in Edit and int(row) < len(page_atts):
+                set_value(Section, page_atts[int(row)], field, values[int(row)])
+    Snapshot['applied'] = {row:dict(Edit) for row, Edit in edits.items()}
@@ -0,0 +1,321 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Import Workbook Writer
+#
+#   PURPOSE: Write populated Granta MI import workbooks from Py MI Lab neutral files using a configuration
+#
+#   The layout of the schema workbook (sheet order, header rows and Data sheet rows) is read once into an ImportLayout. Each
+#   record (a neutral file, or the neutral files of one test) is then written as one import workbook with the same layout:
+#       functional sheets   the X and Y values of the mapped Py MI Lab attributes in columns C and D from FUNC_DATA_ROW, reduced
+#                           to fewer points when the attribute has decimation settings (see CurveDecimation)
+#       tabular sheets      a row number in column C and the mapped attribute of each editable column from TAB_DATA_ROW,
+#                           assembled column by column with scalars repeated and arrays aligned (see TabularAssembler)
+#       Data sheet          the mapped single values in the value column, next to each single value attribute name
+#   Only the attributes referenced by the configuration are read from the neutral files (see NeutralReader), and functional and
+#   tabular values are converted to the Granta MI units when a template catalog is given (see SchemaUnits). Values whose units
+#   cannot be converted are left out of the workbook and reported.
+#
+#   Workbooks are written with openpyxl in write-only mode, which streams rows to disk instead of building every cell in
+#   memory, and records are written in parallel by a process pool that builds the writer once per worker.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+
+from CurveDecimation import decimate
+from NeutralReader import NeutralReader
+from TabularAssembler import PAD, assemble_tabular
+from SchemaParser import (DATA_NAME_COL, DATA_SHEET, DATA_START_ROW, DATA_VALUE_COL, EDIT_COLOR, FUNC_ROW, HEADER_COLOR, NAME_COL,
+                          NAME_ROW, TAB_FLAG, TAB_ROW, TAB_START_COL, get_attribute_sheets, open_workbook, split_units)
+from SchemaUnits import UnitPlan
+
+# Set the Import Workbook Layout
+# -- The values start one row below the header row, as in the schema export
+FUNC_DATA_ROW = FUNC_ROW + 2        # First row of the functional X and Y values
+TAB_DATA_ROW = TAB_ROW + 2          # First row of the tabular values
+IMPORT_SUFFIX = '_Import'
+
+#==================================================================================================================================================================
+# SCHEMA LAYOUT
+
+# Get the value and fill color of a cell
+# -- Cells without a solid fill have no color
+def cell_entry(cell):
+    fill = getattr(cell, 'fill', None)
+    if fill == None or fill.fill_type != 'solid':
+        return (cell.value, None)
+    return (cell.value, fill.start_color.index)
+
+class ImportLayout:
+    # -- source: schema workbook path, bytes or file-like object
+    def __init__(self, source):
+        self.sheets = []        # (sheet title, attribute type, attribute name, header rows, [(column, Granta MI column)])
+        self.data_rows = []     # Rows of the Data sheet
+        self.single_rows = {}   # Data sheet row number -> single value attribute name
+        wb = open_workbook(source)
+        try:
+            for title in get_attribute_sheets(wb):
+                self.sheets.append(self.read_sheet(title, wb[title]))
+            if DATA_SHEET in wb.sheetnames:
+                self.read_data(wb[DATA_SHEET])
+        finally:
+            wb.close()
+
+    # Read the header rows of an attribute sheet
+    def read_sheet(self, title, ws):
+        rows = [[cell_entry(cell) for cell in row] for row in ws.iter_rows(max_row=FUNC_DATA_ROW - 1)]
+        rows = rows + [[] for k in range(FUNC_DATA_ROW - 1 - len(rows))]
+
+        def value(row, col):
+            return rows[row-1][col-1][0] if len(rows[row-1]) >= col else None
+
+        att_name = value(NAME_ROW, NAME_COL)
+        if value(TAB_ROW, 3) != TAB_FLAG:
+            return (title, 'Functional', att_name, rows, [])
+
+        # -- Editable (yellow) tabular columns, in the order read by SchemaParser
+        columns = []
+        header = rows[TAB_ROW-1]
+        for col in range(TAB_START_COL, len(header) + 1):
+            text, color = header[col-1]
+            if text == None:
+                break
+            if color == EDIT_COLOR:
+                columns.append((col, split_units(text)[0]))
+        return (title, 'Tabular', att_name, rows[:TAB_DATA_ROW - 1], columns)
+
+    # Read the Data sheet rows and find the single value attribute rows
+    def read_data(self, ws):
+        for r, row in enumerate(ws.iter_rows(), start=1):
+            row = [cell_entry(cell) for cell in row]
+            self.data_rows.append(row)
+            if r >= DATA_START_ROW and len(row) >= DATA_NAME_COL:
+                name, color = row[DATA_NAME_COL-1]
+                if name != None and color == HEADER_COLOR:
+                    self.single_rows[r] = name
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the name of a record: the neutral file name, or the directory name of a record made of several neutral files
+def record_stem(record):
+    if isinstance(record, (tuple, list)):
+        return os.path.basename(os.path.dirname(record[0]))
+    return os.path.splitext(os.path.basename(record))[0]
+
+# Get the import workbook path of a record
+def import_path(record, output_dir):
+    return os.path.join(output_dir, record_stem(record) + IMPORT_SUFFIX + '.xlsx')
+
+# Get the import workbook paths of many records
+# -- Records with the same name (x.json and x/, or files of the same name in different directories) would overwrite each
+#    other's workbook, so the later ones are numbered in record order: x_Import.xlsx, x_2_Import.xlsx, ...
+# -- Names are compared without case, as on case-insensitive file systems
+def import_paths(records, output_dir):
+    paths = []
+    used = set()
+    for record in records:
+        stem = record_stem(record)
+        name = stem
+        n = 1
+        while name.lower() in used:
+            n = n + 1
+            name = f'{stem}_{n}'
+        used.add(name.lower())
+        paths.append(os.path.join(output_dir, name + IMPORT_SUFFIX + '.xlsx'))
+    return paths
+
+# Get the cell values of a mapped value
+# -- Arrays are converted to Python numbers in one call, NaN is written as an empty cell
+def column_values(value):
+    if value is None:
+        return []
+    if isinstance(value, np.ndarray):
+        values = value.ravel().tolist()
+    elif isinstance(value, (list, tuple)):
+        values = list(value)
+    else:
+        values = [value]
+    return [None if isinstance(v, float) and v != v else v for v in values]
+
+# Get the cell value of a mapped single value
+def single_value(value):
+    values = column_values(value)
+    if len(values) == 0:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return ', '.join(str(v) for v in values)
+
+#==================================================================================================================================================================
+# IMPORT WRITER
+
+class ImportWriter:
+    # -- Config: configuration mapping the schema to the Py MI Lab attributes
+    # -- Layout: ImportLayout of the schema workbook
+    # -- Catalog: TemplateCatalog to convert units with (optional, values are written as read without it)
+    # -- align: how tabular arrays of different lengths are aligned (see TabularAssembler.ALIGNMENTS)
+    def __init__(self, Config, Layout, Catalog=None, align=PAD):
+        self.Config = Config
+        self.Layout = Layout
+        self.align = align
+        self.plan = UnitPlan(Config, Catalog) if Catalog != None else None
+        self.reader = NeutralReader(Config, extra=self.plan.paths() if self.plan != None else ())
+        self._fills = {}
+
+    # Read the values of a record made of one or more neutral files
+    def read_record(self, record):
+        if isinstance(record, (str, os.PathLike)):
+            record = [record]
+        values = {}
+        for path in record:
+            values.update(self.reader.read(path))
+        return values
+
+    # Get a header cell with its fill
+    def header_cell(self, ws, value, color):
+        if color == None:
+            return value
+        if color not in self._fills:
+            self._fills[color] = PatternFill('solid', start_color=color)
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = self._fills[color]
+        return cell
+
+    # Write the header rows of a sheet
+    def write_header(self, ws, rows):
+        for row in rows:
+            ws.append([self.header_cell(ws, value, color) for value, color in row])
+
+    # Write an import workbook for a record
+    # -- Returns the number of data rows written, the mapped Py MI Lab attributes missing from the record, the tabular columns
+    #    whose arrays did not match the length of their table, as 'attribute: column (length of length)', and the mappings left
+    #    empty because the record units cannot be converted to the Granta MI units, as 'attribute: field (problem)'
+    def write(self, record, path):
+        values = self.read_record(record)
+        problems = self.plan.check(values) if self.plan != None else []
+        converted = self.plan.convert(values) if self.plan != None else {}
+        skipped = set(where for where, record_unit, unit, message in problems)
+        units = [f'{where[1]}: {where[2]} ({message})' for where, record_unit, unit, message in problems]
+        missing = set()
+        mismatched = []
+        num_rows = 0
+
+        # -- Get the values of a mapping, in Granta MI units when they could be converted
+        # -- Values in units that cannot be converted are left out rather than written in the wrong units
+        def lookup(section, att, field, name):
+            if name in (None, ''):
+                return None
+            if (section, att, field) in skipped:
+                return None
+            if (section, att, field) in converted:
+                return converted[(section, att, field)]
+            if name not in values:
+                missing.add(name)
+                return None
+            return values[name]
+
+        Decimation = self.Config.get('Decimation', {})
+        wb = Workbook(write_only=True)
+        for title, att_type, att_name, rows, columns in self.Layout.sheets:
+            ws = wb.create_sheet(title)
+            self.write_header(ws, rows)
+
+            # Functional Attributes: X and Y in columns C and D, decimated when the attribute has decimation settings
+            if att_type == 'Functional':
+                mapping = self.Config['Functional'].get(att_name, {})
+                x = lookup('Functional', att_name, 'X', mapping.get('X'))
+                y = lookup('Functional', att_name, 'Y', mapping.get('Y'))
+                x, y = decimate(x, y, Decimation.get(att_name))
+                x = column_values(x)
+                y = column_values(y)
+                for k in range(max(len(x), len(y))):
+                    ws.append([None, None, x[k] if k < len(x) else None, y[k] if k < len(y) else None])
+                num_rows = num_rows + max(len(x), len(y))
+                continue
+
+            # Tabular Attributes: row number in column C and each mapped column in its header column
+            # -- The table is assembled as column buffers and streamed as rows in one pass
+            mapping = self.Config['Tabular'].get(att_name, {'GrantaCols':[], 'PyCols':[]})
+            mapped = dict(zip(mapping['GrantaCols'], mapping['PyCols']))
+            table = assemble_tabular([granta_col for col, granta_col in columns],
+                                     [lookup('Tabular', att_name, granta_col, mapped.get(granta_col)) for col, granta_col in columns],
+                                     self.align)
+            for granta_col, length in table.mismatches:
+                mismatched.append(f'{att_name}: {granta_col} ({length} of {len(table)})')
+            width = max([3] + [col for col, granta_col in columns])
+            cells = [itertools.repeat(None, len(table)) for k in range(width)]
+            cells[2] = range(1, len(table) + 1)
+            for (col, granta_col), column in zip(columns, table.cells()):
+                cells[col-1] = column
+            for row in zip(*cells):
+                ws.append(row)
+            num_rows = num_rows + len(table)
+
+        # Data Sheet: the mapped single values next to their attribute names
+        if len(self.Layout.data_rows) > 0:
+            ws = wb.create_sheet(DATA_SHEET)
+            Single = self.Config['Single Value']
+            for r, row in enumerate(self.Layout.data_rows, start=1):
+                cells = [self.header_cell(ws, value, color) for value, color in row]
+                if r in self.Layout.single_rows:
+                    name = Single.get(self.Layout.single_rows[r])
+                    cells = cells + [None]*(DATA_VALUE_COL - len(cells))
+                    cells[DATA_VALUE_COL-1] = single_value(lookup('Single Value', self.Layout.single_rows[r], None, name))
+                ws.append(cells)
+
+        wb.save(path)
+        return num_rows, sorted(missing), mismatched, units
+
+    # Write the import workbook of a record
+    # -- Returns a result dictionary, errors are reported rather than raised so one bad record does not stop the export
+    def export(self, record, path):
+        start = time.perf_counter()
+        result = {'record':record, 'output':path, 'rows':0, 'missing':[], 'mismatched':[], 'units':[], 'seconds':0.0, 'error':None}
+        try:
+            result['rows'], result['missing'], result['mismatched'], result['units'] = self.write(record, path)
+        except Exception as e:
+            result['output'] = None
+            result['error'] = f'{type(e).__name__}: {e}'
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+#==================================================================================================================================================================
+# PARALLEL EXPORT
+# Each worker process builds the writer (compiled reader and unit plan) once and writes its share of the records
+
+_worker_writer = None
+
+# Build the writer once per worker process
+def _init_writer(Config, Layout, Catalog, align):
+    global _worker_writer
+    _worker_writer = ImportWriter(Config, Layout, Catalog, align)
+
+# Write one record in a worker process
+def _export_record(record, path):
+    return _worker_writer.export(record, path)
+
+# Write the import workbooks of many records
+# -- Returns a result per record in the same order (see ImportWriter.export)
+def export_records(Config, Layout, records, output_dir, Catalog=None, jobs=None, align=PAD):
+    os.makedirs(output_dir, exist_ok=True)
+    records = list(records)
+    paths = import_paths(records, output_dir)
+    if jobs == None:
+        jobs = os.cpu_count() or 1
+    if jobs < 2 or len(records) < 2:
+        writer = ImportWriter(Config, Layout, Catalog, align)
+        return [writer.export(record, path) for record, path in zip(records, paths)]
+    chunk = max(1, len(records)//(jobs*4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_writer, initargs=(Config, Layout, Catalog, align)) as pool:
+        return list(pool.map(_export_record, records, paths, chunksize=chunk))
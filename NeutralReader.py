@@ -0,0 +1,256 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Neutral File Reader
+#
+#   PURPOSE: Read only the Py MI Lab attributes referenced by a configuration from Py MI Lab neutral (.json) files
+#
+#   Neutral files have the same layout as Raw_Template.json and Analysis_Template.json:
+#       {Category: {Attribute: {'Type':..., 'Value':...}, ...}, ...}
+#
+#   The configuration is compiled once into a tree of referenced paths. Each neutral file is memory mapped and scanned forward;
+#   values that are not referenced are skipped without being decoded, and point arrays are returned as NumPy float64 buffers
+#   instead of Python lists, so memory use is proportional to what is mapped rather than to the size of the file.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import json
+import mmap
+import re
+import warnings
+
+import numpy as np
+
+# Set Token Patterns
+_WS = re.compile(rb'[ \t\r\n]*')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+_STRUCT = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb'[,}\]]')
+_NESTED = re.compile(rb'["\[{]')
+
+ARRAY_TYPES = ('point array',)
+
+#==================================================================================================================================================================
+# PATH COMPILATION
+
+# Split a "Category - Attribute" name into its path
+def split_name(name):
+    cat, sep, att = name.partition(' - ')
+    if sep == '':
+        return None
+    return (cat, att)
+
+# Get the Py MI Lab attributes referenced by a configuration
+def config_names(Config):
+    names = []
+
+    # -- Single Attributes
+    names.extend(Config.get('Single Value', {}).values())
+
+    # -- Functional Attributes
+    for att in Config.get('Functional', {}).values():
+        names.extend([att['X'], att['Y']])
+
+    # -- Tabular Attributes
+    for att in Config.get('Tabular', {}).values():
+        names.extend(att['PyCols'])
+
+    # -- Record Placement (conditional and naming attributes)
+    for level in Config.get('Placement', {}).values():
+        for row in level:
+            if len(row) > 1:
+                names.append(row[1])
+            if len(row) > 4 and row[4] != None:
+                names.extend(row[4])
+
+    return [name for name in dict.fromkeys(names) if isinstance(name, str) and name != '']
+
+# Compile the referenced paths into a tree
+# -- names are "Category - Attribute" strings, extra paths are tuples of keys of any depth (e.g. ('Raw Data', 'Units', 'Time'))
+# -- Leaves hold the key the value is returned under
+def compile_paths(names, extra=()):
+    tree = {}
+    for key, path in [(name, split_name(name)) for name in names] + [(tuple(path), tuple(path)) for path in extra]:
+        if path == None:
+            continue
+        node = tree
+        for part in path[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        if path[-1] not in node:
+            node[path[-1]] = key
+    return tree
+
+#==================================================================================================================================================================
+# SCANNER
+# Minimal forward JSON scanner over a bytes-like buffer
+
+class _Scanner:
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def ws(self):
+        self.pos = _WS.match(self.buf, self.pos).end()
+
+    def peek(self):
+        self.ws()
+        return self.buf[self.pos:self.pos+1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} at byte {self.pos} of neutral file')
+        self.pos = self.pos + 1
+
+    # Read an object key
+    def key(self):
+        self.ws()
+        m = _STRING.match(self.buf, self.pos)
+        if m == None:
+            raise ValueError(f'Expected a key at byte {self.pos} of neutral file')
+        self.pos = m.end()
+        self.expect(b':')
+        return json.loads(m.group())
+
+    # Iterate over the keys of an object, leaving the scanner at each value
+    def members(self):
+        self.expect(b'{')
+        if self.peek() == b'}':
+            self.pos = self.pos + 1
+            return
+        while True:
+            yield self.key()
+            sep = self.peek()
+            self.pos = self.pos + 1
+            if sep == b'}':
+                return
+            if sep != b',':
+                raise ValueError(f'Expected "," or "}}" at byte {self.pos-1} of neutral file')
+
+    # Get the end of the value starting at the current position without decoding it
+    def value_end(self):
+        self.ws()
+        first = self.buf[self.pos:self.pos+1]
+        if first == b'"':
+            return _STRING.match(self.buf, self.pos).end()
+        if first not in (b'[', b'{'):
+            m = _SCALAR_END.search(self.buf, self.pos)
+            return m.start() if m != None else len(self.buf)
+
+        # -- Jump between structural characters, skipping over strings
+        depth = 0
+        pos = self.pos
+        while True:
+            m = _STRUCT.search(self.buf, pos)
+            if m == None:
+                raise ValueError('Unterminated value in neutral file')
+            char = m.group()
+            if char == b'"':
+                pos = _STRING.match(self.buf, m.start()).end()
+                continue
+            pos = m.end()
+            if char in (b'[', b'{'):
+                depth = depth + 1
+            else:
+                depth = depth - 1
+                if depth == 0:
+                    return pos
+
+    def skip(self):
+        self.pos = self.value_end()
+
+    # Decode the value at the current position
+    def value(self, array=False):
+        self.ws()
+        start = self.pos
+        end = self.value_end()
+        self.pos = end
+        raw = self.buf[start:end]
+        if array and raw[:1] == b'[':
+            return decode_array(raw)
+        return json.loads(raw)
+
+# Decode a JSON array of numbers into a float64 buffer
+# -- Arrays containing nulls, strings, booleans or nested arrays fall back to the JSON decoder
+def decode_array(raw):
+    body = raw[1:-1]
+    if body.strip() == b'':
+        return np.zeros(0, dtype=np.float64)
+    if _NESTED.search(body) == None and b'null' not in body:
+        with warnings.catch_warnings():
+            # -- NumPy warns (rather than raising) when the text is not all numbers
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                return np.fromstring(body, dtype=np.float64, sep=',')
+            except (DeprecationWarning, ValueError):
+                pass
+    values = json.loads(raw)
+    if all(v == None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return np.array([np.nan if v == None else v for v in values], dtype=np.float64)
+    return values
+
+#==================================================================================================================================================================
+# NEUTRAL READER
+
+class NeutralReader:
+    # -- Config: configuration whose Py MI Lab attributes are read
+    # -- extra: additional paths to read, as tuples of keys
+    def __init__(self, Config=None, names=(), extra=()):
+        names = list(names)
+        if Config != None:
+            names = config_names(Config) + names
+        self.paths = compile_paths(names, extra)
+
+    # Read the referenced values from a neutral file
+    # -- Returns {"Category - Attribute" or path tuple: value}, attributes missing from the file are not included
+    def read(self, path):
+        with open(path, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # -- Empty files cannot be memory mapped
+                buf = b''
+            try:
+                values = {}
+                if len(buf) > 0:
+                    self._read_object(_Scanner(buf), self.paths, values)
+                return values
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+
+    # Read the referenced values from many neutral files
+    def read_many(self, paths):
+        for path in paths:
+            yield path, self.read(path)
+
+    # Walk an object, descending into referenced keys and skipping everything else
+    def _read_object(self, scan, node, values):
+        for key in scan.members():
+            child = node.get(key)
+            if child == None:
+                scan.skip()
+            elif isinstance(child, dict):
+                if scan.peek() == b'{':
+                    self._read_object(scan, child, values)
+                else:
+                    scan.skip()
+            else:
+                self._read_attribute(scan, child, values)
+
+    # Read the Value of an attribute object
+    def _read_attribute(self, scan, out_key, values):
+        if scan.peek() != b'{':
+            values[out_key] = scan.value()
+            return
+        att_type = None
+        for key in scan.members():
+            if key == 'Type':
+                att_type = scan.value()
+            elif key == 'Value':
+                values[out_key] = scan.value(array=att_type in ARRAY_TYPES or att_type == None)
+            else:
+                scan.skip()
@@ -0,0 +1,201 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Placement Engine
+#
+#   PURPOSE: Evaluate the Record Placement rules of a configuration to get the folder path of each Py MI Lab record
+#
+#   Config['Placement']['Level n'] holds rows of [IF, attribute, '='/'≠', value, naming attributes, format]. For each level the
+#   first row whose condition holds names the folder: the first populated naming attribute is substituted for '[attribute]' in
+#   the format. A level with a single row has no condition.
+#
+#   The levels are compiled once: '=' tests on the same attribute are grouped into a value -> row lookup, the format strings are
+#   split around '[attribute]', and every referenced attribute is compiled into a NeutralReader so each neutral file is read once
+#   for only those values.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from NeutralReader import NeutralReader
+from SchemaParser import pool_context
+
+# Set Placement Defaults
+PLACEHOLDER = '[attribute]'
+NOT_EQUAL = '≠'
+PARALLEL_MIN_FILES = 200    # Fewer neutral files are evaluated serially
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Check if a record value is populated
+def populated(value):
+    return value not in (None, '') and not (isinstance(value, float) and value != value)
+
+# Convert a record or conditional value to the text used for comparison and folder names
+# -- Whole numbers lose their decimal point so 800.0 matches '800'
+def value_text(value):
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        if number.is_integer():
+            return str(int(number))
+        return text
+    return str(value)
+
+# Split a format string around the '[attribute]' placeholder
+def compile_format(fmt):
+    if fmt in (None, ''):
+        fmt = PLACEHOLDER
+    return fmt.split(PLACEHOLDER)
+
+#==================================================================================================================================================================
+# COMPILED LEVEL
+
+class PlacementLevel:
+    def __init__(self, name, rows):
+        self.name = name
+        self.naming = []        # Naming attributes per row
+        self.formats = []       # Format parts per row
+        self.equal = {}         # attribute -> {value text: first row}
+        self.not_equal = []     # (row, attribute, value text)
+        self.default = None     # First row without a condition
+
+        # -- A level with a single row has no condition
+        conditional = len(rows) > 1
+        for n in range(len(rows)):
+            row = list(rows[n]) + [None]*(6 - len(rows[n]))
+            self.naming.append([att for att in (row[4] or []) if att not in (None, '')])
+            self.formats.append(compile_format(row[5]))
+
+            if not conditional or row[1] in (None, ''):
+                if self.default == None:
+                    self.default = n
+            elif row[2] == NOT_EQUAL:
+                self.not_equal.append((n, row[1], value_text(row[3] or '')))
+            else:
+                self.equal.setdefault(row[1], {}).setdefault(value_text(row[3] or ''), n)
+
+    # Get the attributes referenced by the level
+    def attributes(self):
+        atts = list(self.equal.keys()) + [att for _, att, _ in self.not_equal]
+        for naming in self.naming:
+            atts.extend(naming)
+        return atts
+
+    # Get the first row whose condition holds for the record
+    def match(self, values):
+        best = self.default
+        for att, lookup in self.equal.items():
+            if att in values and populated(values[att]):
+                n = lookup.get(value_text(values[att]))
+                if n != None and (best == None or n < best):
+                    best = n
+        for n, att, text in self.not_equal:
+            if best != None and n > best:
+                break
+            if att in values and populated(values[att]) and value_text(values[att]) != text:
+                best = n
+                break
+        return best
+
+    # Get the folder name for the record, None if no rule applies
+    def folder(self, values):
+        n = self.match(values)
+        if n == None:
+            return None
+        for att in self.naming[n]:
+            if att in values and populated(values[att]):
+                return value_text(values[att]).join(self.formats[n])
+        return None
+
+#==================================================================================================================================================================
+# PLACEMENT ENGINE
+
+class PlacementEngine:
+    def __init__(self, Config):
+        Placement = Config.get('Placement', {})
+
+        # Compile the levels in order (Level 1, Level 2, ...)
+        names = sorted(Placement.keys(), key=lambda name: int(name.split()[-1]) if name.split()[-1].isdigit() else 0)
+        self.levels = [PlacementLevel(name, Placement[name]) for name in names]
+
+        # Compile the reader for every referenced attribute
+        atts = []
+        for level in self.levels:
+            atts.extend(level.attributes())
+        self.attributes = list(dict.fromkeys(atts))
+        self.reader = NeutralReader(names=self.attributes)
+
+    # Get the folder names of a record from its attribute values
+    # -- Levels without a matching rule or populated naming attribute are left out
+    def place(self, values):
+        folders = []
+        for level in self.levels:
+            folder = level.folder(values)
+            if folder != None:
+                folders.append(folder)
+        return folders
+
+    # Read the values of a record made of one or more neutral files (e.g. the raw and analysis files of a test)
+    def read_record(self, record):
+        if isinstance(record, (str, os.PathLike)):
+            record = [record]
+        values = {}
+        for path in record:
+            values.update(self.reader.read(path))
+        return values
+
+    # Get the folder names of a record from its neutral files
+    def place_record(self, record):
+        return self.place(self.read_record(record))
+
+    # Get the folder names of many records
+    # -- Returns a list of folder name lists in the same order as the records
+    def place_records(self, records, max_workers=None):
+        records = list(records)
+        if max_workers == None:
+            max_workers = os.cpu_count() or 1
+        if max_workers < 2 or len(records) < PARALLEL_MIN_FILES:
+            return [self.place_record(record) for record in records]
+        chunk = max(1, len(records)//(max_workers*4))
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=pool_context()) as pool:
+            return list(pool.map(self.place_record, records, chunksize=chunk))
+
+#==================================================================================================================================================================
+# PREVIEW
+
+# Build a tree of folder names with the records placed in each folder
+def preview_tree(records, placements):
+    tree = {'records':[], 'folders':{}}
+    for record, folders in zip(records, placements):
+        node = tree
+        for folder in folders:
+            node = node['folders'].setdefault(folder, {'records':[], 'folders':{}})
+        node['records'].append(record)
+    return tree
+
+# Count the records in a tree node and its sub-folders
+def count_records(node):
+    return len(node['records']) + sum(count_records(child) for child in node['folders'].values())
+
+# Format the tree as indented text lines
+def format_tree(tree, indent='    ', show_records=False, depth=0):
+    lines = []
+    for folder in sorted(tree['folders']):
+        child = tree['folders'][folder]
+        lines.append(f'{indent*depth}{folder} ({count_records(child)})')
+        lines.extend(format_tree(child, indent, show_records, depth+1))
+    if show_records:
+        for record in tree['records']:
+            lines.append(f'{indent*depth}- {record}')
+    return lines
@@ -0,0 +1,236 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Rerun Profiler
+#
+#   PURPOSE: Measure where the time of each Streamlit rerun of the Schema Configuration Manager goes
+#
+#   Each section of the script is timed as a span, with the number of widgets created and the number and size of the messages
+#   sent to the browser while it ran (counted by wrapping the public enqueue method of the script run context for the rerun).
+#   At the end of the rerun the rerun is written as one JSON line to the 'SchemaConfiguration.profile' logger (and to the file in
+#   SCHEMA_PROFILE_LOG if set), and the optional diagnostics panel is drawn in the sidebar. Reruns cut short by st.stop() or
+#   st.rerun() are recorded too when they end through RerunProfiler.stop() and RerunProfiler.rerun().
+#
+#   Estimating the session state size (in total and per key family, see SessionLifecycle) walks the whole session state, which
+#   takes longer than most reruns on a large configuration. It is only done while the diagnostics panel is shown, and otherwise
+#   once every STATE_SAMPLE reruns; the other records have a state_bytes of None.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from SessionLifecycle import memory_report
+
+# Set Profiler Defaults
+HISTORY = 50                                        # Number of reruns kept for the diagnostics panel
+PROFILE_LOG = os.environ.get('SCHEMA_PROFILE_LOG')  # Optional JSON lines file for the rerun records
+STATE_SAMPLE = int(os.environ.get('SCHEMA_PROFILE_STATE_SAMPLE', 20))   # Reruns between session state sizes (0 = panel only)
+
+logger = logging.getLogger('SchemaConfiguration.profile')
+_log_lock = threading.Lock()
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Estimate the memory used by an object and everything it references
+# -- Objects shared between references are only counted once
+def deep_sizeof(obj, seen=None):
+    if seen == None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size = size + deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size = size + deep_sizeof(item, seen)
+    elif hasattr(obj, 'nbytes') and isinstance(getattr(obj, 'nbytes'), int):
+        # -- NumPy arrays
+        size = size + obj.nbytes
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size = size + deep_sizeof(vars(obj), seen)
+    return size
+
+# Estimate the size of each session state entry
+def session_state_sizes():
+    sizes = {}
+    seen = set()
+    for key in list(st.session_state.keys()):
+        try:
+            sizes[key] = deep_sizeof(st.session_state[key], seen)
+        except Exception:
+            sizes[key] = 0
+    return sizes
+
+# Write a rerun record as a JSON line
+def write_record(record):
+    line = json.dumps(record, separators=(',', ':'))
+    logger.info(line)
+    if PROFILE_LOG != None:
+        with _log_lock:
+            with open(PROFILE_LOG, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+#==================================================================================================================================================================
+# MESSAGE COUNTER
+# Wraps the enqueue method of the script run context, through which every message of the script is sent to the browser, to
+# count the messages and bytes
+
+class _CountingEnqueue:
+    def __init__(self, target):
+        self.target = target
+        self.messages = 0
+        self.bytes = 0
+
+    def __call__(self, msg):
+        self.messages = self.messages + 1
+        self.bytes = self.bytes + msg.ByteSize()
+        return self.target(msg)
+
+    # Install the counter on a script run context
+    # -- A counter left by a rerun that ended with an error is reused
+    @classmethod
+    def install(cls, ctx):
+        if not isinstance(ctx.enqueue, cls):
+            ctx.enqueue = cls(ctx.enqueue)
+        return ctx.enqueue
+
+    # Remove the counter from a script run context
+    def remove(self, ctx):
+        if ctx.enqueue is self:
+            del ctx.enqueue
+
+#==================================================================================================================================================================
+# RERUN PROFILER
+
+class RerunProfiler:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.ctx = get_script_run_ctx()
+        self.counter = None
+        if self.ctx != None:
+            # -- The counter is removed again when the rerun is recorded
+            self.counter = _CountingEnqueue.install(self.ctx)
+            self.counter.messages = 0
+            self.counter.bytes = 0
+
+    # Get the current widget, message and byte counts
+    def _counts(self):
+        widgets = len(self.ctx.widget_ids_this_run) if self.ctx != None else 0
+        messages = self.counter.messages if self.counter != None else 0
+        sent = self.counter.bytes if self.counter != None else 0
+        return widgets, messages, sent
+
+    # Time a section of the script
+    @contextmanager
+    def span(self, name):
+        widgets, messages, sent = self._counts()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end_widgets, end_messages, end_sent = self._counts()
+            self.spans.append({'name':name,
+                               'ms':round((time.perf_counter() - start)*1000, 2),
+                               'widgets':end_widgets - widgets,
+                               'messages':end_messages - messages,
+                               'bytes':end_sent - sent})
+
+    # Record the rerun, log it and draw the diagnostics panel
+    # -- extra: additional values to record (e.g. schema cache statistics)
+    # -- end: how the rerun ended ('finish', 'stop' or 'rerun')
+    def finish(self, extra=None, end='finish'):
+        widgets, messages, sent = self._counts()
+        if self.counter != None:
+            self.counter.remove(self.ctx)
+            self.counter = None
+        reruns = st.session_state.get('Profile_Reruns', 0) + 1
+        st.session_state['Profile_Reruns'] = reruns
+
+        # -- Session state is only sized for the panel or every STATE_SAMPLE reruns
+        show = st.session_state.get('show_diagnostics', False)
+        if show or (STATE_SAMPLE > 0 and reruns % STATE_SAMPLE == 0):
+            sizes = session_state_sizes()
+            Memory = memory_report(sizes)
+        else:
+            sizes = None
+            Memory = {'widget_ids':None, 'families':None}
+        record = {'event':'rerun',
+                  'time':time.time(),
+                  'session':self.ctx.session_id if self.ctx != None else None,
+                  'total_ms':round((time.perf_counter() - self.start)*1000, 2),
+                  'widgets':widgets,
+                  'messages':messages,
+                  'bytes':sent,
+                  'end':end,
+                  'state_bytes':sum(sizes.values()) if sizes != None else None,
+                  'state_keys':len(sizes) if sizes != None else None,
+                  'widget_ids':Memory['widget_ids'],
+                  'state_families':Memory['families'],
+                  'spans':self.spans}
+        if extra != None:
+            record.update(extra)
+        write_record(record)
+
+        # Keep the recent reruns for the panel
+        if 'Profile_History' not in st.session_state:
+            st.session_state['Profile_History'] = []
+        History = st.session_state['Profile_History']
+        History.append({'total_ms':record['total_ms'], 'widgets':widgets, 'bytes':sent, 'state_bytes':record['state_bytes']})
+        del History[:-HISTORY]
+
+        if show:
+            self.panel(record, sizes, History)
+        return record
+
+    # Record the rerun and stop the script (see st.stop)
+    def stop(self, extra=None):
+        self.finish(extra, end='stop')
+        st.stop()
+
+    # Record the rerun and rerun the script (see st.rerun)
+    def rerun(self, extra=None):
+        self.finish(extra, end='rerun')
+        st.rerun()
+
+    # Draw the diagnostics panel in the sidebar
+    def panel(self, record, sizes, History):
+        with st.sidebar:
+            st.subheader('Rerun Diagnostics')
+            st.markdown(f"Rerun: **{record['total_ms']:.0f} ms**, {record['widgets']} widgets, " +
+                        f"{record['messages']} messages ({record['bytes']/1024:.1f} kB)")
+            st.markdown(f"Session state: {record['state_keys']} keys ({record['state_bytes']/1024:.1f} kB), " +
+                        f"{record['widget_ids']} widget keys")
+            st.dataframe({'Section':[span['name'] for span in self.spans],
+                          'ms':[span['ms'] for span in self.spans],
+                          'Widgets':[span['widgets'] for span in self.spans],
+                          'kB sent':[round(span['bytes']/1024, 1) for span in self.spans]},
+                         hide_index=True, use_container_width=True)
+            st.line_chart({'Rerun (ms)':[h['total_ms'] for h in History]})
+            Families = record['state_families']
+            st.dataframe({'Session State':list(Families.keys()),
+                          'Keys':[entry['keys'] for entry in Families.values()],
+                          'kB':[round(entry['bytes']/1024, 1) for entry in Families.values()]},
+                         hide_index=True, use_container_width=True)
+            largest = sorted(sizes.items(), key=lambda item: -item[1])[:10]
+            st.dataframe({'Session State Key':[key for key, size in largest],
+                          'kB':[round(size/1024, 1) for key, size in largest]},
+                         hide_index=True, use_container_width=True)
+            for key, value in record.items():
+                if key not in ('event', 'time', 'session', 'total_ms', 'widgets', 'messages', 'bytes', 'end', 'state_bytes', 'state_keys',
+                               'widget_ids', 'state_families', 'spans'):
+                    st.caption(f'{key}: {value}')
@@ -0,0 +1,399 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Batch Command Line Interface
+#
+#   PURPOSE: Build or update schema configurations for a whole directory of Granta MI Schema workbooks without Streamlit,
+#            preview the record placement of a directory of Py MI Lab neutral files and write them into Granta MI import workbooks
+#
+#   Usage:
+#       python SchemaBatch.py init  <schema_dir> -o <output_dir>                     Write an empty configuration per workbook
+#       python SchemaBatch.py apply <schema_dir> -c <config.json> -o <output_dir>    Re-apply a configuration to updated workbooks
+#       python SchemaBatch.py place <neutral_dir> -c <config.json> [-o placements.json] Preview where neutral files would be placed
+#       python SchemaBatch.py validate <config_dir> [--version V] [-o report.json]  Check configurations against a template version
+#       python SchemaBatch.py export <neutral_dir> -c <config.json> -s <schema.xlsx> -o <output_dir>  Write Granta MI import workbooks
+#
+#   Workbooks are processed in parallel (-j) and a throughput summary is printed at the end. Configurations are written as legacy
+#   JSON unless --format compact or binary is given (see ConfigFormat); any format can be read with -c.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ImportWriter import ImportLayout, export_records
+from TabularAssembler import ALIGNMENTS, PAD
+from PlacementEngine import PlacementEngine, format_tree, preview_tree
+from SchemaCache import SchemaCache
+from ConfigFormat import FORMATS, read_config, template_fingerprint
+from ConfigValidator import count_issues, validate_config
+from SchemaConfig import init_config, load_config, save_config
+from SchemaParser import build_atts, read_workbook, sheet_index
+from SchemaUpdate import count_changes, fingerprint_schema, update_config
+from TemplateCatalog import TemplateCatalog
+from TemplateRegistry import get_registry
+
+# Set Output Naming
+CONFIG_SUFFIX = '_Config'
+
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the schema workbooks in a directory
+def find_workbooks(schema_dir):
+    paths = []
+    for name in sorted(os.listdir(schema_dir)):
+        # -- Skip Excel lock files
+        if name.lower().endswith('.xlsx') and not name.startswith('~$'):
+            paths.append(os.path.join(schema_dir, name))
+    return paths
+
+# Get the output configuration path for a workbook
+def output_path(path, output_dir, fmt='json'):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, stem + CONFIG_SUFFIX + FORMATS[fmt])
+
+# Count the Granta MI attributes
+def count_atts(Atts):
+    return len(Atts['Single Value']) + len(Atts['Functional']) + len(Atts['Tabular'])
+
+# Read the Granta MI attributes from a workbook
+# -- Returns the workbook bytes and the schema {'Atts':..., 'Sheets':...} (see SchemaCache.get_schema)
+def read_schema(path, use_cache):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if use_cache:
+        return data, SchemaCache(parallel=False).get_schema(data)
+    Sheets, Results, Single = read_workbook(data)
+    return data, {'Atts':build_atts([Results[sheet] for sheet in Sheets], Single),
+                  'Sheets':sheet_index(Results)}
+
+# Process one workbook
+# -- Returns a result dictionary, errors are reported rather than raised so one bad workbook does not stop the batch
+def process_workbook(path, output_dir, Prev_Config=None, use_cache=True, fmt='json'):
+    start = time.perf_counter()
+    result = {'workbook':path, 'output':None, 'attributes':0, 'changes':None, 'seconds':0.0, 'error':None}
+    try:
+        if Prev_Config == None:
+            data, Schema = read_schema(path, use_cache)
+            Config = init_config(Schema['Atts'])
+            Config['Fingerprints'] = fingerprint_schema(data, Schema)
+        else:
+            # -- Only the sheets that changed since the previous configuration are re-read
+            with open(path, 'rb') as f:
+                Config, Diff, Summary = update_config(Prev_Config, f.read(), parallel=False)
+            result['changes'] = count_changes(Diff)
+        result['output'] = output_path(path, output_dir, fmt)
+        save_config(Config, result['output'], fmt)
+        result['attributes'] = count_atts(Config['Atts'])
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+# Process all the workbooks in parallel
+def run_batch(paths, output_dir, Prev_Config=None, jobs=None, use_cache=True, fmt='json'):
+    os.makedirs(output_dir, exist_ok=True)
+    if jobs == 1:
+        return [process_workbook(path, output_dir, Prev_Config, use_cache, fmt) for path in paths]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(process_workbook, path, output_dir, Prev_Config, use_cache, fmt) for path in paths]
+        return [future.result() for future in futures]
+
+# Get the neutral file records in a directory
+# -- Each sub-directory is one record (e.g. the raw and analysis files of a test), otherwise each .json file is a record
+def find_records(neutral_dir):
+    records = []
+    for name in sorted(os.listdir(neutral_dir)):
+        path = os.path.join(neutral_dir, name)
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith('.json')]
+            if len(files) > 0:
+                records.append(tuple(files))
+        elif name.lower().endswith('.json'):
+            records.append(path)
+    return records
+
+# Get the display name of a record
+def record_name(record):
+    if isinstance(record, tuple):
+        return os.path.dirname(record[0])
+    return record
+
+# Print the results and throughput summary
+def print_summary(results, elapsed, out=sys.stdout):
+    failed = [r for r in results if r['error'] != None]
+    for r in results:
+        if r['error'] == None:
+            changes = '' if r['changes'] == None else f", {r['changes']} changes"
+            print(f"  {os.path.basename(r['workbook'])}: {r['attributes']} attributes{changes} in {r['seconds']:.2f} s -> {r['output']}", file=out)
+        else:
+            print(f"  {os.path.basename(r['workbook'])}: FAILED ({r['error']})", file=out)
+
+    num_atts = sum(r['attributes'] for r in results)
+    rate = len(results)/elapsed if elapsed > 0 else 0.0
+    att_rate = num_atts/elapsed if elapsed > 0 else 0.0
+    print(f'Processed {len(results)} workbooks ({len(failed)} failed), {num_atts} attributes in {elapsed:.2f} s '
+          f'({rate:.2f} workbooks/s, {att_rate:.0f} attributes/s)', file=out)
+
+#==================================================================================================================================================================
+# VALIDATION
+# Each worker process builds the template catalog once and validates its share of the configurations
+
+_worker_catalog = None
+
+# Build the template catalog once per worker process
+def _init_validator(raw_path, analysis_path):
+    global _worker_catalog
+    _worker_catalog = load_catalog(raw_path, analysis_path)
+
+# Load the template catalog
+def load_catalog(raw_path, analysis_path):
+    with open(raw_path, encoding='utf-8') as f:
+        Raw = json.load(f)
+    with open(analysis_path, encoding='utf-8') as f:
+        Analysis = json.load(f)
+    return TemplateCatalog(Raw, Analysis)
+
+# Get the configuration files in a directory
+def find_configs(config_dir):
+    paths = []
+    for name in sorted(os.listdir(config_dir)):
+        if os.path.splitext(name)[1].lower() in set(FORMATS.values()):
+            paths.append(os.path.join(config_dir, name))
+    return paths
+
+# Get the schema workbook a configuration was written for (<stem>_Config.<ext> -> <stem>.xlsx)
+def schema_path(path, schema_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem.endswith(CONFIG_SUFFIX):
+        stem = stem[:-len(CONFIG_SUFFIX)]
+    workbook = os.path.join(schema_dir, stem + '.xlsx')
+    if os.path.exists(workbook):
+        return workbook
+    return None
+
+# Validate one configuration file
+# -- Returns a report entry, unreadable files are reported as errors rather than raised
+def validate_file(path, schema_dir=None, use_cache=True, Catalog=None):
+    if Catalog == None:
+        Catalog = _worker_catalog
+    start = time.perf_counter()
+    entry = {'config':path, 'schema':None, 'template':None, 'valid':False, 'errors':0, 'warnings':0, 'issues':[], 'seconds':0.0}
+    try:
+        with open(path, 'rb') as f:
+            Config, entry['template'] = read_config(f.read())
+        Schema_Atts = None
+        if schema_dir != None:
+            entry['schema'] = schema_path(path, schema_dir)
+            if entry['schema'] != None:
+                Schema_Atts = read_schema(entry['schema'], use_cache)[1]['Atts']
+        entry['issues'] = validate_config(Config, Catalog, Schema_Atts)
+    except Exception as e:
+        entry['issues'] = [{'severity':'error', 'code':'unreadable', 'section':None, 'attribute':None, 'field':None, 'value':None,
+                            'message':f'{type(e).__name__}: {e}'}]
+    counts = count_issues(entry['issues'])
+    entry['errors'] = counts['error']
+    entry['warnings'] = counts['warning']
+    entry['valid'] = entry['errors'] == 0
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+# Validate many configuration files in parallel
+def run_validate(paths, raw_path, analysis_path, schema_dir=None, jobs=None, use_cache=True):
+    if jobs == 1 or len(paths) < 2:
+        Catalog = load_catalog(raw_path, analysis_path)
+        return [validate_file(path, schema_dir, use_cache, Catalog) for path in paths]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_validator, initargs=(raw_path, analysis_path)) as pool:
+        futures = [pool.submit(validate_file, path, schema_dir, use_cache) for path in paths]
+        return [future.result() for future in futures]
+
+#==================================================================================================================================================================
+# COMMAND LINE
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Build or update Py MI Lab schema configurations for a directory of Granta MI Schema workbooks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    # -- Common options
+    def add_jobs(sub):
+        sub.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+
+    def add_common(sub):
+        sub.add_argument('schema_dir', help='directory containing the Granta MI Schema (.xlsx) workbooks')
+        sub.add_argument('-o', '--output', required=True, help='directory to write the configuration files to')
+        add_jobs(sub)
+        sub.add_argument('--no-cache', action='store_true', help='always parse the workbooks instead of using the schema cache')
+        sub.add_argument('--format', choices=list(FORMATS.keys()), default='json', help='configuration file format (default: json)')
+
+    init = commands.add_parser('init', help='write an empty configuration for each workbook')
+    add_common(init)
+
+    apply = commands.add_parser('apply', help='re-apply an existing configuration to each workbook')
+    add_common(apply)
+    apply.add_argument('-c', '--config', required=True, help='existing configuration (.json or .pmlc) file')
+
+    place = commands.add_parser('place', help='preview the record placement of a directory of neutral files')
+    place.add_argument('neutral_dir', help='directory of neutral (.json) files, or of one sub-directory per record')
+    place.add_argument('-c', '--config', required=True, help='configuration (.json or .pmlc) file')
+    place.add_argument('-o', '--output', default=None, help='write the folder path of each record to this JSON file')
+    place.add_argument('--records', action='store_true', help='list the records in the preview tree')
+    add_jobs(place)
+
+    validate = commands.add_parser('validate', help='check configurations against a version of the Py MI Lab templates')
+    validate.add_argument('config_dir', help='directory of configuration (.json or .pmlc) files')
+    validate.add_argument('--version', default=None, help='registered template version to check against (default: Default)')
+    validate.add_argument('--raw', default=None, help='Raw_Template.json to check against instead of a registered version')
+    validate.add_argument('--analysis', default=None, help='Analysis_Template.json to check against instead of a registered version')
+    validate.add_argument('--schema-dir', default=None, help='also compare each configuration with its schema workbook (<name>.xlsx) in this directory')
+    validate.add_argument('-o', '--output', default=None, help='write the JSON report to this file')
+    validate.add_argument('--no-cache', action='store_true', help='always parse the schema workbooks instead of using the schema cache')
+    add_jobs(validate)
+
+    export = commands.add_parser('export', help='write a Granta MI import workbook per record of a directory of neutral files')
+    export.add_argument('neutral_dir', help='directory of neutral (.json) files, or of one sub-directory per record')
+    export.add_argument('-c', '--config', required=True, help='configuration (.json or .pmlc) file')
+    export.add_argument('-s', '--schema', required=True, help='Granta MI Schema (.xlsx) workbook the configuration was made for')
+    export.add_argument('-o', '--output', required=True, help='directory to write the import workbooks to')
+    export.add_argument('--version', default=None, help='registered template version used to convert units (default: Default)')
+    export.add_argument('--no-units', action='store_true', help='write the values as read, without converting them to the Granta MI units')
+    export.add_argument('--align', choices=ALIGNMENTS, default=PAD,
+                        help='how tabular arrays of different lengths are aligned: pad to the longest, truncate to the shortest, or ' +
+                             'strict (keep the length of the first mapped array and leave the others empty)')
+    add_jobs(export)
+
+    return parser
+
+# Preview the record placement of a directory of neutral files
+def run_place(args):
+    records = find_records(args.neutral_dir)
+    if len(records) == 0:
+        print(f'No neutral (.json) files found in {args.neutral_dir}', file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    engine = PlacementEngine(load_config(args.config))
+    placements = engine.place_records(records, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    names = [record_name(record) for record in records]
+    for line in format_tree(preview_tree(names, placements), show_records=args.records):
+        print(line)
+    if args.output != None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({names[i]:'/'.join(placements[i]) for i in range(len(records))}, f, indent=1)
+
+    rate = len(records)/elapsed if elapsed > 0 else 0.0
+    print(f'Placed {len(records)} records in {elapsed:.2f} s ({rate:.0f} records/s)')
+    return 0
+
+# Validate a directory of configurations and write the report
+def run_validation(args):
+    paths = find_configs(args.config_dir)
+    if len(paths) == 0:
+        print(f'No configuration (.json or .pmlc) files found in {args.config_dir}', file=sys.stderr)
+        return 1
+
+    # Get the template files of the version
+    Templates = get_registry().get(args.version)
+    raw_path = args.raw or Templates.raw_path
+    analysis_path = args.analysis or Templates.analysis_path
+
+    start = time.perf_counter()
+    entries = run_validate(paths, raw_path, analysis_path, args.schema_dir, args.jobs, not args.no_cache)
+    elapsed = time.perf_counter() - start
+
+    for entry in entries:
+        status = 'OK' if entry['valid'] else 'INVALID'
+        print(f"  {os.path.basename(entry['config'])}: {status} ({entry['errors']} errors, {entry['warnings']} warnings)")
+    invalid = sum(1 for entry in entries if not entry['valid'])
+    rate = len(entries)/elapsed if elapsed > 0 else 0.0
+    print(f'Validated {len(entries)} configurations ({invalid} invalid) in {elapsed:.2f} s ({rate:.1f} configurations/s)')
+
+    if args.output != None:
+        Report = {'templates':{'version':Templates.name if args.raw == None and args.analysis == None else None,
+                               'raw':os.path.abspath(raw_path),
+                               'analysis':os.path.abspath(analysis_path),
+                               'fingerprint':template_fingerprint(load_catalog(raw_path, analysis_path))},
+                  'summary':{'configs':len(entries),
+                             'invalid':invalid,
+                             'errors':sum(entry['errors'] for entry in entries),
+                             'warnings':sum(entry['warnings'] for entry in entries),
+                             'seconds':elapsed},
+                  'configs':entries}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(Report, f, indent=1)
+
+    if invalid > 0:
+        return 1
+    return 0
+
+# Write a Granta MI import workbook for each record of a directory of neutral files
+def run_export(args):
+    records = find_records(args.neutral_dir)
+    if len(records) == 0:
+        print(f'No neutral (.json) files found in {args.neutral_dir}', file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    Config = load_config(args.config)
+    Layout = ImportLayout(args.schema)
+    Catalog = None if args.no_units else get_registry().get(args.version).catalog
+    results = export_records(Config, Layout, records, args.output, Catalog, args.jobs, args.align)
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        name = record_name(r['record'])
+        if r['error'] == None:
+            missing = f", {len(r['missing'])} mapped attributes missing" if len(r['missing']) > 0 else ''
+            print(f"  {name}: {r['rows']} rows{missing} in {r['seconds']:.2f} s -> {r['output']}")
+            for line in r['mismatched']:
+                print(f'      length mismatch {line}')
+            for line in r['units']:
+                print(f'      not converted {line}')
+        else:
+            print(f"  {name}: FAILED ({r['error']})")
+    failed = sum(1 for r in results if r['error'] != None)
+    num_rows = sum(r['rows'] for r in results)
+    rate = len(results)/elapsed if elapsed > 0 else 0.0
+    print(f'Exported {len(results)} records ({failed} failed), {num_rows} rows in {elapsed:.2f} s ({rate:.1f} records/s)')
+
+    if failed > 0:
+        return 1
+    return 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'place':
+        return run_place(args)
+    if args.command == 'validate':
+        return run_validation(args)
+    if args.command == 'export':
+        return run_export(args)
+
+    paths = find_workbooks(args.schema_dir)
+    if len(paths) == 0:
+        print(f'No .xlsx workbooks found in {args.schema_dir}', file=sys.stderr)
+        return 1
+
+    Prev_Config = None
+    if args.command == 'apply':
+        Prev_Config = load_config(args.config)
+
+    start = time.perf_counter()
+    results = run_batch(paths, args.output, Prev_Config, args.jobs, not args.no_cache, args.format)
+    print_summary(results, time.perf_counter() - start)
+
+    if any(r['error'] != None for r in results):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
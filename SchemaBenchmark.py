@@ -0,0 +1,209 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Benchmark Suite
+#
+#   PURPOSE: Time the main operations of the Schema Configuration Manager on synthetic schemas of increasing size, and save the
+#            results so regressions can be compared between versions
+#
+#   For each size (total number of Granta MI attributes) a schema workbook and Py MI Lab template of that size are generated with
+#   SchemaGenerator, and the following are timed:
+#       parse           Read the workbook attributes (serial)
+#       parse_parallel  Read the workbook attributes with a process pool (schemas with PARALLEL_MIN_SHEETS or more sheets)
+#       config_init     Initialize an empty configuration
+#       catalog         Build the template catalog
+#       placement       Compile the record placement rules and place one record per attribute
+#       serialize       Export a fully mapped configuration as JSON
+#
+#   Usage:
+#       python SchemaBenchmark.py [--sizes 10 100 1000 5000] [--repeat 3] [-o results.json] [--compare baseline.json]
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from BenchmarkTiming import time_call
+from PlacementEngine import NOT_EQUAL, PlacementEngine
+from SchemaConfig import config_to_json, init_config
+from SchemaGenerator import generate_template, generate_values, generate_workbook, split_counts
+from SchemaParser import PARALLEL_MIN_SHEETS, PARSER_VERSION, build_atts, read_workbook
+from TemplateCatalog import TemplateCatalog
+
+# Set Benchmark Defaults
+SIZES = [10, 100, 1000, 5000]
+REPEAT = 3
+RESULTS_DIR = 'benchmark_results'
+TOLERANCE = 1.25        # Slowdown ratio reported as a regression when comparing results
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the version label of the working tree
+def version_label():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode == 0:
+            return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return 'local'
+
+# Map every attribute of a configuration to a template attribute
+def map_config(Config, Catalog):
+    single = Catalog.single.options[1:] or ['']
+    functional = Catalog.functional.options[1:] or ['']
+    tabular = Catalog.tabular.options[1:] or ['']
+    for n, att in enumerate(Config['Single Value']):
+        Config['Single Value'][att] = single[n % len(single)]
+    for n, att in enumerate(Config['Functional']):
+        Config['Functional'][att] = {'X':functional[n % len(functional)], 'Y':functional[(n + 1) % len(functional)]}
+    for n, att in enumerate(Config['Tabular']):
+        cols = Config['Tabular'][att]['GrantaCols']
+        Config['Tabular'][att]['PyCols'] = [tabular[(n + j) % len(tabular)] for j in range(len(cols))]
+    return Config
+
+# Build record placement rules over the template attributes
+# -- Level 1 names the folder after the first attribute, Level 2 has up to 20 conditional rows and a default row
+def placement_rules(names, rng):
+    rows = []
+    for k in range(min(20, len(names) - 1)):
+        rows.append(['IF', names[k], NOT_EQUAL if k % 5 == 4 else '=', rng.choice(['A', 'B', '800']), [names[k + 1]], 'Group [attribute]'])
+    rows.append(['', '', '', '', [names[-1]], '[attribute]'])
+    return {'Level 1':[['', '', '', '', [names[0]], '[attribute]']],
+            'Level 2':rows}
+
+#==================================================================================================================================================================
+# BENCHMARKS
+
+# Run the benchmarks for one size
+# -- Returns a list of {'benchmark', 'attributes', 'times'} results
+def run_size(size, repeat, work_dir, log=print):
+    rng = random.Random(size)
+    num_single, num_functional, num_tabular = split_counts(size)
+    path = os.path.join(work_dir, f'schema_{size}.xlsx')
+    generate_workbook(path, num_single, num_functional, num_tabular, seed=size)
+    with open(path, 'rb') as f:
+        data = f.read()
+    results = []
+
+    def record(name, func, n=repeat):
+        times, result = time_call(func, n)
+        results.append({'benchmark':name, 'attributes':size, 'times':times})
+        log(f'  {name:<16}{size:>8} attributes  {min(times)*1000:10.2f} ms')
+        return result
+
+    # Parse
+    def parse(parallel):
+        Sheets, Results, Single = read_workbook(data, parallel=parallel)
+        return build_atts([Results[sheet] for sheet in Sheets], Single)
+    Atts = record('parse', lambda: parse(False))
+    if num_functional + num_tabular >= PARALLEL_MIN_SHEETS:
+        record('parse_parallel', lambda: parse(True))
+
+    # Configuration and catalog
+    Config = record('config_init', lambda: init_config(Atts))
+    Template = generate_template(size, seed=size)
+    Catalog = record('catalog', lambda: TemplateCatalog(Template, {}))
+
+    # Record placement
+    names = list(Catalog.types.keys())
+    Config['Placement'] = placement_rules(names, rng)
+    Records = [generate_values(names[:22] + names[-1:], rng) for k in range(size)]
+    def place():
+        engine = PlacementEngine(Config)
+        return [engine.place(values) for values in Records]
+    record('placement', place)
+
+    # Serialization
+    map_config(Config, Catalog)
+    record('serialize', lambda: config_to_json(Config))
+    return results
+
+# Run the benchmark suite
+def run_suite(sizes, repeat, log=print):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            log(f'{size} attributes')
+            results.extend(run_size(size, repeat, work_dir, log))
+
+    # Summarize the run times
+    for result in results:
+        result['best_s'] = min(result['times'])
+        result['median_s'] = statistics.median(result['times'])
+    return {'version':version_label(),
+            'parser_version':PARSER_VERSION,
+            'python':platform.python_version(),
+            'platform':platform.platform(),
+            'cpus':os.cpu_count(),
+            'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat':repeat,
+            'results':results}
+
+# Compare a run against a baseline
+# -- Returns the comparison lines and the number of regressions (best time slower than TOLERANCE times the baseline)
+def compare_runs(Run, Baseline, tolerance=TOLERANCE):
+    base = {(r['benchmark'], r['attributes']):r['best_s'] for r in Baseline['results']}
+    lines = [f"Compared with {Baseline['version']} ({Baseline['time']})"]
+    regressions = 0
+    for r in Run['results']:
+        key = (r['benchmark'], r['attributes'])
+        if key not in base or base[key] <= 0:
+            continue
+        ratio = r['best_s']/base[key]
+        flag = ''
+        if ratio > tolerance:
+            flag = '  REGRESSION'
+            regressions = regressions + 1
+        lines.append(f'  {key[0]:<16}{key[1]:>8} attributes  {base[key]*1000:10.2f} -> {r["best_s"]*1000:10.2f} ms  x{ratio:.2f}{flag}')
+    return lines, regressions
+
+#==================================================================================================================================================================
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Schema Configuration Manager on synthetic schemas')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='total numbers of Granta MI attributes to benchmark')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='number of runs of each benchmark (the best is compared)')
+    parser.add_argument('-o', '--output', default=None, help=f'results file (default: {RESULTS_DIR}/<version>.json)')
+    parser.add_argument('--compare', default=None, help='baseline results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    Run = run_suite(args.sizes, args.repeat)
+
+    # Save the results
+    output = args.output
+    if output == None:
+        output = os.path.join(RESULTS_DIR, f"{Run['version']}.json")
+    if os.path.dirname(output) != '':
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(Run, f, indent=1)
+    print(f'Saved results to {output}')
+
+    # Compare with the baseline
+    if args.compare != None:
+        with open(args.compare, encoding='utf-8') as f:
+            Baseline = json.load(f)
+        lines, regressions = compare_runs(Run, Baseline, args.tolerance)
+        for line in lines:
+            print(line)
+        if regressions > 0:
+            print(f'{regressions} regressions')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
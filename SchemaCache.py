@@ -0,0 +1,187 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Schema Cache
+#
+#   PURPOSE: Cache parsed Granta MI Schema workbooks (Atts) so that repeat uploads of the same .xlsx file skip openpyxl completely
+#
+#   Entries are keyed by a hash of the uploaded workbook bytes and the parser version, and hold the Atts along with the attribute
+#   read from each sheet (Sheets) used for incremental updates. They are kept in memory with least recently
+#   used (LRU) eviction, shared by every session in the server process, and stored on disk as compressed JSON so they survive
+#   server restarts. Every lookup returns a copy of the entry, so a session that edits its Atts never changes the Atts of the
+#   other sessions using the same schema. Entries that would not read back from JSON exactly as they were parsed (e.g. a single
+#   value attribute named by a number, whose name JSON turns into a string) are only kept in memory.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from SchemaParser import PARSER_VERSION, build_atts, read_workbook, sheet_index
+
+# Set Cache Defaults
+# -- The cache directory can be moved with the SCHEMA_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'schemaconfiguration'))
+MAX_ENTRIES = 32
+
+logger = logging.getLogger(__name__)
+
+#==================================================================================================================================================================
+# SCHEMA CACHE
+
+class SchemaCache:
+    # -- parallel = True parses the misses of large workbooks with a process pool (see SchemaParser.read_workbook)
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES, parallel=False):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.parallel = parallel
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # Get the cache key for the workbook bytes
+    def key(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        return f'v{PARSER_VERSION}-{digest}'
+
+    # Get the path of the on-disk entry
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.json.gz')
+
+    # Get the Atts for the workbook bytes, parsing the workbook only on a miss
+    def get_atts(self, data):
+        return self.get_schema(data)['Atts']
+
+    # Get the cache entry {'Atts':..., 'Sheets':{sheet:[attribute type, attribute name]}} for the workbook bytes
+    # -- progress: called after each sheet read on a miss (see SchemaParser.read_sheets)
+    def get_schema(self, data, progress=None):
+        entry = self.lookup(data)
+        if entry != None:
+            return entry
+
+        # Parse the workbook
+        Sheets, Results, Single = read_workbook(data, parallel=self.parallel, progress=progress)
+        entry = {'Atts':build_atts([Results[sheet] for sheet in Sheets], Single),
+                 'Sheets':sheet_index(Results)}
+        self.put(data, entry)
+        return entry
+
+    # Get the cache entry for the workbook bytes from memory or disk
+    # -- Returns a copy of the entry that the caller can edit, or None on a miss
+    def lookup(self, data):
+        key = self.key(data)
+
+        # Check the memory cache
+        entry = None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits = self.memory_hits + 1
+                entry = self._entries[key]
+        if entry != None:
+            logger.info('Schema cache memory hit %s', key)
+            return copy.deepcopy(entry)
+
+        # Check the disk cache
+        entry = self._load(key)
+        if entry != None:
+            with self._lock:
+                self.disk_hits = self.disk_hits + 1
+            logger.info('Schema cache disk hit %s', key)
+            self._store(key, entry)
+            return copy.deepcopy(entry)
+
+        with self._lock:
+            self.misses = self.misses + 1
+        logger.info('Schema cache miss %s', key)
+        return None
+
+    # Add the entry parsed from the workbook bytes to the cache
+    # -- The cache keeps a copy, so the caller can go on editing the entry
+    def put(self, data, entry):
+        key = self.key(data)
+        entry = copy.deepcopy(entry)
+        self._store(key, entry)
+        self._save(key, entry)
+
+    # Get the hit and miss counters
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {'memory_hits':self.memory_hits,
+                    'disk_hits':self.disk_hits,
+                    'misses':self.misses,
+                    'hit_rate':hits/total if total > 0 else 0.0,
+                    'entries':len(self._entries)}
+
+    # Remove all cached entries from memory and disk
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json.gz'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    # Add an entry to the memory cache and evict the least recently used entries
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Load an entry from disk
+    def _load(self, key):
+        try:
+            with gzip.open(self.path(key), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning('Ignoring unreadable schema cache entry %s', key)
+            return None
+
+    # Save an entry to disk
+    # -- Written to a temporary file first so concurrent readers never see a partial entry
+    def _save(self, key, entry):
+        try:
+            text = json.dumps(entry, separators=(',', ':'))
+        except (TypeError, ValueError):
+            logger.warning('Schema %s contains values that cannot be stored as JSON, not cached on disk', key)
+            return
+        if json.loads(text) != entry:
+            logger.warning('Schema %s contains names or values that JSON would change, not cached on disk', key)
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = self.path(key) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            logger.warning('Unable to write schema cache entry %s', key)
+
+#==================================================================================================================================================================
+# SHARED CACHE
+# One cache per server process, shared by all sessions
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache == None:
+            _cache = SchemaCache()
+        return _cache
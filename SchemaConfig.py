@@ -0,0 +1,104 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Schema Configuration
+#
+#   PURPOSE: Create, update and export the configuration (Config) that maps Granta MI Schema attributes to Py MI Lab attributes
+#
+#   Config layout:
+#       Config['Single Value'][att]              = Py MI Lab attribute
+#       Config['Functional'][att]                = {'X':Py MI Lab attribute, 'Y':Py MI Lab attribute}
+#       Config['Tabular'][att]                   = {'GrantaCols':[Granta MI column, ...], 'PyCols':[Py MI Lab attribute, ...]}
+#       Config['Placement']['Level n']           = [[IF, attribute, '='/'≠', value, naming attributes, format], ...]
+#       Config['Decimation'][att]                = {'Method':..., 'Points':..., 'Tolerance':...} (optional, see CurveDecimation)
+#       Config['Atts']                           = Atts the configuration was created from
+#
+#   Configurations are saved in the legacy JSON layout above or in the compact and binary layouts of ConfigFormat.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import json
+
+from ConfigFormat import ConfigWriter, read_config
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Initialize an empty configuration for the Granta MI attributes
+def init_config(Atts):
+    Config = {}
+
+    # -- Single Attributes
+    Config['Single Value'] = {}
+    for att in Atts['Single Value'].keys():
+        Config['Single Value'][att] = ''
+
+    # -- Functional Attributes
+    Config['Functional'] = {}
+    for att in Atts['Functional'].keys():
+        Config['Functional'][att] = {}
+        Config['Functional'][att]['X'] = ''
+        Config['Functional'][att]['Y'] = ''
+
+    # -- Tabular Attributes
+    Config['Tabular'] = {}
+    for att in Atts['Tabular'].keys():
+        Config['Tabular'][att] = {}
+        Config['Tabular'][att]['GrantaCols'] = list(Atts['Tabular'][att]['Columns'])
+        Config['Tabular'][att]['PyCols'] = ['' for col in Atts['Tabular'][att]['Columns']]
+
+    # -- Save Atts for future use
+    Config['Atts'] = Atts
+
+    return Config
+
+# Apply a previous configuration to a new set of Granta MI attributes
+# -- Mappings are kept for every attribute (and tabular column) that still exists, new attributes are left empty
+def apply_config(Prev_Config, Atts):
+    Config = init_config(Atts)
+
+    # -- Single Attributes
+    for att in Config['Single Value'].keys():
+        if att in Prev_Config.get('Single Value', {}):
+            Config['Single Value'][att] = Prev_Config['Single Value'][att]
+
+    # -- Functional Attributes
+    for att in Config['Functional'].keys():
+        if att in Prev_Config.get('Functional', {}):
+            Config['Functional'][att]['X'] = Prev_Config['Functional'][att]['X']
+            Config['Functional'][att]['Y'] = Prev_Config['Functional'][att]['Y']
+
+    # -- Tabular Attributes
+    for att in Config['Tabular'].keys():
+        if att in Prev_Config.get('Tabular', {}):
+            prev_cols = dict(zip(Prev_Config['Tabular'][att]['GrantaCols'], Prev_Config['Tabular'][att]['PyCols']))
+            GrantaCols = Config['Tabular'][att]['GrantaCols']
+            for j in range(len(GrantaCols)):
+                if GrantaCols[j] in prev_cols:
+                    Config['Tabular'][att]['PyCols'][j] = prev_cols[GrantaCols[j]]
+
+    # -- Functional Curve Decimation
+    if 'Decimation' in Prev_Config:
+        Config['Decimation'] = {att:Settings for att, Settings in Prev_Config['Decimation'].items() if att in Config['Functional']}
+
+    # -- Record Placement
+    if 'Placement' in Prev_Config:
+        Config['Placement'] = Prev_Config['Placement']
+
+    return Config
+
+# Export the configuration as a JSON string
+def config_to_json(Config):
+    return json.dumps(Config)
+
+# Save the configuration to a file
+# -- fmt: 'json' (legacy layout), 'compact' or 'binary' (see ConfigFormat)
+def save_config(Config, path, fmt='json'):
+    with open(path, 'wb') as f:
+        f.write(ConfigWriter().dumps(Config, fmt))
+
+# Load a configuration from a file in any format
+def load_config(path):
+    with open(path, 'rb') as f:
+        return read_config(f.read())[0]
@@ -12,15 +12,22 @@
 # Import Modules
 # -- See requirements.txt for any specific module versions
 import time
-import json
 import streamlit as st
-from openpyxl import load_workbook
 import io
 import docx
-
-# Set Template Directories
-raw_template = "/mount/src/schemaconfiguration/Raw_Template.json"
-analysis_template = "/mount/src/schemaconfiguration/Analysis_Template.json"
+from SchemaConfig import init_config
+from ConfigFormat import FORMATS, ConfigWriter, read_config
+from ConfigJournal import ConfigJournal, cleanup_journals, journal_saved, restore_config
+from CurveDecimation import DEFAULT_POINTS as DECIMATION_POINTS, METHOD_LABELS as DECIMATION_LABELS, METHODS as DECIMATION_METHODS, MIN_POINTS as DECIMATION_MIN_POINTS
+from ConfigValidator import ERROR, clear_invalid, count_issues, repair_structure, validate_config
+from TemplateRegistry import get_registry
+from GridEditor import GRID_MIN_ROWS, mapping_grid
+from CategoryPicker import PICKER_MIN_OPTIONS, attribute_picker, attributes_picker
+from SchemaCache import get_cache
+from SchemaIngest import CANCELLED, DONE, POLL_INTERVAL, RUNNING, IngestJob
+from SchemaUpdate import format_diff
+from Profiler import RerunProfiler
+from SessionLifecycle import collect_garbage
 
 #==================================================================================================================================================================
 # GENERAL INFORMATION
@@ -29,6 +36,11 @@ analysis_template = "/mount/src/schemaconfiguration/Analysis_Template.json"
 # Set the page configuration
 st.set_page_config(layout="wide")
 
+# Start the Rerun Profiler
+# -- Each section below is timed; enable the diagnostics panel from the sidebar
+Profile = RerunProfiler()
+st.sidebar.toggle('Show Diagnostics', key = 'show_diagnostics')
+
 # Create the Title
 st.title("PyMILab Schema Configuration Manager")
 
@@ -37,9 +49,10 @@ st.markdown('The PyMILab Schema Configuration Manager is used to configure a Gra
 
 # Create Button to Download Manual
 data_path =  "/mount/src/labinfrastructure/"
-doc_download = docx.Document("/mount/src/schemaconfiguration/Py MI Lab Schema Configuration Manager User Manual.docx")
-bio = io.BytesIO()
-doc_download.save(bio)
+with Profile.span('manual'):
+    doc_download = docx.Document("/mount/src/schemaconfiguration/Py MI Lab Schema Configuration Manager User Manual.docx")
+    bio = io.BytesIO()
+    doc_download.save(bio)
 st.download_button(
             label="Download the User's Manual",
             data=bio.getvalue(),
@@ -59,15 +72,44 @@ if "excel_flag" not in st.session_state:
     instruct1.markdown("Upload either a new Excel (.xlsx) file to configure a new schema or a previous Configuration (.json) file to " +  
                        "load a previous configuration. For new configurations, enter a unique schema configuration name.")
 
+    # Offer to Restore the Configuration of a Session that Dropped
+    # -- The session ID is kept in the page URL, so reloading the page finds the journal of the session (see ConfigJournal)
+    session_id = st.experimental_get_query_params().get('session', [None])[0]
+    saved = journal_saved(session_id) if session_id != None else None
+    if saved != None:
+        st.info(f"A configuration in progress was saved on {time.strftime('%Y-%m-%d at %H:%M', time.localtime(saved))}. " +
+                "Restore it to continue where you left off, or upload a file to start a new configuration.")
+        if st.button('Restore Configuration', key = 'journal_restore'):
+            with Profile.span('restore'):
+                Config, Info = restore_config(session_id)
+            if Config != None:
+                st.session_state['Config'] = Config
+                st.session_state['Atts'] = Config['Atts']
+                st.session_state['Journal_Session'] = session_id
+                st.session_state['excel_flag'] = 0
+                st.session_state['json_flag'] = 2
+                Profile.rerun()
+            st.error('Unable to restore the configuration, please upload a file instead.')
+
     # Create File Uploader Button
     file = st.empty()
-    filename = file.file_uploader('Upload a Excel Schema or Configuration File', type = ['xlsx','json'],
+    filename = file.file_uploader('Upload a Excel Schema or Configuration File', type = ['xlsx','json','pmlc'],
                             accept_multiple_files = False, key = "file")
 
+    # Select the Py MI Lab Template Version
+    # -- Only shown when more than one version is registered (see TemplateRegistry)
+    versions = get_registry().names()
+    if len(versions) > 1:
+        st.session_state['Template_Version'] = st.selectbox('Py MI Lab Template Version', versions, key = 'template_version')
+
     if filename != None:
         if 'xlsx' in st.session_state['file'].name:
             st.session_state['excel_flag'] = 1
             st.session_state['json_flag'] = 0
+
+            # Optionally update a previous configuration to the new schema
+            st.file_uploader('Optional: upload a previous Configuration (.json or .pmlc) file to update it to this schema', type = ['json','pmlc'],
+                             accept_multiple_files = False, key = "prev_config")
         else:
             st.session_state['excel_flag'] = 0
             st.session_state['json_flag'] = 1
@@ -79,97 +121,58 @@ if "excel_flag" not in st.session_state:
 else:
     # Excel file - new configuration from Granta MI Schema
     if st.session_state['excel_flag'] == 1:
-        # Set Flag to 2 - prevents rereading of input file
-        st.session_state['excel_flag'] = 2 
-        
-        # Read The Excel File and Get MI Attributes
-        wb = load_workbook(st.session_state['file'], data_only=True, read_only=True) 
-        # Get List of Sheets
-        Sheets = [] 
-        i = 0 
-        while wb.sheetnames[i] != 'Data':
-            Sheets.append(wb.sheetnames[i])
-            i=i+1
-        Sheets.append('Data')
-
-        # Get List of Attributes
-        # -- Preallocate dictionary to store Granta MI Attribute names
-        Atts = {'Single Value':{},
-                'Functional':{},
-                'Tabular':{}}
-
-        # -- Read the tabular and functional data attributes
-        for i in range(len(Sheets)-1):
-            # Open the sheet
-            ws = wb[Sheets[i]]
-
-            # Get the attribute name
-            att_name = ws.cell(row=4,column=2).value
-
-            # Determine if the attribute is functional or tabular
-            # -- 0 = functional
-            # -- 1 = tabular
-            att_flag = 0
-            if ws.cell(row=7,column = 3).value == 'Row Number':
-                att_flag = 1
-                row_num = 7
-
-            # Get Functional Data Information
-            if att_flag == 0:
-                # Get X and Y Names
-                x_name = ws.cell(row = 8,column=3).value
-                y_name = ws.cell(row = 8,column=4).value
-
-                # Check for Units
-                x_att = x_name
-                x_unit = None
-                if x_name[-1] == ')':
-                    idx = x_name.index("(")
-                    x_att = x_name[:idx-1]
-                    x_unit = x_name[idx+1:len(x_name)-1]
-
-                y_att = y_name
-                y_unit = None
-                if y_name[-1] == ')':
-                    idx = y_name.index("(")
-                    y_att = y_name[:idx-1]
-                    y_unit = y_name[idx+1:len(y_name)-1]
-
-                Atts['Functional'][att_name] = {'Variables':[x_att, y_att],
-                                                'Units':[x_unit, y_unit]}
-
-            # Get Tabular Data Information
+        # Start Reading the Excel File on a Worker Thread
+        # -- The page reruns while the job runs so it stays responsive, and the job is kept until it finishes
+        if 'Ingest_Job' not in st.session_state:
+            Prev_Config = None
+            if st.session_state.get('prev_config') != None:
+                # -- Update the previous configuration: only changed sheets are re-read and all unaffected mappings are kept
+                Prev_Config, st.session_state['Config_Template'] = read_config(st.session_state['prev_config'].getvalue())
+            st.session_state['Ingest_Job'] = IngestJob(st.session_state['file'].getvalue(), Prev_Config, get_cache()).start()
+        Job = st.session_state['Ingest_Job']
+
+        # Show the Progress Until the Job Finishes
+        if Job.state != DONE:
+            done, total = Job.progress()
+            if Job.state == RUNNING:
+                if total == 0:
+                    st.progress(0.0, text = 'Opening the schema workbook...')
+                else:
+                    st.progress(done/total, text = f'Reading the schema workbook: {done} of {total} sheets')
+                if st.button('Cancel', key = 'ingest_cancel'):
+                    Job.cancel()
+                time.sleep(POLL_INTERVAL)
+                Profile.rerun({'ingest':[done, total]})
+            elif Job.state == CANCELLED:
+                st.warning(f'Reading the schema workbook was cancelled after {done} of {total} sheets.')
+                if st.button('Resume', key = 'ingest_resume'):
+                    Job.start()
+                    Profile.rerun()
             else:
-                # Get the editable column names (don't include row number)
-                cols = []
-                units = []
-                col_num = 4
-                while ws.cell(row=row_num,column=col_num).value != None:
-                    # Get the color of cell
-                    clr = ws.cell(row=row_num,column=col_num).fill.start_color.index 
-                    if clr == 'FFFFFF00':
-                        # Check for associated units
-                        row_name = ws.cell(row=row_num,column=col_num).value
-                        row_att = row_name
-                        row_unit = None
-                        if row_name[-1] == ')':
-                            idx = row_name.index("(")
-                            row_att = row_name[:idx-1]
-                            row_unit = row_name[idx+1:len(row_name)-1]
-
-                        cols.append(row_att)
-                        units.append(row_unit)
-                    col_num = col_num+1
-                Atts['Tabular'][att_name] = {'Columns':cols,
-                                                'Units':units}
-
-        # -- Get The Single Value Attributes
-        ws = wb['Data']
-
-        for k in range(10, ws.max_row+1):
-            # Check the color for a header
-            if ws.cell(row=k,column=3).fill.start_color.index == 'FFFFFFFF' and ws.cell(row=k,column=3).value != None:
-                Atts['Single Value'][ws.cell(row=k,column=3).value]= ws.cell(row=k,column=4).value
+                st.error(f'Unable to read the schema workbook: {Job.error}')
+
+            # -- Go back to the file selection
+            if st.button('Start Over', key = 'ingest_restart'):
+                for key in ['excel_flag', 'json_flag', 'Ingest_Job', 'Config_Template']:
+                    st.session_state.pop(key, None)
+                Profile.rerun()
+            Profile.stop()
+
+        # Set Flag to 2 - prevents rereading of input file
+        st.session_state['excel_flag'] = 2
+        del st.session_state['Ingest_Job']
+        Result = Job.result
+        if 'Config' in Result:
+            st.session_state['Config'] = Result['Config']
+            st.session_state['Schema_Diff'] = Result['Schema_Diff']
+            st.session_state['Schema_Summary'] = Result['Schema_Summary']
+            Atts = Result['Config']['Atts']
+
+            # -- Load the previous record placement
+            st.session_state['json_flag'] = 2
+        else:
+            Atts = Result['Atts']
+            st.session_state['Fingerprints'] = Result['Fingerprints']
 
         # Store the Granta MI Attributes in the session state
         st.session_state['Atts'] = Atts
@@ -180,195 +183,217 @@ else:
         st.session_state['json_flag'] = 2
 
         # Load the Previous Configuration
-        Prev_Config = json.load(st.session_state['file'])
+        # -- Legacy JSON, compact JSON and binary configuration files are all accepted
+        with Profile.span('load_config'):
+            Prev_Config, st.session_state['Config_Template'] = read_config(st.session_state['file'].getvalue())
         st.session_state['Config'] = Prev_Config
 
         # Get the Atts List
-        st.session_state['Atts'] = Prev_Config['Atts']
-
-
-    # Load the Raw and Analysis Template File
-    if 'Raw' not in st.session_state:
-        f = open(raw_template)
-        Raw = json.load(f)
-        st.session_state['Raw'] = Raw
+        # -- A configuration without Atts is reported by the validation below
+        st.session_state['Atts'] = Prev_Config.get('Atts')
 
-    if 'Analysis' not in st.session_state:
-        f = open(analysis_template)
-        Analysis = json.load(f)
-        st.session_state['Analysis'] = Analysis
 
     # Load Atts
     Atts = st.session_state['Atts']
-    Raw = st.session_state['Raw']
-    Analysis = st.session_state['Analysis']
+
+    # Get the Raw and Analysis Templates and their Catalog of Py MI Lab Attributes
+    # -- Loaded once per server process and shared by every session, reloaded when the template files change
+    with Profile.span('templates'):
+        Templates = get_registry().get(st.session_state.get('Template_Version'))
+    Catalog = Templates.catalog
+
+    # Pick Py MI Lab Attributes by Category
+    # -- Each picker then only sends the attributes of one category to the browser (see CategoryPicker)
+    pickers = st.sidebar.toggle('Category pickers', value = len(Catalog.single) > PICKER_MIN_OPTIONS, key = 'category_pickers')
+
+    # Re-validate the configuration when the templates were reloaded
+    if st.session_state.get('Template_Fingerprint') != Templates.fingerprint:
+        if 'Template_Fingerprint' in st.session_state:
+            st.session_state.pop('Config_Issues', None)
+        st.session_state['Template_Fingerprint'] = Templates.fingerprint
+
+    # Create the Configuration Writer
+    # -- Mappings are saved against the fingerprint of the templates
+    if 'Writer' not in st.session_state:
+        st.session_state['Writer'] = ConfigWriter()
+    Writer = st.session_state['Writer']
+    Writer.template = Templates.fingerprint
+    if st.session_state.get('Config_Template') not in (None, Writer.template):
+        st.warning('This configuration was created with different Py MI Lab templates. Check that every mapped attribute still exists.')
 
     # Initialize the Configuration JSON
     if 'Config' not in st.session_state:
-        Config = {}
-
-        # -- Single Attributes
-        Config['Single Value'] = {}
-        single_atts = list(Atts['Single Value'].keys())
-        for i in range(len(single_atts)):
-            Config['Single Value'][single_atts[i]] = ''
-
-        # -- Functional Attributes
-        Config['Functional'] = {}
-        func_atts = list(Atts['Functional'].keys())
-        for i in range(len(func_atts)):
-            Config['Functional'][func_atts[i]] = {}
-            Config['Functional'][func_atts[i]]['X'] = ''
-            Config['Functional'][func_atts[i]]['Y'] = ''
-
-        # -- Tabular Attributes
-        Config['Tabular'] = {}
-        tab_atts = list(Atts['Tabular'].keys())
-        for i in range(len(tab_atts)):
-            Config['Tabular'][tab_atts[i]] = {}
-            Config['Tabular'][tab_atts[i]]['GrantaCols'] = Atts['Tabular'][tab_atts[i]]['Columns']
-            temp = []
-            for j in range(len(Atts['Tabular'][tab_atts[i]]['Columns'])):
-                temp.append('')
-            Config['Tabular'][tab_atts[i]]['PyCols'] = temp
-
-        # -- Save Atts for future use
-        Config['Atts'] = st.session_state['Atts']
-
-        st.session_state['Config'] = Config
+        st.session_state['Config'] = init_config(st.session_state['Atts'])
+        if 'Fingerprints' in st.session_state:
+            st.session_state['Config']['Fingerprints'] = st.session_state['Fingerprints']
+
+    # Start the Configuration Journal
+    # -- Every edit is saved on the server so the configuration can be restored from the page URL if the session drops
+    if 'Journal' not in st.session_state:
+        Journal = ConfigJournal(st.session_state.get('Journal_Session'))
+        st.session_state['Journal'] = Journal.start(st.session_state['Config'])
+        st.experimental_set_query_params(session = Journal.session_id)
+        cleanup_journals()
+    Journal = st.session_state['Journal']
+
+    # Validate the Configuration
+    # -- Mappings to Py MI Lab attributes that no longer exist (or have the wrong type) are cleared so they can be re-mapped
+    # -- Missing and malformed mappings are re-initialised from Atts so the editors can index every attribute
+    if 'Config_Issues' not in st.session_state:
+        with Profile.span('validate'):
+            issues = validate_config(st.session_state['Config'], Catalog)
+            st.session_state['Config_Cleared'] = clear_invalid(st.session_state['Config'], issues)
+            st.session_state['Config_Repaired'] = repair_structure(st.session_state['Config'], issues)
+        st.session_state['Config_Issues'] = issues
+    if st.session_state['Config_Repaired'] == None:
+        st.error('The configuration cannot be edited because its schema attributes (Atts) are missing or malformed. ' +
+                 'Upload the Granta MI Schema workbook to start a new configuration.')
+        st.markdown('\n'.join('- ' + item['message'] for item in st.session_state['Config_Issues'] if item['severity'] == ERROR))
+        Profile.stop()
+    if len(st.session_state['Config_Issues']) > 0:
+        counts = count_issues(st.session_state['Config_Issues'])
+        with st.expander(f"Configuration Issues ({counts['error']} errors, {counts['warning']} warnings)", expanded = counts['error'] > 0):
+            if st.session_state['Config_Cleared'] > 0:
+                st.markdown(f"{st.session_state['Config_Cleared']} invalid mappings were cleared and need to be re-mapped.")
+            if st.session_state['Config_Repaired'] > 0:
+                st.markdown(f"{st.session_state['Config_Repaired']} missing or malformed mappings were reset from the schema attributes.")
+            st.markdown('\n'.join(('- **Error:** ' if item['severity'] == ERROR else '- Warning: ') + item['message']
+                                   for item in st.session_state['Config_Issues']))
+
+    # Suggest Mappings
+    # -- Fill the empty mappings with the closest matching Py MI Lab attribute of a compatible type
+    if st.button('Auto-Map Attributes', help = 'Fill empty mappings with the closest matching Py MI Lab attribute'):
+        with Profile.span('auto_map'):
+            filled = Templates.mapper().auto_map(st.session_state['Config'], Atts)
+
+        # -- Clear the mapping widgets so they are recreated from the updated configuration
+        for key in list(st.session_state.keys()):
+            if key.startswith(('single_val_b_', 'func_b_', 'func_c_', 'tab_b_', 'single_grid_grid_', 'func_grid_grid_')):
+                del st.session_state[key]
+        st.success(f'Auto-mapped {filled} attributes')
+
+    # Show the Changes from the Previous Configuration's Schema
+    if 'Schema_Diff' in st.session_state:
+        with st.expander('Schema Changes'):
+            Summary = st.session_state['Schema_Summary']
+            st.markdown(f"Re-read {len(Summary['reparsed'])} of {Summary['sheets']} attribute sheets" +
+                        (" and the Data sheet" if Summary['data_reparsed'] else "") + ".")
+            changes = format_diff(st.session_state['Schema_Diff'])
+            if len(changes) == 0:
+                st.markdown('No attribute changes.')
+            else:
+                st.markdown('\n'.join('- ' + line for line in changes))
 
-    with st.expander('Single Value Attributes'):
+    with st.expander('Single Value Attributes'), Profile.span('single_value'):
         # Get List of Schema Attributes
         atts = list(Atts['Single Value'].keys())
         Config = st.session_state['Config']
 
-         # Get List of all JSON Attributes
-        if 'single_json' not in st.session_state:
-            JSON_atts = ['']
-            # -- Raw Data
-            Raw_cat = list(Raw.keys())
-            for j in range(len(Raw_cat)):
-                Raw_att = list(Raw[Raw_cat[j]].keys())
-                for k in range(len(Raw_att)):
-                    if Raw[Raw_cat[j]][Raw_att[k]]['Type'] == 'point'or Raw[Raw_cat[j]][Raw_att[k]]['Type'] == 'string':
-                        att_name = Raw_cat[j] + ' - ' + Raw_att[k]
-                        JSON_atts.append(att_name)
-    
-            # -- Analysis Data
-            Analysis_cat = list(Analysis.keys())
-            for j in range(len(Analysis_cat)):
-                Analysis_att = list(Analysis[Analysis_cat[j]].keys())
-                for k in range(len(Analysis_att)):
-                    if Analysis[Analysis_cat[j]][Analysis_att[k]]['Type'] == 'point'or Analysis[Analysis_cat[j]][Analysis_att[k]]['Type'] == 'string':
-                        att_name = Analysis_cat[j] + ' - ' + Analysis_att[k]
-                        JSON_atts.append(att_name)
-            st.session_state['single_json'] = JSON_atts
-        JSON_atts = st.session_state['single_json'] 
+        # Get List of all JSON Attributes
+        JSON_view = Catalog.single
         
         # Create the table
-        single_grid = st.empty()
-        grid = single_grid.columns(2)
+        # -- The grid editor only renders the visible page of attributes
+        grid_mode = st.toggle('Grid editor', value = len(atts) > GRID_MIN_ROWS, key = 'single_grid_mode')
+        if grid_mode:
+            mapping_grid(Config, 'Single Value', atts, [('Py MI Lab Attribute', None)], JSON_view, 'single_grid')
+            st.session_state['Config'] = Config
+        else:
+            single_grid = st.empty()
+            grid = single_grid.columns(2)
 
-        for i in range(len(atts)):
-            with grid[0]:
-                if i == 0:
-                    st.text_input('Database Attribute',value = atts[i], key = f'single_val_a_{i}')
-                else:
-                    st.text_input('Database Attribute',value = atts[i], key = f'single_val_a_{i}',label_visibility = "collapsed")
-            with grid[1]:
-                if i == 0:
-                    st.selectbox('Py MI Lab Attribute', JSON_atts, index = JSON_atts.index(Config['Single Value'][atts[i]]), key=f'single_val_b_{i}')
-                else:
-                    st.selectbox('Py MI Lab Attribute', JSON_atts, index = JSON_atts.index(Config['Single Value'][atts[i]]), key=f'single_val_b_{i}',label_visibility = "collapsed")
+            for i in range(len(atts)):
+                with grid[0]:
+                    if i == 0:
+                        st.text_input('Database Attribute',value = atts[i], key = f'single_val_a_{i}')
+                    else:
+                        st.text_input('Database Attribute',value = atts[i], key = f'single_val_a_{i}',label_visibility = "collapsed")
+                with grid[1]:
+                    attribute_picker('Py MI Lab Attribute', JSON_view, Config['Single Value'][atts[i]], f'single_val_b_{i}', pickers,
+                                     label_visibility = 'visible' if i == 0 else 'collapsed')
 
-        # Save the data
-        Config = st.session_state['Config']
-        for i in range(len(atts)):
-            Config['Single Value'][atts[i]] = st.session_state[f'single_val_b_{i}']
-        st.session_state['Config'] = Config
+            # Save the data
+            Config = st.session_state['Config']
+            for i in range(len(atts)):
+                Config['Single Value'][atts[i]] = st.session_state[f'single_val_b_{i}']
+            st.session_state['Config'] = Config
 
-    with st.expander('Functional Attributes'):
+    with st.expander('Functional Attributes'), Profile.span('functional'):
         # Get List of Schema Attributes
         atts = list(Atts['Functional'].keys())
 
         # Get List of all JSON Attributes
-        if 'func_json' not in st.session_state:
-            JSON_atts = ['']
-            # -- Raw Data
-            Raw_cat = list(Raw.keys())
-            for j in range(len(Raw_cat)):
-                Raw_att = list(Raw[Raw_cat[j]].keys())
-                for k in range(len(Raw_att)):
-                    if Raw[Raw_cat[j]][Raw_att[k]]['Type'] == 'point array':
-                        att_name = Raw_cat[j] + ' - ' + Raw_att[k]
-                        JSON_atts.append(att_name)
-    
-             # -- Analysis Data
-            Analysis_cat = list(Analysis.keys())
-            for j in range(len(Analysis_cat)):
-                Analysis_att = list(Analysis[Analysis_cat[j]].keys())
-                for k in range(len(Analysis_att)):
-                    if Analysis[Analysis_cat[j]][Analysis_att[k]]['Type'] == 'point array':
-                        att_name = Analysis_cat[j] + ' - ' + Analysis_att[k]
-                        JSON_atts.append(att_name)
-            st.session_state['func_json'] = JSON_atts
-        JSON_atts = st.session_state['func_json']
+        JSON_view = Catalog.functional
 
         # Create the table
-        single_grid = st.empty()
-        grid = single_grid.columns(3)
-
-        for i in range(len(atts)):
-            with grid[0]:
-                if i == 0:
-                    st.text_input('Database Attribute',value = atts[i], key = f'func_a_{i}')
-                else:
-                    st.text_input('Database Attribute',value = atts[i], key = f'func_a_{i}',label_visibility = "collapsed")
-            with grid[1]:
-                if i == 0:
-                    st.selectbox('X - Py MI Lab Attribute', JSON_atts, index = JSON_atts.index(Config['Functional'][atts[i]]['X']), key=f'func_b_{i}')
-                else:
-                    st.selectbox('X - Py MI Lab Attribute', JSON_atts, index = JSON_atts.index(Config['Functional'][atts[i]]['X']), key=f'func_b_{i}',label_visibility = "collapsed")
-            with grid[2]:
-                if i == 0:
-                    st.selectbox('Y - Py MI Lab Attribute', JSON_atts, index = JSON_atts.index(Config['Functional'][atts[i]]['Y']), key=f'func_c_{i}')
-                else:
-                    st.selectbox('Y - Py MI Lab Attribute', JSON_atts, index = JSON_atts.index(Config['Functional'][atts[i]]['Y']), key=f'func_c_{i}',label_visibility = "collapsed")
+        # -- The grid editor only renders the visible page of attributes
+        grid_mode = st.toggle('Grid editor', value = len(atts) > GRID_MIN_ROWS, key = 'func_grid_mode')
+        if grid_mode:
+            mapping_grid(Config, 'Functional', atts, [('X - Py MI Lab Attribute', 'X'), ('Y - Py MI Lab Attribute', 'Y')], JSON_view, 'func_grid')
+            st.session_state['Config'] = Config
+        else:
+            single_grid = st.empty()
+            grid = single_grid.columns(3)
 
-        # Save the data
-        Config = st.session_state['Config']
-        for i in range(len(atts)):
-            Config['Functional'][atts[i]]['X'] = st.session_state[f'func_b_{i}']
-            Config['Functional'][atts[i]]['Y'] = st.session_state[f'func_c_{i}']
-        st.session_state['Config'] = Config
+            for i in range(len(atts)):
+                with grid[0]:
+                    if i == 0:
+                        st.text_input('Database Attribute',value = atts[i], key = f'func_a_{i}')
+                    else:
+                        st.text_input('Database Attribute',value = atts[i], key = f'func_a_{i}',label_visibility = "collapsed")
+                with grid[1]:
+                    attribute_picker('X - Py MI Lab Attribute', JSON_view, Config['Functional'][atts[i]]['X'], f'func_b_{i}', pickers,
+                                     label_visibility = 'visible' if i == 0 else 'collapsed')
+                with grid[2]:
+                    attribute_picker('Y - Py MI Lab Attribute', JSON_view, Config['Functional'][atts[i]]['Y'], f'func_c_{i}', pickers,
+                                     label_visibility = 'visible' if i == 0 else 'collapsed')
+
+            # Save the data
+            Config = st.session_state['Config']
+            for i in range(len(atts)):
+                Config['Functional'][atts[i]]['X'] = st.session_state[f'func_b_{i}']
+                Config['Functional'][atts[i]]['Y'] = st.session_state[f'func_c_{i}']
+            st.session_state['Config'] = Config
 
+        # Set the Curve Decimation
+        # -- Long curves are reduced to fewer points when import workbooks are written (see CurveDecimation)
+        if len(atts) > 0:
+            Config = st.session_state['Config']
+            Decimation = Config.get('Decimation', {})
+            st.markdown(f'**Curve Decimation** ({len(Decimation)} of {len(atts)} attributes decimated)')
+            dec_grid = st.columns(4)
+            with dec_grid[0]:
+                i = atts.index(st.selectbox('Functional Attribute', atts, key = 'func_dec_att'))
+            Settings = Decimation.get(atts[i], {})
+            with dec_grid[1]:
+                methods = [''] + list(DECIMATION_METHODS)
+                labels = [DECIMATION_LABELS[m] for m in methods]
+                method = methods[labels.index(st.selectbox('Method', labels, index = methods.index(Settings.get('Method', '')),
+                                                           key = f'func_dec_m_{i}'))]
+            with dec_grid[2]:
+                points = st.number_input('Points', min_value = DECIMATION_MIN_POINTS, value = Settings.get('Points') or DECIMATION_POINTS,
+                                         step = 100, key = f'func_dec_p_{i}', help = 'Target number of points (the upper limit for the tolerance method)')
+            with dec_grid[3]:
+                tolerance = st.number_input('Tolerance', min_value = 0.0, value = float(Settings.get('Tolerance', 0.0)),
+                                            key = f'func_dec_t_{i}', help = 'Largest Y distance of a removed point (tolerance method)')
+
+            # Save the data
+            if method == '':
+                Decimation.pop(atts[i], None)
+            else:
+                Decimation[atts[i]] = {'Method':method, 'Points':int(points), 'Tolerance':float(tolerance)}
+            if len(Decimation) > 0:
+                Config['Decimation'] = Decimation
+            else:
+                Config.pop('Decimation', None)
+            st.session_state['Config'] = Config
 
     if 'tab_exp' not in st.session_state:
             st.session_state['tab_exp'] = False
     else:
         st.session_state['tab_exp'] = True
 
-    if 'tab_json' not in st.session_state:
-        JSON_atts = ['']
-        # -- Raw Data
-        Raw_cat = list(Raw.keys())
-        for j in range(len(Raw_cat)):
-            Raw_att = list(Raw[Raw_cat[j]].keys())
-            for k in range(len(Raw_att)):
-                if Raw[Raw_cat[j]][Raw_att[k]]['Type'] != 'dict':
-                    att_name = Raw_cat[j] + ' - ' + Raw_att[k]
-                    JSON_atts.append(att_name)
-    
-        # -- Analysis Data
-        Analysis_cat = list(Analysis.keys())
-        for j in range(len(Analysis_cat)):
-            Analysis_att = list(Analysis[Analysis_cat[j]].keys())
-            for k in range(len(Analysis_att)):
-                if Analysis[Analysis_cat[j]][Analysis_att[k]]['Type'] != 'dict':
-                    att_name = Analysis_cat[j] + ' - ' + Analysis_att[k]
-                    JSON_atts.append(att_name)
-        st.session_state['tab_json'] = JSON_atts
-    JSON_atts = st.session_state['tab_json']
+    JSON_view = Catalog.tabular
 
     def update_tab():
         with st.expander('Tabular Attributes', expanded = st.session_state['tab_exp']):
@@ -392,9 +417,6 @@ else:
             if 'prev_opt' not in st.session_state:
                 st.session_state['prev_opt'] = tab_att_opt
 
-            if "col_names" not in st.session_state:
-                st.session_state["col_names"] = {}
-
             # Initialize the table
             if "tab_init" not in st.session_state:
                 st.session_state["tab_init"] = True
@@ -414,7 +436,9 @@ else:
                 st.session_state["ct"] = st.session_state["ct"]+1
 
             tab_cols = st.columns(2)
-            D = st.session_state["col_names"]
+
+            # -- Placeholders only live for this rerun, so they are not kept in the session state
+            D = {}
 
             for i in range(len(GrantaCols)):
                 col_vals.append('')
@@ -427,20 +451,12 @@ else:
                     else:
                         col_vals[i] = D["var1_" + str(i)].text_input('Database Attribute',value = GrantaCols[i], key = f'tab_a_{st.session_state["ct"]+i}', label_visibility="collapsed")
                 with tab_cols[1]:
-                    D["var2_" + str(i)]= st.empty()
-
-                    # Get index
-                    if PyCols[i] == None:
-                        idx = None
-                    else:
-                        idx = JSON_atts.index(PyCols[i])
-                    
                     if i == 0:
-                        new_vals[i] = D["var2_" + str(i)].selectbox('Py MI Lab Attribute',JSON_atts,index = idx, key = f'tab_b_{st.session_state["ct"]+i}')
+                        new_vals[i] = attribute_picker('Py MI Lab Attribute', JSON_view, PyCols[i], f'tab_b_{st.session_state["ct"]+i}', pickers)
                     else:
-                        new_vals[i] = D["var2_" + str(i)].selectbox('Database Attribute',JSON_atts, index = idx, key = f'tab_b_{st.session_state["ct"]+i}', label_visibility="collapsed")
+                        new_vals[i] = attribute_picker('Database Attribute', JSON_view, PyCols[i], f'tab_b_{st.session_state["ct"]+i}', pickers,
+                                                       label_visibility = 'collapsed')
 
-                st.session_state["col_names"] = D            
                 st.session_state['change_opt'] = False
 
             if st.session_state['prev_opt'] != st.session_state['tab_att_opt']:
@@ -455,9 +471,10 @@ else:
             st.session_state['Config'] = Config
 
     # Update Tabular Attributes
-    update_tab()
+    with Profile.span('tabular'):
+        update_tab()
 
-    with st.expander('Record Placement'):
+    with st.expander('Record Placement'), Profile.span('placement'):
         #Re-open Config
         Config = st.session_state['Config']
 
@@ -493,9 +510,11 @@ else:
                         if st.session_state['placement_flags'] > 0:
                             if 'Level ' + str(m+1) in list(Config['Placement'].keys()):
                                 if len(Config['Placement']['Level ' + str(m+1)]) > n:
-                                    if Config['Placement']['Level ' + str(m+1)][n][1] != None:
-                                        idx = st.session_state['single_json'].index(Config['Placement']['Level ' + str(m+1)][n][1])
-                    st.selectbox('Conditional Attribute', st.session_state['single_json'], index=idx, placeholder = "Select the conditional attribute", key = f'folder_sec_b_{m}_{n}', label_visibility="collapsed")
+                                    idx = Config['Placement']['Level ' + str(m+1)][n][1]
+                    # -- The current selection is kept on every rerun, so browsing another category does not clear it
+                    idx = st.session_state.get(f'folder_sec_b_{m}_{n}', idx)
+                    attribute_picker('Conditional Attribute', Catalog.single, idx, f'folder_sec_b_{m}_{n}', pickers,
+                                     label_visibility = 'collapsed', placeholder = 'Select the conditional attribute')
                 with grid_sec[2]:
                     idx = 0
                     if 'placement_flags' in st.session_state:
@@ -522,7 +541,10 @@ else:
                         if 'Level ' + str(m+1) in list(Config['Placement'].keys()):
                             if len(Config['Placement']['Level ' + str(m+1)]) > n:
                                 idx = Config['Placement']['Level ' + str(m+1)][n][4]
-                st.multiselect('Conditional Attribute', st.session_state['single_json'], default= idx , placeholder = "Select the naming attribute and format", key = f'folder_sec_e_{m}_{n}', label_visibility="collapsed")
+                # -- The current selection is kept on every rerun, so browsing another category does not clear it
+                idx = st.session_state.get(f'folder_sec_e_{m}_{n}', idx)
+                attributes_picker('Conditional Attribute', Catalog.single, idx, f'folder_sec_e_{m}_{n}', pickers,
+                                  label_visibility = 'collapsed', placeholder = 'Select the naming attribute and format')
             with grid_sec[5]:
                 # Determine if a value previously exists
                 idx = '[attribute]'
@@ -606,13 +628,28 @@ else:
         st.session_state['Config'] = Config
 
     # Create the config file
-    json_string = json.dumps(st.session_state['Config'])
+    # -- JSON is the layout read by Py MI Lab, Compact JSON and Binary are smaller files that load back into this tool
+    file_formats = {'JSON':'json', 'Compact JSON':'compact', 'Binary':'binary'}
+    file_format = st.selectbox('Configuration File Format', list(file_formats.keys()), key = 'file_format')
+    fmt = file_formats[file_format]
+    # -- The edits of this rerun are journaled, and the file is only encoded again when something changed
+    with Profile.span('serialize'):
+        Journal.sync(st.session_state['Config'])
+        config_data = Journal.dumps(st.session_state['Config'], Writer, fmt)
 
     #st.json(json_string, expanded=True)
     
     st.download_button(
         label="Download Configuration File",
-        file_name="New_Schema_Config.json",
-        mime="application/json",
-        data=json_string,
+        file_name="New_Schema_Config" + FORMATS[fmt],
+        mime="application/octet-stream" if fmt == 'binary' else "application/json",
+        data=config_data,
     )
+
+# Remove the Widget Keys of Editors Not Shown in this Rerun
+Collected = collect_garbage()
+
+# Record the Rerun
+# -- Logged as one JSON line per rerun with the schema cache, template registry and configuration journal statistics
+Profile.finish({'cache':get_cache().stats(), 'templates':get_registry().stats(), 'collected':Collected,
+                'journal':st.session_state['Journal'].stats() if 'Journal' in st.session_state else None})
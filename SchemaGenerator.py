@@ -0,0 +1,231 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Synthetic Schema Generator
+#
+#   PURPOSE: Write synthetic Granta MI Schema workbooks, Py MI Lab templates and neutral records of any size for benchmarking and
+#            load testing the Schema Configuration Manager
+#
+#   The workbooks follow the layout read by SchemaParser: one sheet per functional or tabular attribute before the Data sheet,
+#   the attribute name in B4, 'Row Number' in C7 with the yellow (editable) and grey column headers of tabular attributes, the
+#   X and Y headers with units in row 8 of functional attributes, and the single value attributes from row 10 of the Data sheet
+#   with white filled names between grey section headers. The workbooks are written with a normal (not write-only) openpyxl
+#   Workbook, so each sheet has its <dimension> like a real schema export and can be read by any version of the parser.
+#
+#   Usage:
+#       python SchemaGenerator.py <output.xlsx> [--single N] [--functional N] [--tabular N] [--columns N] [--seed N]
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import argparse
+import json
+import random
+import sys
+
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill
+
+from SchemaParser import (DATA_NAME_COL, DATA_SHEET, DATA_START_ROW, DATA_VALUE_COL, EDIT_COLOR, FUNC_ROW, HEADER_COLOR,
+                          NAME_COL, NAME_ROW, TAB_FLAG, TAB_ROW, TAB_START_COL)
+
+# Set the Vocabulary of Generated Names
+PREFIXES = ['Tensile', 'Compressive', 'Shear', 'Flexural', 'Creep', 'Fatigue', 'Relaxation', 'Thermal', 'Cyclic', 'Residual']
+PROPERTIES = ['Modulus', 'Strength', 'Strain', 'Stress', 'Load', 'Displacement', 'Temperature', 'Poisson Ratio', 'Hold Time',
+              'Failure Strain', 'Yield Stress', 'Ultimate Stress', 'Rate', 'Elongation', 'Hardness']
+DIRECTIONS = ['', '-11', '-22', '-33', '-12', '-13', '-23']
+UNITS = ['MPa', 'GPa', 'mm', 'mm/mm', 's', 'N', 'kN', 'C', 'K', '1/s', '%']
+INFO = ['Material Name', 'Material Class', 'Specimen ID', 'Operator', 'Test Type', 'Test Standard', 'Machine', 'Date',
+        'Batch', 'Lay-up', 'Orientation', 'Environment']
+SECTIONS = ['Specimen Information', 'Test Information', 'Results', 'Environment']
+
+# Set Fills
+EDIT_FILL = PatternFill('solid', start_color=EDIT_COLOR)
+HEADER_FILL = PatternFill('solid', start_color=HEADER_COLOR)
+GREY_FILL = PatternFill('solid', start_color='FFC0C0C0')
+
+SHEET_TITLE_MAX = 31    # Excel limit on sheet name length
+DATA_ROWS = 5           # Rows of example data written below each attribute header
+
+#==================================================================================================================================================================
+# NAMES
+
+# Generate unique Granta MI style attribute names
+# -- Names cycle through the vocabulary, and a counter is added once every combination has been used
+def attribute_names(count, rng, pool=None):
+    if pool == None:
+        pool = [f'{prefix} {prop}{direction}' for prefix in PREFIXES for prop in PROPERTIES for direction in DIRECTIONS]
+    pool = list(pool)
+    rng.shuffle(pool)
+    names = []
+    for i in range(count):
+        name = pool[i % len(pool)]
+        if i >= len(pool):
+            name = f'{name} {i//len(pool) + 1}'
+        names.append(name)
+    return names
+
+# Get a unique Excel sheet title for an attribute name
+def sheet_title(name, used):
+    title = name[:SHEET_TITLE_MAX]
+    n = 1
+    while title in used:
+        suffix = f' ({n})'
+        title = name[:SHEET_TITLE_MAX - len(suffix)] + suffix
+        n = n + 1
+    used.add(title)
+    return title
+
+#==================================================================================================================================================================
+# WORKBOOK
+
+# Write a cell
+def write_cell(ws, row, col, value, fill=None):
+    cell = ws.cell(row=row, column=col, value=value)
+    if fill != None:
+        cell.fill = fill
+    return cell
+
+# Write the rows of an attribute sheet
+# -- rows: {row number: {column: value or (value, fill)}}
+def write_rows(ws, rows):
+    for r, cells in rows.items():
+        for col, value in cells.items():
+            if isinstance(value, tuple):
+                write_cell(ws, r, col, *value)
+            else:
+                write_cell(ws, r, col, value)
+
+# Write a functional attribute sheet
+def write_functional(ws, name, rng):
+    x_unit, y_unit = rng.sample(UNITS, 2)
+    rows = {NAME_ROW:{NAME_COL:name},
+            FUNC_ROW:{3:f'{rng.choice(PROPERTIES)} ({x_unit})', 4:f'{rng.choice(PROPERTIES)} ({y_unit})'}}
+    for k in range(DATA_ROWS):
+        rows[FUNC_ROW + 2 + k] = {3:round(rng.random()*100, 3), 4:round(rng.random()*1000, 3)}
+    write_rows(ws, rows)
+
+# Write a tabular attribute sheet
+# -- About two thirds of the columns are editable (yellow), the others are grey
+def write_tabular(ws, name, num_columns, rng):
+    header = {3:TAB_FLAG}
+    columns = attribute_names(num_columns, rng, [f'{prop}{direction}' for prop in PROPERTIES for direction in DIRECTIONS])
+    for j in range(num_columns):
+        text = columns[j] if rng.random() < 0.5 else f'{columns[j]} ({rng.choice(UNITS)})'
+        fill = EDIT_FILL if rng.random() < 0.67 else GREY_FILL
+        header[TAB_START_COL + j] = (text, fill)
+    rows = {NAME_ROW:{NAME_COL:name}, TAB_ROW:header}
+    for k in range(DATA_ROWS):
+        rows[TAB_ROW + 2 + k] = {3:k + 1, **{TAB_START_COL + j:round(rng.random()*100, 3) for j in range(num_columns)}}
+    write_rows(ws, rows)
+
+# Write the Data sheet
+# -- Single value attributes are grouped under grey section headers
+def write_data(ws, names, rng):
+    write_cell(ws, 1, 1, 'Granta MI Schema Export')
+    group = max(1, len(names)//len(SECTIONS) + 1)
+    r = DATA_START_ROW
+    for i in range(len(names)):
+        if i % group == 0:
+            section = SECTIONS[(i//group) % len(SECTIONS)]
+            write_cell(ws, r, DATA_NAME_COL, section, GREY_FILL)
+            r = r + 1
+        value = rng.choice([None, round(rng.random()*500, 2), rng.choice(INFO)])
+        write_cell(ws, r, DATA_NAME_COL, names[i], HEADER_FILL)
+        write_cell(ws, r, DATA_VALUE_COL, value)
+        r = r + 1
+
+# Write a synthetic Granta MI Schema workbook
+# -- Returns the number of single value, functional and tabular attributes written
+def generate_workbook(path, num_single=100, num_functional=20, num_tabular=10, num_columns=8, seed=0):
+    rng = random.Random(seed)
+    wb = Workbook()
+    wb.remove(wb.active)
+
+    # Attribute sheets (functional and tabular interleaved, as in a real export)
+    names = attribute_names(num_functional + num_tabular, rng)
+    kinds = ['Functional']*num_functional + ['Tabular']*num_tabular
+    rng.shuffle(kinds)
+    used = {DATA_SHEET}
+    for name, kind in zip(names, kinds):
+        ws = wb.create_sheet(sheet_title(name, used))
+        if kind == 'Functional':
+            write_functional(ws, name, rng)
+        else:
+            write_tabular(ws, name, num_columns, rng)
+
+    # Data sheet
+    single = attribute_names(num_single, rng, [f'{info}' for info in INFO] +
+                                               [f'{prefix} {prop}{direction}' for prefix in PREFIXES for prop in PROPERTIES for direction in DIRECTIONS])
+    write_data(wb.create_sheet(DATA_SHEET), single, rng)
+
+    wb.save(path)
+    return {'Single Value':num_single, 'Functional':num_functional, 'Tabular':num_tabular}
+
+# Split a total number of attributes into single value, functional and tabular attributes
+def split_counts(total):
+    num_functional = max(1, total//4)
+    num_tabular = max(1, total//8)
+    return max(1, total - num_functional - num_tabular), num_functional, num_tabular
+
+#==================================================================================================================================================================
+# TEMPLATES AND RECORDS
+
+# Generate a Py MI Lab template with the layout of Raw_Template.json
+# -- About half the attributes are point arrays, the rest points and strings, with one dict (Units) per category
+def generate_template(num_atts, seed=0, num_categories=8):
+    rng = random.Random(seed)
+    names = attribute_names(num_atts, rng)
+    Template = {}
+    for i in range(num_atts):
+        c = i % num_categories
+        cat = f'{PREFIXES[c % len(PREFIXES)]} Analysis {c + 1}'
+        att_type = rng.choice(['point array', 'point array', 'point', 'string'])
+        Template.setdefault(cat, {'Units':{'Type':'dict', 'Description':'Units', 'Value':{}}})
+        Template[cat][names[i]] = {'Type':att_type, 'Description':names[i], 'Value':[] if att_type == 'point array' else None}
+    return Template
+
+# Generate the attribute values of a neutral record
+# -- names: "Category - Attribute" names, choices: values drawn for each attribute (e.g. to exercise placement rules)
+def generate_values(names, rng, choices=('A', 'B', 'C', 800.0, 1000.0, None)):
+    return {name:rng.choice(choices) for name in names}
+
+# Write a neutral (.json) file for a template with random values
+def generate_neutral(path, Template, seed=0, num_points=100):
+    rng = random.Random(seed)
+    Record = {}
+    for cat, atts in Template.items():
+        Record[cat] = {}
+        for att, info in atts.items():
+            if info['Type'] == 'point array':
+                value = [round(rng.random()*100, 4) for k in range(num_points)]
+            elif info['Type'] == 'point':
+                value = round(rng.random()*1000, 2)
+            elif info['Type'] == 'dict':
+                value = {}
+            else:
+                value = rng.choice(INFO)
+            Record[cat][att] = {'Type':info['Type'], 'Value':value}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(Record, f)
+
+#==================================================================================================================================================================
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic Granta MI Schema workbook')
+    parser.add_argument('output', help='workbook (.xlsx) to write')
+    parser.add_argument('--single', type=int, default=100, help='number of single value attributes')
+    parser.add_argument('--functional', type=int, default=20, help='number of functional attribute sheets')
+    parser.add_argument('--tabular', type=int, default=10, help='number of tabular attribute sheets')
+    parser.add_argument('--columns', type=int, default=8, help='number of columns per tabular attribute')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args(argv)
+
+    counts = generate_workbook(args.output, args.single, args.functional, args.tabular, args.columns, args.seed)
+    print(f"Wrote {args.output}: {counts['Single Value']} single value, {counts['Functional']} functional and "
+          f"{counts['Tabular']} tabular attributes")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Schema Ingestion
+#
+#   PURPOSE: Read an uploaded Granta MI Schema workbook on a worker thread so the page stays responsive while it is parsed
+#
+#   An IngestJob is the handle to one workbook being read. It is started when the user clicks 'Configure Schema' and kept in the
+#   session state; each rerun of the page reads its progress (sheets read out of the total) until it is done, and then picks up
+#   the result. The job checks for cancellation after every sheet. The sheets read before it was cancelled are kept, so resuming
+#   a new schema only reads the remaining sheets. Updating a previous configuration is incremental already and starts over.
+#
+#   The job never touches the Streamlit session state itself, only the page does.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import logging
+import threading
+import time
+
+from SchemaParser import DATA_SHEET, build_atts, read_workbook, sheet_index
+from SchemaUpdate import fingerprint_schema, sheet_names, update_config
+
+# Set Job States
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+POLL_INTERVAL = 0.25        # Seconds between reruns of the page while a job is running
+
+logger = logging.getLogger(__name__)
+
+# Raised inside the job when it is cancelled
+class IngestCancelled(Exception):
+    pass
+
+#==================================================================================================================================================================
+# INGESTION JOB
+
+class IngestJob:
+    # -- data: workbook bytes
+    # -- Prev_Config: previous configuration to update to the workbook (optional)
+    # -- cache: SchemaCache used for new schemas (optional)
+    # -- parallel: read large workbooks with a process pool (see SchemaParser.read_workbook)
+    def __init__(self, data, Prev_Config=None, cache=None, parallel=False):
+        self.data = data
+        self.Prev_Config = Prev_Config
+        self.cache = cache
+        self.parallel = parallel
+        self.state = None
+        self.results = {}       # sheet -> (attribute type, attribute name, Atts entry) of the sheets read so far
+        self.single = None      # Single value attributes once the Data sheet is read
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._reused = 0
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Start (or resume) the job on a worker thread
+    def start(self):
+        if self.state == RUNNING:
+            return self
+        self._cancel.clear()
+        self.error = None
+        self.started = time.perf_counter()
+        self.finished = None
+        self.state = RUNNING
+        self._thread = threading.Thread(target=self._run, name='SchemaIngest', daemon=True)
+        self._thread.start()
+        return self
+
+    # Ask the job to stop after the sheet it is reading
+    def cancel(self):
+        self._cancel.set()
+
+    # Wait for the job to finish
+    # -- Returns the job state
+    def wait(self, timeout=None):
+        if self._thread != None:
+            self._thread.join(timeout)
+        return self.state
+
+    # Get the number of sheets read and the total number of sheets to read (0 until the first sheet is read)
+    def progress(self):
+        with self._lock:
+            done = len(self.results) + (1 if self.single != None else 0)
+            return done, max(self.total, done)
+
+    # Get the run time of the job in seconds
+    def elapsed(self):
+        if self.started == None:
+            return 0.0
+        end = self.finished if self.finished != None else time.perf_counter()
+        return end - self.started
+
+    # Record a sheet read by the parser and stop if the job was cancelled
+    def _progress(self, sheet, result, total):
+        with self._lock:
+            if sheet == DATA_SHEET:
+                self.single = result
+            else:
+                self.results[sheet] = result
+            self.total = self._reused + total
+        if self._cancel.is_set():
+            raise IngestCancelled()
+
+    # Run the job
+    # -- The state is set last so the page only sees DONE once the result is available
+    def _run(self):
+        try:
+            if self._cancel.is_set():
+                raise IngestCancelled()
+            if self.Prev_Config != None:
+                self.result = self._update()
+            else:
+                self.result = self._parse()
+            state = DONE
+        except IngestCancelled:
+            logger.info('Schema ingestion cancelled after %d of %d sheets', *self.progress())
+            state = CANCELLED
+        except Exception as e:
+            logger.exception('Schema ingestion failed')
+            self.error = f'{type(e).__name__}: {e}'
+            state = FAILED
+        self.finished = time.perf_counter()
+        self.state = state
+
+    # Read a new schema, skipping the sheets already read before the job was cancelled
+    # -- Returns {'Atts', 'Fingerprints'}
+    def _parse(self):
+        with self._lock:
+            Reused = dict(self.results)
+            self._reused = len(Reused) + (1 if self.single != None else 0)
+
+        # -- A resumed job already missed the cache
+        Schema = None
+        if self.cache != None and self._reused == 0:
+            Schema = self.cache.lookup(self.data)
+        if Schema == None:
+            # Only read the sheets that were not read before
+            only = None
+            if self._reused > 0:
+                names = sheet_names(self.data)
+                names = names[:names.index(DATA_SHEET)] if DATA_SHEET in names else names
+                only = [sheet for sheet in names if sheet not in Reused]
+            Sheets, Results, Single = read_workbook(self.data, self.parallel, only=only, read_data=self.single == None,
+                                                    progress=self._progress)
+            if Single == None:
+                Single = self.single
+            Results.update(Reused)
+            Results = {sheet:Results[sheet] for sheet in Sheets}
+
+            Schema = {'Atts':build_atts(list(Results.values()), Single),
+                      'Sheets':sheet_index(Results)}
+            if self.cache != None:
+                self.cache.put(self.data, Schema)
+        return {'Atts':Schema['Atts'],
+                'Fingerprints':fingerprint_schema(self.data, Schema)}
+
+    # Update the previous configuration to the schema
+    # -- Returns {'Config', 'Schema_Diff', 'Schema_Summary'}
+    def _update(self):
+        with self._lock:
+            self.results = {}
+            self.single = None
+            self._reused = 0
+        Config, Diff, Summary = update_config(self.Prev_Config, self.data, self.parallel, self._progress)
+        return {'Config':Config,
+                'Schema_Diff':Diff,
+                'Schema_Summary':Summary}
@@ -0,0 +1,283 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Schema Parser
+#
+#   PURPOSE: Read a Granta MI Schema Excel (.xlsx) export and extract the Single Value, Functional and Tabular attributes (Atts) used
+#            by the Schema Configuration Manager
+#
+#   Each worksheet is read in a single forward pass using iter_rows. Random access with ws.cell() on a read-only worksheet re-scans
+#   the sheet XML for every call, which makes large schemas very slow to load.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import io
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from openpyxl import load_workbook
+
+# Parser Version
+# -- Increment whenever the Atts produced, or the layout of cached schemas and fingerprints, changes (invalidates them)
+PARSER_VERSION = 2
+
+# Set Granta MI Schema Layout
+# -- Attribute sheets
+NAME_ROW = 4                # Row containing the attribute name
+NAME_COL = 2                # Column containing the attribute name
+TAB_ROW = 7                 # Row containing the tabular column headers
+FUNC_ROW = 8                # Row containing the functional X and Y headers
+TAB_FLAG = 'Row Number'     # Value in column 3 of the tabular header row identifying a tabular attribute
+TAB_START_COL = 4           # First tabular column (don't include row number)
+EDIT_COLOR = 'FFFFFF00'     # Fill color of editable tabular columns
+
+# -- Data sheet
+DATA_SHEET = 'Data'         # Name of the single value sheet
+DATA_START_ROW = 10         # First row of the single value attributes
+DATA_NAME_COL = 3           # Column containing the single value attribute name
+DATA_VALUE_COL = 4          # Column containing the single value attribute value
+HEADER_COLOR = 'FFFFFFFF'   # Fill color of single value attribute headers
+
+# Set Parallel Parsing Defaults
+# -- Parallel parsing is opt in (parallel = True), and even then workbooks with fewer attribute sheets are parsed serially, where
+#    starting a process pool costs more than it saves
+PARALLEL_MIN_SHEETS = 64
+BLOCKS_PER_WORKER = 4       # Blocks of sheets per worker when progress is reported, so it advances more than once per worker
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Split a Granta MI header of the form "Name (unit)" into the name and unit
+def split_units(name):
+    att = name
+    unit = None
+    if name != None and name[-1] == ')':
+        idx = name.index("(")
+        att = name[:idx-1]
+        unit = name[idx+1:len(name)-1]
+    return att, unit
+
+# Get the fill color of a read-only cell
+# -- Padding cells returned by iter_rows have no fill
+def cell_color(cell):
+    if cell.fill == None:
+        return None
+    return cell.fill.start_color.index
+
+# Open a workbook from a file path, bytes or a file-like object (e.g. a Streamlit UploadedFile)
+def open_workbook(source):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return load_workbook(source, data_only=True, read_only=True)
+
+# Get the list of attribute sheets (all sheets before the Data sheet)
+def get_attribute_sheets(wb):
+    Sheets = []
+    for name in wb.sheetnames:
+        if name == DATA_SHEET:
+            break
+        Sheets.append(name)
+    return Sheets
+
+# Read a functional or tabular attribute sheet
+# -- Returns the attribute type ('Functional' or 'Tabular'), the attribute name and its Atts entry
+def read_attribute_sheet(ws):
+    # Read the header rows in one pass
+    rows = {}
+    for k, row in enumerate(ws.iter_rows(min_row=NAME_ROW, max_row=FUNC_ROW), start=NAME_ROW):
+        rows[k] = row
+
+    def value(row, col):
+        if row in rows and len(rows[row]) >= col:
+            return rows[row][col-1].value
+        return None
+
+    # Get the attribute name
+    att_name = value(NAME_ROW, NAME_COL)
+
+    # Get Tabular Data Information
+    if value(TAB_ROW, 3) == TAB_FLAG:
+        # Get the editable column names (don't include row number)
+        cols = []
+        units = []
+        header = rows[TAB_ROW]
+        for cell in header[TAB_START_COL-1:]:
+            if cell.value == None:
+                break
+            if cell_color(cell) == EDIT_COLOR:
+                row_att, row_unit = split_units(cell.value)
+                cols.append(row_att)
+                units.append(row_unit)
+        return 'Tabular', att_name, {'Columns':cols,
+                                     'Units':units}
+
+    # Get Functional Data Information
+    x_att, x_unit = split_units(value(FUNC_ROW, 3))
+    y_att, y_unit = split_units(value(FUNC_ROW, 4))
+    return 'Functional', att_name, {'Variables':[x_att, y_att],
+                                    'Units':[x_unit, y_unit]}
+
+# Read the single value attributes from the Data sheet
+def read_data_sheet(ws):
+    Single = {}
+    for name_cell, value_cell in ws.iter_rows(min_row=DATA_START_ROW, min_col=DATA_NAME_COL, max_col=DATA_VALUE_COL):
+        # Check the color for a header
+        if name_cell.value != None and cell_color(name_cell) == HEADER_COLOR:
+            Single[name_cell.value] = value_cell.value
+    return Single
+
+# Get the raw bytes of a workbook source so it can be shared with worker processes
+def read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+# Read the sheets of an open workbook
+# -- progress(sheet, result, total) is called after each sheet (DATA_SHEET with the single value attributes for the Data sheet),
+#    and may raise an exception to stop reading
+# -- Returns the attribute sheet results in the order given and the single value attributes if the Data sheet was requested
+def read_sheets(wb, sheets, data=False, progress=None):
+    total = len(sheets) + (1 if data else 0)
+    results = []
+    for sheet in sheets:
+        results.append(read_attribute_sheet(wb[sheet]))
+        if progress != None:
+            progress(sheet, results[-1], total)
+    Single = None
+    if data:
+        Single = read_data_sheet(wb[DATA_SHEET])
+        if progress != None:
+            progress(DATA_SHEET, Single, total)
+    return results, Single
+
+# Merge the sheet results into the Atts dictionary
+def build_atts(results, Single):
+    # Preallocate dictionary to store Granta MI Attribute names
+    Atts = {'Single Value':{},
+            'Functional':{},
+            'Tabular':{}}
+
+    # Add the tabular and functional data attributes in sheet order
+    for att_type, att_name, entry in results:
+        Atts[att_type][att_name] = entry
+
+    # Add the single value attributes
+    Atts['Single Value'] = Single
+    return Atts
+
+#==================================================================================================================================================================
+# PARALLEL PARSING
+# Each worker process opens its own copy of the workbook from the shared bytes and reads contiguous blocks of sheets
+
+_worker_wb = None
+
+# Open the workbook from the shared bytes once per worker process
+def _init_worker(data):
+    global _worker_wb
+    _worker_wb = open_workbook(data)
+
+# Get the multiprocessing context for the process pools
+# -- Forked workers would inherit the locks held by the other threads of the Streamlit server, so the workers are started from a
+#    fork server instead, or spawned where there is none (Windows)
+def pool_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+# Read a block of sheets in a worker process
+def _read_block(sheets, data):
+    return read_sheets(_worker_wb, sheets, data)
+
+# Split the sheets into contiguous blocks, one per worker
+def split_blocks(sheets, num_blocks):
+    size = -(-len(sheets) // num_blocks)
+    return [sheets[i:i+size] for i in range(0, len(sheets), size)]
+
+# Read the workbook sheets with a process pool and merge the results in the original sheet order
+# -- progress: see read_sheets, called as each block of sheets finishes; the blocks not yet started are cancelled if it raises
+def parse_parallel(data, sheets, max_workers, read_data=True, progress=None):
+    # The Data sheet is read on its own while the attribute sheets are split across the workers
+    num_blocks = max_workers*BLOCKS_PER_WORKER if progress != None else max_workers
+    blocks = split_blocks(sheets, num_blocks) if len(sheets) > 0 else []
+    total = len(sheets) + (1 if read_data else 0)
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=pool_context(), initializer=_init_worker, initargs=(data,))
+    try:
+        jobs = {pool.submit(_read_block, block, False):block for block in blocks}
+        if read_data:
+            data_job = pool.submit(_read_block, [], True)
+            jobs[data_job] = None
+
+        # Collect the blocks as they finish
+        done = {}
+        pending = set(jobs)
+        while len(pending) > 0:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for job in finished:
+                results, Single = job.result()
+                done[job] = (results, Single)
+                if progress != None:
+                    if jobs[job] == None:
+                        progress(DATA_SHEET, Single, total)
+                    for sheet, result in zip(jobs[job], results):
+                        progress(sheet, result, total)
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    results = []
+    for job, block in jobs.items():
+        if block != None:
+            results.extend(done[job][0])
+    Single = None
+    if read_data:
+        Single = done[data_job][1]
+    return results, Single
+
+#==================================================================================================================================================================
+# PARSE WORKBOOK
+
+# Read the sheets of a Granta MI Schema workbook
+# -- only: attribute sheets to read (default all), read_data: read the Data sheet
+# -- parallel = True spreads the sheets over a process pool for large workbooks, falling back to serial parsing for small ones
+# -- progress: see read_sheets
+# -- Returns the list of attribute sheets, {sheet: (attribute type, attribute name, Atts entry)} for the sheets read and the
+#    single value attributes (None if the Data sheet was not read)
+def read_workbook(source, parallel=False, max_workers=None, only=None, read_data=True, progress=None):
+    if parallel:
+        data = read_bytes(source)
+        source = data
+        if max_workers == None:
+            max_workers = os.cpu_count() or 1
+
+    wb = open_workbook(source)
+    try:
+        Sheets = get_attribute_sheets(wb)
+        if only == None:
+            only = Sheets
+        else:
+            wanted = set(only)
+            only = [sheet for sheet in Sheets if sheet in wanted]
+        if not parallel or max_workers < 2 or len(only) < PARALLEL_MIN_SHEETS:
+            results, Single = read_sheets(wb, only, read_data, progress)
+            return Sheets, dict(zip(only, results)), Single
+    finally:
+        wb.close()
+
+    results, Single = parse_parallel(data, only, max_workers, read_data, progress)
+    return Sheets, dict(zip(only, results)), Single
+
+# Get the attribute type and name read from each sheet
+def sheet_index(Results):
+    return {sheet:[att_type, att_name] for sheet, (att_type, att_name, entry) in Results.items()}
+
+# Parse a Granta MI Schema workbook into the Atts dictionary
+def parse_workbook(source, parallel=False, max_workers=None):
+    Sheets, Results, Single = read_workbook(source, parallel, max_workers)
+    return build_atts([Results[sheet] for sheet in Sheets], Single)
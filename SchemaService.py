@@ -0,0 +1,468 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Local HTTP Service
+#
+#   PURPOSE: Serve the schema parser, configuration, validation and record placement logic over HTTP so other tools can use them
+#            without a browser
+#
+#   Endpoints (request and response bodies are JSON unless noted):
+#       GET  /health                    Service status
+#       GET  /metrics                   Request latency per endpoint, queue depth and cache statistics
+#       GET  /templates                 Registered Py MI Lab template versions
+#       POST /schema                    Body: Granta MI Schema workbook (.xlsx bytes). Returns {'Atts', 'Fingerprints'}
+#       POST /config?format=&auto_map=  Body: workbook. Returns a new configuration file (json, compact or binary)
+#       POST /validate?version=         Body: configuration file in any format. Returns {'valid', 'counts', 'issues', 'template'}
+#       POST /export?format=            Body: configuration file in any format. Returns it in the requested format
+#       POST /place                     Body: {'config':{...}, 'records':[record, ...]}, each record a {"Category - Attribute": value}
+#                                       dictionary or the path(s) of its neutral files relative to the root directory. Returns
+#                                       {'placements', 'tree'}
+#
+#   Requests are served by a fixed pool of worker threads. Connections wait in a bounded queue when every worker is busy and are
+#   answered with 503 when the queue is full, and a client that stops sending for REQUEST_TIMEOUT seconds is disconnected (or
+#   answered with 408 in the middle of a body) so idle connections cannot hold the workers. The schema cache and template
+#   registry are the process-wide ones, shared by every worker. The service binds to localhost by default; it has no
+#   authentication, so neutral files are only read from inside the root directory (--root or SCHEMA_SERVICE_ROOT), and records
+#   can only be sent as values when no root directory is set.
+#
+#   Usage:
+#       python SchemaService.py [--host 127.0.0.1] [--port 8765] [-j 4] [--queue 16] [--root neutral_dir]
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import argparse
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from ConfigFormat import ConfigWriter, FORMATS, decode_compact, is_compact, read_config
+from ConfigValidator import count_issues, validate_config
+from PlacementEngine import PlacementEngine, format_tree, preview_tree
+from SchemaCache import get_cache
+from SchemaConfig import init_config
+from SchemaUpdate import fingerprint_schema
+from TemplateRegistry import get_registry
+
+# Set Service Defaults
+HOST = '127.0.0.1'
+PORT = 8765
+WORKERS = 4
+QUEUE_SIZE = 16             # Connections waiting for a worker before new ones are rejected with 503
+MAX_BODY = 256*1024*1024    # Largest request body in bytes
+REQUEST_TIMEOUT = 30        # Seconds a connection can wait for the client to send before it is closed
+LATENCY_WINDOW = 1000       # Recent requests per endpoint kept for the latency percentiles
+ROOT = os.environ.get('SCHEMA_SERVICE_ROOT')   # Directory the neutral files of /place are read from (None = values only)
+
+MIME_TYPES = {'json':'application/json', 'compact':'application/json', 'binary':'application/octet-stream'}
+
+logger = logging.getLogger(__name__)
+
+# Raised by an endpoint for a bad request, returned to the client with its status
+class RequestError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+#==================================================================================================================================================================
+# METRICS
+
+class ServiceMetrics:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.started = time.time()
+        self.routes = {}        # route -> {'count', 'errors', 'total_ms', 'max_ms', 'recent':deque of ms}
+        self.queued = 0
+        self.max_queued = 0
+        self.active = 0
+        self.rejected = 0
+        self.wait_ms = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    # Record a connection waiting for a worker
+    def enqueue(self):
+        with self._lock:
+            self.queued = self.queued + 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+    # Record a connection picked up by a worker after waiting wait_ms
+    def dequeue(self, wait_ms):
+        with self._lock:
+            self.queued = self.queued - 1
+            self.active = self.active + 1
+            self.wait_ms.append(wait_ms)
+
+    # Record a connection finished by a worker
+    def done(self):
+        with self._lock:
+            self.active = self.active - 1
+
+    # Record a connection rejected because the queue was full
+    def reject(self):
+        with self._lock:
+            self.rejected = self.rejected + 1
+
+    # Record a request
+    def record(self, route, ms, error):
+        with self._lock:
+            if route not in self.routes:
+                self.routes[route] = {'count':0, 'errors':0, 'total_ms':0.0, 'max_ms':0.0, 'recent':deque(maxlen=self.window)}
+            entry = self.routes[route]
+            entry['count'] = entry['count'] + 1
+            entry['errors'] = entry['errors'] + (1 if error else 0)
+            entry['total_ms'] = entry['total_ms'] + ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['recent'].append(ms)
+
+    # Get the metrics as a dictionary
+    def snapshot(self):
+        with self._lock:
+            Routes = {}
+            for route, entry in self.routes.items():
+                recent = sorted(entry['recent'])
+                Routes[route] = {'count':entry['count'],
+                                 'errors':entry['errors'],
+                                 'mean_ms':round(entry['total_ms']/entry['count'], 2),
+                                 'p50_ms':round(percentile(recent, 0.50), 2),
+                                 'p95_ms':round(percentile(recent, 0.95), 2),
+                                 'max_ms':round(entry['max_ms'], 2)}
+            return {'uptime_s':round(time.time() - self.started, 1),
+                    'queue':{'depth':self.queued,
+                             'max_depth':self.max_queued,
+                             'active':self.active,
+                             'rejected':self.rejected,
+                             'mean_wait_ms':round(statistics.fmean(self.wait_ms), 2) if len(self.wait_ms) > 0 else 0.0},
+                    'routes':Routes}
+
+# Get a percentile of sorted values
+def percentile(values, q):
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values) - 1, int(q*len(values)))]
+
+#==================================================================================================================================================================
+# ENDPOINTS
+# Each endpoint takes the query parameters and request body and returns (status, content type, response body)
+
+# Get a single query parameter
+def query_value(Query, name, default=None):
+    return Query.get(name, [default])[-1]
+
+# Get the template version named in the query
+def query_templates(Query):
+    try:
+        return get_registry().get(query_value(Query, 'version'))
+    except KeyError as e:
+        raise RequestError(e.args[0])
+
+# Get the configuration file format named in the query
+def query_format(Query):
+    fmt = query_value(Query, 'format', 'json')
+    if fmt not in FORMATS:
+        raise RequestError(f"Unknown configuration format '{fmt}', expected one of {', '.join(FORMATS)}")
+    return fmt
+
+# Encode a JSON response
+def json_response(Doc, status=200):
+    return status, 'application/json', json.dumps(Doc, separators=(',', ':'), default=str).encode('utf-8')
+
+# Read a workbook body into its cached schema
+def read_schema(body):
+    if body[:2] != b'PK':
+        raise RequestError('Request body must be a Granta MI Schema workbook (.xlsx)')
+    # -- A zip archive without the workbook parts fails with the KeyError of the first missing part
+    try:
+        return get_cache().get_schema(body)
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise RequestError(f'Request body is not a valid workbook: {type(e).__name__}: {e}')
+
+# Read a configuration body
+def read_config_body(body):
+    # -- Malformed compact documents fail with the lookup errors of their missing or mistyped entries
+    try:
+        return read_config(body)
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise RequestError(f'Unable to read the configuration: {type(e).__name__}: {e}')
+
+# Get the neutral file paths of a record inside the root directory
+# -- Paths are relative to the root directory, and paths that lead outside it (absolute paths, '..', links) are rejected
+def record_paths(record, root):
+    paths = [record] if isinstance(record, str) else record
+    if not isinstance(paths, list) or any(not isinstance(path, str) for path in paths):
+        raise RequestError('Each record must be a dictionary of values or the path(s) of its neutral files')
+    if root == None:
+        raise RequestError('Neutral file paths are not accepted, the service has no root directory; send the record values instead', 403)
+    root = os.path.realpath(root)
+    resolved = []
+    for path in paths:
+        full = os.path.realpath(os.path.join(root, path))
+        try:
+            inside = os.path.commonpath([root, full]) == root
+        except ValueError:
+            # -- Paths on another drive
+            inside = False
+        if not inside:
+            raise RequestError(f"Neutral file '{path}' is outside the root directory", 403)
+        resolved.append(full)
+    return resolved
+
+def get_health(Query, body):
+    return json_response({'status':'ok'})
+
+def get_templates(Query, body):
+    Registry = get_registry()
+    Versions = []
+    for name in Registry.names():
+        Templates = Registry.get(name)
+        Versions.append({'name':name, 'fingerprint':Templates.fingerprint, 'attributes':len(Templates.catalog.types)})
+    return json_response({'versions':Versions})
+
+def post_schema(Query, body):
+    Schema = read_schema(body)
+    return json_response({'Atts':Schema['Atts'],
+                          'Fingerprints':fingerprint_schema(body, Schema)})
+
+def post_config(Query, body):
+    fmt = query_format(Query)
+    Templates = query_templates(Query)
+    Schema = read_schema(body)
+    Config = init_config(Schema['Atts'])
+    Config['Fingerprints'] = fingerprint_schema(body, Schema)
+    if query_value(Query, 'auto_map', '0') not in ('0', 'false', ''):
+        Templates.mapper().auto_map(Config, Config['Atts'])
+    return 200, MIME_TYPES[fmt], ConfigWriter(Templates.fingerprint).dumps(Config, fmt)
+
+def post_validate(Query, body):
+    Templates = query_templates(Query)
+    Config, template = read_config_body(body)
+    issues = validate_config(Config, Templates.catalog)
+    counts = count_issues(issues)
+    return json_response({'valid':counts['error'] == 0,
+                          'counts':counts,
+                          'issues':issues,
+                          'template':{'version':Templates.name,
+                                      'fingerprint':Templates.fingerprint,
+                                      'config':template}})
+
+def post_export(Query, body):
+    fmt = query_format(Query)
+    Config, template = read_config_body(body)
+    if not isinstance(Config, dict) or 'Atts' not in Config:
+        raise RequestError('Configuration has no Atts')
+    return 200, MIME_TYPES[fmt], ConfigWriter(template).dumps(Config, fmt)
+
+def post_place(Query, body):
+    try:
+        Doc = json.loads(body)
+    except ValueError as e:
+        raise RequestError(f'Request body must be JSON: {e}')
+    if not isinstance(Doc, dict) or not isinstance(Doc.get('config'), dict) or not isinstance(Doc.get('records'), list):
+        raise RequestError("Request body must be {'config':{...}, 'records':[...]}")
+    Config = Doc['config']
+    if is_compact(Config):
+        Config = decode_compact(Config)
+
+    # -- Malformed rules fail with the lookup and type errors of their missing or mistyped entries
+    try:
+        engine = PlacementEngine(Config)
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+        raise RequestError(f'Unable to read the placement rules: {type(e).__name__}: {e}')
+
+    # Place each record from its values or neutral files
+    root = SERVICE.root if SERVICE != None else ROOT
+    placements = []
+    for record in Doc['records']:
+        if isinstance(record, dict):
+            placements.append(engine.place(record))
+        else:
+            try:
+                placements.append(engine.place_record(record_paths(record, root)))
+            except OSError as e:
+                raise RequestError(f'Unable to read neutral file: {e}')
+            except ValueError as e:
+                raise RequestError(f'Neutral file is not valid JSON: {e}')
+    names = [record if isinstance(record, str) else str(n) for n, record in enumerate(Doc['records'])]
+    return json_response({'placements':placements,
+                          'tree':format_tree(preview_tree(names, placements))})
+
+def get_metrics(Query, body):
+    Doc = SERVICE.metrics.snapshot() if SERVICE != None else {}
+    Doc['cache'] = get_cache().stats()
+    Doc['templates'] = get_registry().stats()
+    return json_response(Doc)
+
+ROUTES = {('GET', '/health'):get_health,
+          ('GET', '/metrics'):get_metrics,
+          ('GET', '/templates'):get_templates,
+          ('POST', '/schema'):post_schema,
+          ('POST', '/config'):post_config,
+          ('POST', '/validate'):post_validate,
+          ('POST', '/export'):post_export,
+          ('POST', '/place'):post_place}
+
+#==================================================================================================================================================================
+# REQUEST HANDLER
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # -- One request per connection, and a client that stops sending is disconnected after the timeout, so an idle client
+    #    never holds a worker
+    protocol_version = 'HTTP/1.0'
+    server_version = 'SchemaService/1'
+    timeout = REQUEST_TIMEOUT
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    # Run the endpoint of the request and send its response
+    def dispatch(self, method):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        route = url.path.rstrip('/') or '/'
+        endpoint = ROUTES.get((method, route))
+        try:
+            if endpoint == None:
+                if any(path == route for m, path in ROUTES):
+                    raise RequestError(f'{method} is not allowed on {route}', 405)
+                raise RequestError(f'Unknown endpoint {route}', 404)
+            status, content_type, data = endpoint(parse_qs(url.query), self.read_body())
+        except RequestError as e:
+            status, content_type, data = json_response({'error':str(e)}, e.status)
+        except TimeoutError:
+            status, content_type, data = json_response({'error':f'Request body not received within {self.timeout} seconds'}, 408)
+        except Exception as e:
+            logger.exception('Request %s %s failed', method, route)
+            status, content_type, data = json_response({'error':f'{type(e).__name__}: {e}'}, 500)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        if SERVICE != None:
+            SERVICE.metrics.record(f'{method} {route}' if endpoint != None else 'other', (time.perf_counter() - start)*1000, status >= 400)
+
+    # Read the request body
+    def read_body(self):
+        length = self.headers.get('Content-Length')
+        if length == None:
+            return b''
+        try:
+            length = int(length)
+        except ValueError:
+            raise RequestError(f"Content-Length '{length}' is not a number")
+        if length < 0:
+            raise RequestError(f'Content-Length {length} is negative')
+        if length > MAX_BODY:
+            raise RequestError(f'Request body is larger than {MAX_BODY} bytes', 413)
+        return self.rfile.read(length)
+
+    # Log requests to the module logger instead of stderr
+    def log_message(self, format, *args):
+        logger.info('%s %s', self.address_string(), format % args)
+
+#==================================================================================================================================================================
+# SERVER
+
+class SchemaService(HTTPServer):
+    # -- workers: requests served at the same time
+    # -- queue_size: connections waiting for a worker before new ones are rejected
+    # -- root: directory the neutral files of /place are read from (None accepts record values only)
+    def __init__(self, host=HOST, port=PORT, workers=WORKERS, queue_size=QUEUE_SIZE, root=ROOT):
+        super().__init__((host, port), ServiceHandler)
+        self.root = root
+        self.metrics = ServiceMetrics()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='SchemaService')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    # Hand each connection to the worker pool, or reject it when the queue is full
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.metrics.reject()
+            threading.Thread(target=self._reject, args=(request,), daemon=True).start()
+            return
+        self.metrics.enqueue()
+        self.pool.submit(self._serve, request, client_address, time.perf_counter())
+
+    # Answer a connection with 503 when the queue is full
+    # -- The request is read and discarded until the client closes (or stops sending for REQUEST_TIMEOUT seconds), since
+    #    closing a connection with an unread body resets it and a client still uploading a workbook would never see the 503
+    def _reject(self, request):
+        try:
+            request.settimeout(REQUEST_TIMEOUT)
+            request.sendall(b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\n\r\n')
+            request.shutdown(socket.SHUT_WR)
+            received = 0
+            while received <= MAX_BODY:
+                chunk = request.recv(65536)
+                if not chunk:
+                    break
+                received = received + len(chunk)
+        except OSError:
+            pass
+        finally:
+            request.close()
+
+    # Serve a connection on a worker thread
+    def _serve(self, request, client_address, queued):
+        self.metrics.dequeue((time.perf_counter() - queued)*1000)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.metrics.done()
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+# The running service, read by the metrics endpoint
+SERVICE = None
+
+# Start the service
+def serve(host=HOST, port=PORT, workers=WORKERS, queue_size=QUEUE_SIZE, root=ROOT):
+    global SERVICE
+    SERVICE = SchemaService(host, port, workers, queue_size, root)
+    return SERVICE
+
+#==================================================================================================================================================================
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Schema Configuration Manager over HTTP')
+    parser.add_argument('--host', default=HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    parser.add_argument('-j', '--workers', type=int, default=WORKERS, help='requests served at the same time')
+    parser.add_argument('--queue', type=int, default=QUEUE_SIZE, help='connections waiting for a worker before new ones are rejected')
+    parser.add_argument('--root', default=ROOT, help='directory /place reads neutral files from (default: record values only)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    Service = serve(args.host, args.port, args.workers, args.queue, args.root)
+    logger.info('Serving on http://%s:%d with %d workers (pid %d)', args.host, Service.server_port, args.workers, os.getpid())
+    try:
+        Service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        Service.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
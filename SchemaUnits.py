@@ -0,0 +1,255 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Units
+#
+#   PURPOSE: Resolve the units of Py MI Lab attributes and convert mapped data to the units declared in the Granta MI Schema
+#
+#   Template attributes name their units with a UnitsLink, a path into the Units dictionary of a category, optionally joined
+#   with literal text: "['Raw Data']['Units']['Time']" or "['General Information']['Units']['Stress'] + '/' + [...]['Time']".
+#   Every link is compiled once into its paths, which are read from each neutral file along with the mapped values (see
+#   NeutralReader), and resolved to a unit string.
+#
+#   Unit strings such as 'MPa', 'mm/mm', 'kN', 'degC' or 'MPa/s' are parsed into a scale to SI base units and their dimensions.
+#   The scale and offset between two units are computed once per pair, and applied to whole point arrays with NumPy.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Set the Units
+# -- name: (scale to SI, dimensions (length, mass, time, temperature), offset to SI)
+_L = (1, 0, 0, 0)
+_M = (0, 1, 0, 0)
+_T = (0, 0, 1, 0)
+_K = (0, 0, 0, 1)
+_F = (1, 1, -2, 0)
+_P = (-1, 1, -2, 0)
+_E = (2, 1, -2, 0)
+_N = (0, 0, 0, 0)
+UNITS = {
+    # -- Length
+    'm':(1.0, _L, 0.0), 'mm':(1e-3, _L, 0.0), 'cm':(1e-2, _L, 0.0), 'um':(1e-6, _L, 0.0), 'km':(1e3, _L, 0.0),
+    'in':(0.0254, _L, 0.0), 'ft':(0.3048, _L, 0.0), 'mil':(2.54e-5, _L, 0.0),
+    # -- Mass
+    'kg':(1.0, _M, 0.0), 'g':(1e-3, _M, 0.0), 'mg':(1e-6, _M, 0.0), 'lb':(0.45359237, _M, 0.0), 'lbm':(0.45359237, _M, 0.0),
+    # -- Time
+    's':(1.0, _T, 0.0), 'sec':(1.0, _T, 0.0), 'ms':(1e-3, _T, 0.0), 'us':(1e-6, _T, 0.0), 'min':(60.0, _T, 0.0),
+    'h':(3600.0, _T, 0.0), 'hr':(3600.0, _T, 0.0), 'day':(86400.0, _T, 0.0),
+    # -- Temperature (offsets only apply to a temperature on its own)
+    'K':(1.0, _K, 0.0), 'C':(1.0, _K, 273.15), 'degC':(1.0, _K, 273.15), 'F':(5/9, _K, 255.3722222222222),
+    'degF':(5/9, _K, 255.3722222222222), 'R':(5/9, _K, 0.0),
+    # -- Force
+    'N':(1.0, _F, 0.0), 'kN':(1e3, _F, 0.0), 'MN':(1e6, _F, 0.0), 'lbf':(4.4482216152605, _F, 0.0), 'kip':(4448.2216152605, _F, 0.0),
+    'kgf':(9.80665, _F, 0.0),
+    # -- Stress
+    'Pa':(1.0, _P, 0.0), 'kPa':(1e3, _P, 0.0), 'MPa':(1e6, _P, 0.0), 'GPa':(1e9, _P, 0.0), 'psi':(6894.757293168, _P, 0.0),
+    'ksi':(6894757.293168, _P, 0.0), 'Msi':(6894757293.168, _P, 0.0), 'bar':(1e5, _P, 0.0),
+    # -- Energy
+    'J':(1.0, _E, 0.0), 'kJ':(1e3, _E, 0.0),
+    # -- Dimensionless
+    '1':(1.0, _N, 0.0), '%':(1e-2, _N, 0.0), 'ustrain':(1e-6, _N, 0.0), 'microstrain':(1e-6, _N, 0.0), 'strain':(1.0, _N, 0.0),
+    'rad':(1.0, _N, 0.0), 'deg':(np.pi/180, _N, 0.0), 'cycles':(1.0, _N, 0.0), 'Hz':(1.0, (0, 0, -1, 0), 0.0),
+}
+
+# -- Spellings normalized before parsing
+_SPELLINGS = [('°', 'deg'), ('µ', 'u'), ('μ', 'u'), ('²', '^2'), ('³', '^3'), ('·', '*'), ('**', '^')]
+_ALIASES = {'degK':'K', 'deg C':'degC', 'deg F':'degF', 'seconds':'s', 'minutes':'min', 'hours':'h', 'in/in':'1', 'mm/mm':'1',
+            'm/m':'1', 'um/m':'ustrain', 'none':'1', '-':'1', '':'1'}
+
+_TERM = re.compile(r'^([A-Za-z%]+|1)(?:\^?(-?\d+))?$')
+_LINK_PART = re.compile(r"\s*(?:((?:\[\s*'[^']*'\s*\])+)|'([^']*)')\s*(\+|$)")
+_LINK_KEY = re.compile(r"\[\s*'([^']*)'\s*\]")
+
+#==================================================================================================================================================================
+# UNITS LINKS
+
+class UnitsLink:
+    # -- text: UnitsLink string from a template
+    def __init__(self, text):
+        self.text = text
+        self.parts = []     # Path tuples and literal strings, in order
+        pos = 0
+        while pos < len(text):
+            m = _LINK_PART.match(text, pos)
+            if m == None or m.end() == pos:
+                raise ValueError(f'Cannot parse UnitsLink {text!r}')
+            if m.group(1) != None:
+                self.parts.append(tuple(_LINK_KEY.findall(m.group(1))))
+            else:
+                self.parts.append(m.group(2))
+            pos = m.end()
+
+    # Get the paths read from a neutral file to resolve the link
+    def paths(self):
+        return [part for part in self.parts if isinstance(part, tuple)]
+
+    # Resolve the unit string from the values read from a neutral file
+    # -- Returns None if any linked unit is missing
+    def resolve(self, values):
+        text = ''
+        for part in self.parts:
+            if isinstance(part, tuple):
+                value = values.get(part)
+                if value in (None, ''):
+                    return None
+                text = text + str(value)
+            else:
+                text = text + part
+        return text
+
+# Compile every UnitsLink of a template catalog
+# -- Returns {"Category - Attribute": UnitsLink}, each distinct link string is only parsed once
+def compile_links(Catalog):
+    compiled = {}
+    links = {}
+    for name, text in Catalog.units_links.items():
+        if text not in compiled:
+            compiled[text] = UnitsLink(text)
+        links[name] = compiled[text]
+    return links
+
+#==================================================================================================================================================================
+# UNIT PARSING AND CONVERSION
+
+# Normalize the spelling of a unit string
+def normalize(unit):
+    unit = unit.strip()
+    for old, new in _SPELLINGS:
+        unit = unit.replace(old, new)
+    return _ALIASES.get(unit, unit)
+
+# Parse a unit string into its scale to SI, dimensions and offset
+# -- Units are products and quotients of the units in UNITS with optional integer powers (e.g. 'N*m', 'mm^2', 'MPa/s')
+# -- Offsets only apply to a lone temperature, a temperature in a compound unit is a difference (e.g. 'degC/min')
+@lru_cache(maxsize=None)
+def parse_unit(unit):
+    text = normalize(unit)
+    if text in UNITS:
+        return UNITS[text]
+    scale = 1.0
+    dims = [0, 0, 0, 0]
+    for sign, term in re.findall(r'([*/]?)\s*([^*/]+)', text):
+        term = term.strip()
+        m = _TERM.match(term)
+        if m == None:
+            raise ValueError(f"Unknown unit '{unit}'")
+        name = _ALIASES.get(m.group(1), m.group(1))
+        if name not in UNITS:
+            raise ValueError(f"Unknown unit '{unit}'")
+        power = int(m.group(2) or 1) * (-1 if sign == '/' else 1)
+        term_scale, term_dims, offset = UNITS[name]
+        scale = scale * term_scale**power
+        for k in range(4):
+            dims[k] = dims[k] + term_dims[k]*power
+    return (scale, tuple(dims), 0.0)
+
+# Get the scale and offset converting values from one unit to another (to = from*scale + offset)
+# -- Raises ValueError for unknown or incompatible units
+@lru_cache(maxsize=None)
+def conversion(from_unit, to_unit):
+    if normalize(from_unit) == normalize(to_unit):
+        return 1.0, 0.0
+    from_scale, from_dims, from_offset = parse_unit(from_unit)
+    to_scale, to_dims, to_offset = parse_unit(to_unit)
+    if from_dims != to_dims:
+        raise ValueError(f"Cannot convert '{from_unit}' to '{to_unit}'")
+    return from_scale/to_scale, (from_offset - to_offset)/to_scale
+
+# Check if two units can be converted
+def compatible(from_unit, to_unit):
+    try:
+        conversion(from_unit, to_unit)
+    except ValueError:
+        return False
+    return True
+
+# Convert values from one unit to another
+# -- Whole arrays are converted at once; float64 arrays are converted in place when inplace is True
+def convert(values, from_unit, to_unit, inplace=False):
+    scale, offset = conversion(from_unit, to_unit)
+    if inplace and isinstance(values, np.ndarray) and values.dtype == np.float64:
+        array = values
+    else:
+        array = np.array(values, dtype=np.float64)
+    if scale != 1.0:
+        np.multiply(array, scale, out=array)
+    if offset != 0.0:
+        np.add(array, offset, out=array)
+    return array
+
+#==================================================================================================================================================================
+# CONVERSION PLAN
+# The units of every mapped functional and tabular value, compiled once per configuration
+
+class UnitPlan:
+    # -- Config: configuration whose mappings are converted
+    # -- Catalog: TemplateCatalog of the templates the mappings were made against
+    def __init__(self, Config, Catalog):
+        links = compile_links(Catalog)
+        Atts = Config['Atts']
+        self.targets = []   # (Py MI Lab attribute, UnitsLink, Granta MI unit, (section, attribute, field))
+
+        # -- Functional Attributes: X and Y against the Granta MI variable units
+        for att, mapping in Config.get('Functional', {}).items():
+            units = Atts['Functional'].get(att, {}).get('Units', [None, None])
+            for field, unit in zip(('X', 'Y'), units):
+                name = mapping.get(field)
+                if name not in (None, '') and name in links and unit not in (None, ''):
+                    self.targets.append((name, links[name], unit, ('Functional', att, field)))
+
+        # -- Tabular Attributes: each column against the Granta MI column units
+        for att, mapping in Config.get('Tabular', {}).items():
+            units = dict(zip(Atts['Tabular'].get(att, {}).get('Columns', []), Atts['Tabular'].get(att, {}).get('Units', [])))
+            for col, name in zip(mapping['GrantaCols'], mapping['PyCols']):
+                unit = units.get(col)
+                if name not in (None, '') and name in links and unit not in (None, ''):
+                    self.targets.append((name, links[name], unit, ('Tabular', att, col)))
+
+    # Get the paths to read from each neutral file to resolve the units
+    def paths(self):
+        paths = []
+        for name, link, unit, where in self.targets:
+            paths.extend(link.paths())
+        return list(dict.fromkeys(paths))
+
+    # Check the units that can be resolved from a neutral file against the Granta MI units
+    # -- Returns a list of (where, record unit, Granta MI unit, message) for units that cannot be converted
+    def check(self, values):
+        problems = []
+        for name, link, unit, where in self.targets:
+            record_unit = link.resolve(values)
+            if record_unit == None:
+                continue
+            try:
+                conversion(record_unit, unit)
+            except ValueError as e:
+                problems.append((where, record_unit, unit, str(e)))
+        return problems
+
+    # Convert the mapped values of a neutral file to the Granta MI units
+    # -- values: {name or path: value} read with a NeutralReader that includes self.paths()
+    # -- Returns {(section, attribute, field): converted array} for every value whose units were resolved, values in unknown or
+    #    incompatible units are left out; a value mapped more than once to the same unit is only converted once
+    def convert(self, values):
+        converted = {}
+        arrays = {}
+        for name, link, unit, where in self.targets:
+            if name not in values:
+                continue
+            record_unit = link.resolve(values)
+            if record_unit == None:
+                continue
+            key = (name, record_unit, unit)
+            if key not in arrays:
+                try:
+                    arrays[key] = convert(values[name], record_unit, unit)
+                except (ValueError, TypeError):
+                    arrays[key] = None
+            if arrays[key] is not None:
+                converted[where] = arrays[key]
+        return converted
@@ -0,0 +1,345 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Schema Update
+#
+#   PURPOSE: Update an existing configuration to a revised Granta MI Schema workbook, re-parsing only what changed
+#
+#   Each worksheet is fingerprinted from its cells with the shared strings and styles they refer to resolved, i.e. from the
+#   position, text and fill of every cell. Excel keeps the text of every sheet in one shared strings part, so editing any cell
+#   changes that part; resolving the references means only the sheets whose own cells changed are re-parsed. The CRC and size
+#   of each part stored in the .xlsx (zip) directory are kept too: a sheet whose part and the shared parts are unchanged reuses
+#   its previous fingerprint without being decompressed. Each Data sheet row is fingerprinted by its name and value.
+#
+#   The fingerprints are stored in Config['Fingerprints']. When a revised workbook is uploaded, only the changed sheets are read,
+#   an attribute level diff against the configuration's Atts is reported, and every mapping of an unaffected attribute is kept.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import io
+import json
+import posixpath
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+
+from SchemaConfig import apply_config
+from SchemaParser import DATA_SHEET, PARSER_VERSION, build_atts, read_workbook, sheet_index
+
+# Set Workbook Part Names
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+SHARED_PARTS = ('xl/sharedStrings.xml', 'xl/styles.xml')
+
+#==================================================================================================================================================================
+# FINGERPRINTS
+
+# Get the fingerprint of a zip member without decompressing it
+def part_fingerprint(info):
+    return f'{info.CRC:08x}-{info.file_size}'
+
+# Map the sheet names of an open workbook to their parts, in workbook order
+def sheet_parts(z):
+    rels = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+    targets = {}
+    for rel in rels.iter(PKG_REL_NS + 'Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join('xl', target))
+        targets[rel.get('Id')] = target
+
+    Parts = {}
+    workbook = ET.fromstring(z.read('xl/workbook.xml'))
+    for sheet in workbook.iter(MAIN_NS + 'sheet'):
+        Parts[sheet.get('name')] = targets.get(sheet.get(REL_NS + 'id'))
+    return Parts
+
+# Get the sheet names of a workbook in workbook order
+def sheet_names(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        return list(sheet_parts(z).keys())
+
+# Read the text of each shared string
+def shared_strings(z):
+    strings = []
+    if SHARED_PARTS[0] not in z.namelist():
+        return strings
+    with z.open(SHARED_PARTS[0]) as f:
+        for event, elem in ET.iterparse(f):
+            if elem.tag == MAIN_NS + 'si':
+                strings.append(''.join(t.text or '' for t in elem.iter(MAIN_NS + 't')))
+                elem.clear()
+    return strings
+
+# Get the key of each cell style from what a cell shows: its fill and number format
+def style_keys(z):
+    if SHARED_PARTS[1] not in z.namelist():
+        return []
+    styles = ET.fromstring(z.read(SHARED_PARTS[1]))
+    fills = styles.find(MAIN_NS + 'fills')
+    fills = [ET.tostring(fill) for fill in fills] if fills != None else []
+    formats = styles.find(MAIN_NS + 'numFmts')
+    formats = {fmt.get('numFmtId'):fmt.get('formatCode') for fmt in formats} if formats != None else {}
+    xfs = styles.find(MAIN_NS + 'cellXfs')
+    keys = []
+    for xf in (xfs if xfs != None else []):
+        fill_id = int(xf.get('fillId', 0))
+        fmt_id = xf.get('numFmtId', '0')
+        fill = fills[fill_id] if fill_id < len(fills) else b''
+        keys.append(fill + b'|' + str(formats.get(fmt_id, fmt_id)).encode('utf-8'))
+    return keys
+
+# Get the fingerprint of a worksheet from its cells, with the shared strings and styles they refer to resolved
+# -- Shared, inline and formula strings with the same text give the same fingerprint
+def sheet_fingerprint(z, part, strings, styles):
+    crc = 0
+    with z.open(part) as f:
+        for event, elem in ET.iterparse(f):
+            if elem.tag == MAIN_NS + 'c':
+                kind = elem.get('t')
+                if kind == 'inlineStr':
+                    value = ''.join(t.text or '' for t in elem.iter(MAIN_NS + 't'))
+                else:
+                    value = elem.findtext(MAIN_NS + 'v')
+                    if kind == 's' and value != None and int(value) < len(strings):
+                        value = strings[int(value)]
+                if kind in ('s', 'inlineStr'):
+                    kind = 'str'
+                style = int(elem.get('s', 0))
+                text = json.dumps([elem.get('r'), kind, value]).encode('utf-8')
+                crc = zlib.crc32(text + (styles[style] if style < len(styles) else b''), crc)
+                elem.clear()
+            elif elem.tag == MAIN_NS + 'row':
+                elem.clear()
+    return f'{crc:08x}'
+
+# Get the fingerprints of the workbook parts
+# -- Prev_Fingerprints: fingerprints of a previous version of the workbook, whose sheet fingerprints are reused for the sheets
+#    whose part and shared parts are unchanged
+# -- Returns {'Workbook': shared parts fingerprint, 'Parts': {sheet name: part fingerprint}, 'Sheets': {sheet name: fingerprint}}
+#    with the sheets in workbook order
+def workbook_fingerprints(data, Prev_Fingerprints=None):
+    Prev = {}
+    if Prev_Fingerprints != None and Prev_Fingerprints.get('Version') == PARSER_VERSION and 'Parts' in Prev_Fingerprints:
+        Prev = {sheet:Fingerprint[0] for sheet, Fingerprint in Prev_Fingerprints['Sheets'].items()}
+        Prev[DATA_SHEET] = Prev_Fingerprints['Data'][0]
+
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        infos = {info.filename:info for info in z.infolist()}
+        shared = '/'.join(part_fingerprint(infos[part]) if part in infos else '' for part in SHARED_PARTS)
+        if len(Prev) > 0 and Prev_Fingerprints.get('Workbook') != shared:
+            Prev_Parts = {}
+        else:
+            Prev_Parts = Prev_Fingerprints['Parts'] if len(Prev) > 0 else {}
+
+        Parts = {}
+        Sheets = {}
+        strings = None
+        for sheet, part in sheet_parts(z).items():
+            if part not in infos:
+                Parts[sheet] = Sheets[sheet] = None
+                continue
+            Parts[sheet] = part_fingerprint(infos[part])
+            if Prev_Parts.get(sheet) == Parts[sheet] and Prev.get(sheet) != None:
+                Sheets[sheet] = Prev[sheet]
+                continue
+
+            # -- The shared parts are only read when a sheet has to be fingerprinted
+            if strings == None:
+                strings = shared_strings(z)
+                styles = style_keys(z)
+            Sheets[sheet] = sheet_fingerprint(z, part, strings, styles)
+
+    return {'Workbook':shared, 'Parts':Parts, 'Sheets':Sheets}
+
+# Get the fingerprint of each Data sheet row from its name and value
+def row_fingerprints(Single):
+    rows = {}
+    for name, value in Single.items():
+        text = json.dumps([name, value], default=str)
+        rows[name] = f'{zlib.crc32(text.encode("utf-8")):08x}'
+    return rows
+
+# Build the fingerprints stored with a configuration
+# -- parts: workbook_fingerprints, Sheets: {sheet: [attribute type, attribute name]}, Single: single value attributes
+def schema_fingerprints(parts, Sheets, Single):
+    Fingerprints = {'Version':PARSER_VERSION,
+                    'Workbook':parts['Workbook'],
+                    'Parts':parts['Parts'],
+                    'Sheets':{},
+                    'Data':[parts['Sheets'].get(DATA_SHEET), row_fingerprints(Single)]}
+    for sheet, (att_type, att_name) in Sheets.items():
+        Fingerprints['Sheets'][sheet] = [parts['Sheets'].get(sheet), att_type, att_name]
+    return Fingerprints
+
+# Get the fingerprints of a workbook from its bytes and cached sheet index (see SchemaCache.get_schema)
+def fingerprint_schema(data, Schema):
+    return schema_fingerprints(workbook_fingerprints(data), Schema['Sheets'], Schema['Atts']['Single Value'])
+
+#==================================================================================================================================================================
+# INCREMENTAL PARSING
+
+# Parse a revised workbook, reusing the Atts of every sheet whose fingerprint has not changed
+# -- progress: called after each sheet read (see SchemaParser.read_sheets)
+# -- Returns the new Atts, their fingerprints and a summary of what was re-parsed
+def parse_incremental(data, Prev_Atts=None, Prev_Fingerprints=None, parallel=False, progress=None):
+    # Previous results can only be reused if they were made by this parser
+    if Prev_Atts == None or Prev_Fingerprints == None or Prev_Fingerprints.get('Version') != PARSER_VERSION:
+        Prev_Fingerprints = None
+    Prev = Prev_Fingerprints if Prev_Fingerprints != None else {'Sheets':{}, 'Data':[None, {}]}
+    parts = workbook_fingerprints(data, Prev_Fingerprints)
+    names = list(parts['Sheets'].keys())
+    Sheets = names[:names.index(DATA_SHEET)] if DATA_SHEET in names else names
+
+    # Find the changed sheets
+    changed = []
+    for sheet in Sheets:
+        prev = Prev['Sheets'].get(sheet)
+        if prev == None or prev[0] != parts['Sheets'][sheet] or prev[2] not in Prev_Atts.get(prev[1], {}):
+            changed.append(sheet)
+    read_data = Prev['Data'][0] == None or Prev['Data'][0] != parts['Sheets'].get(DATA_SHEET)
+
+    # Read only the changed sheets
+    Results = {}
+    Single = None
+    if len(changed) > 0 or read_data:
+        all_sheets, Results, Single = read_workbook(data, parallel, only=changed, read_data=read_data, progress=progress)
+    if Single == None:
+        Single = Prev_Atts['Single Value']
+
+    # Merge the new and reused sheets in sheet order
+    results = []
+    for sheet in Sheets:
+        if sheet in Results:
+            results.append(Results[sheet])
+        else:
+            att_type, att_name = Prev['Sheets'][sheet][1:]
+            results.append((att_type, att_name, Prev_Atts[att_type][att_name]))
+    Atts = build_atts(results, Single)
+
+    Index = sheet_index(dict(zip(Sheets, results)))
+    Fingerprints = schema_fingerprints(parts, Index, Single)
+    Summary = {'sheets':len(Sheets),
+               'reparsed':changed,
+               'data_reparsed':read_data}
+    return Atts, Fingerprints, Summary
+
+#==================================================================================================================================================================
+# DIFF
+
+# Compare two sets of Granta MI attributes
+# -- Attributes that moved between Single Value, Functional and Tabular are reported as retyped rather than added and removed
+# -- Row fingerprints, when given for both, are used to find changed single values
+def diff_atts(Old, New, Old_Rows=None, New_Rows=None):
+    sections = ('Single Value', 'Functional', 'Tabular')
+    Diff = {'retyped':[]}
+
+    # Find the retyped attributes
+    old_type = {}
+    new_type = {}
+    for section in sections:
+        for att in Old.get(section, {}):
+            old_type[att] = section
+        for att in New.get(section, {}):
+            new_type[att] = section
+    retyped = set()
+    for att, section in new_type.items():
+        if att in old_type and old_type[att] != section:
+            Diff['retyped'].append({'name':att, 'from':old_type[att], 'to':section})
+            retyped.add(att)
+
+    for section in sections:
+        old = Old.get(section, {})
+        new = New.get(section, {})
+        Diff[section] = {'added':[att for att in new if att not in old and att not in retyped],
+                         'removed':[att for att in old if att not in new and att not in retyped],
+                         'changed':[]}
+        for att in new:
+            if att not in old:
+                continue
+
+            # -- Single Attributes: default value
+            if section == 'Single Value':
+                if Old_Rows != None and New_Rows != None:
+                    if Old_Rows.get(att) != New_Rows.get(att):
+                        Diff[section]['changed'].append({'name':att, 'value':[old[att], new[att]]})
+                elif old[att] != new[att]:
+                    Diff[section]['changed'].append({'name':att, 'value':[old[att], new[att]]})
+
+            # -- Functional Attributes: X and Y variables and units
+            elif section == 'Functional':
+                if old[att] != new[att]:
+                    Diff[section]['changed'].append({'name':att,
+                                                     'variables':[old[att]['Variables'], new[att]['Variables']],
+                                                     'units':[old[att]['Units'], new[att]['Units']]})
+
+            # -- Tabular Attributes: columns and units
+            else:
+                if old[att] != new[att]:
+                    old_cols = dict(zip(old[att]['Columns'], old[att]['Units']))
+                    new_cols = dict(zip(new[att]['Columns'], new[att]['Units']))
+                    Diff[section]['changed'].append({'name':att,
+                                                     'columns_added':[col for col in new_cols if col not in old_cols],
+                                                     'columns_removed':[col for col in old_cols if col not in new_cols],
+                                                     'units_changed':[col for col in new_cols if col in old_cols and old_cols[col] != new_cols[col]],
+                                                     'reordered':[c for c in old[att]['Columns'] if c in new_cols] != [c for c in new[att]['Columns'] if c in old_cols]})
+    return Diff
+
+# Count the attribute changes in a diff
+def count_changes(Diff):
+    total = len(Diff['retyped'])
+    for section in ('Single Value', 'Functional', 'Tabular'):
+        total = total + sum(len(Diff[section][kind]) for kind in ('added', 'removed', 'changed'))
+    return total
+
+#==================================================================================================================================================================
+# UPDATE CONFIGURATION
+
+# Update a configuration to a revised schema workbook
+# -- Returns the updated configuration, the attribute diff and the re-parse summary
+def update_config(Prev_Config, data, parallel=False, progress=None):
+    Prev_Atts = Prev_Config.get('Atts')
+    Prev_Fingerprints = Prev_Config.get('Fingerprints')
+    Atts, Fingerprints, Summary = parse_incremental(data, Prev_Atts, Prev_Fingerprints, parallel, progress)
+
+    Old_Rows = None
+    if Prev_Fingerprints != None and Prev_Fingerprints.get('Version') == PARSER_VERSION:
+        Old_Rows = Prev_Fingerprints['Data'][1]
+    Diff = diff_atts(Prev_Atts or {}, Atts, Old_Rows, Fingerprints['Data'][1])
+
+    # Keep every mapping of an unaffected attribute
+    Config = apply_config(Prev_Config, Atts)
+    Config['Fingerprints'] = Fingerprints
+    return Config, Diff, Summary
+
+# Format a diff as a list of readable lines
+def format_diff(Diff):
+    lines = []
+    for item in Diff['retyped']:
+        lines.append(f"{item['name']}: retyped from {item['from']} to {item['to']}")
+    for section in ('Single Value', 'Functional', 'Tabular'):
+        for att in Diff[section]['added']:
+            lines.append(f'{att}: added {section} attribute')
+        for att in Diff[section]['removed']:
+            lines.append(f'{att}: removed {section} attribute')
+        for item in Diff[section]['changed']:
+            if section == 'Single Value':
+                lines.append(f"{item['name']}: value changed from {item['value'][0]} to {item['value'][1]}")
+            elif section == 'Functional':
+                lines.append(f"{item['name']}: variables changed from {item['variables'][0]} {item['units'][0]} to {item['variables'][1]} {item['units'][1]}")
+            else:
+                changes = []
+                if len(item['columns_added']) > 0:
+                    changes.append('columns added ' + ', '.join(item['columns_added']))
+                if len(item['columns_removed']) > 0:
+                    changes.append('columns removed ' + ', '.join(item['columns_removed']))
+                if len(item['units_changed']) > 0:
+                    changes.append('units changed for ' + ', '.join(item['units_changed']))
+                if item['reordered']:
+                    changes.append('columns reordered')
+                lines.append(f"{item['name']}: " + '; '.join(changes))
+    return lines
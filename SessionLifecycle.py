@@ -0,0 +1,137 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Session State Lifecycle
+#
+#   PURPOSE: Keep the session state of long editing sessions bounded by removing the widget keys of editors that are no longer
+#            shown, and report how the session state memory is used
+#
+#   Several editors create their widget keys from counters and positions: the tabular editor makes new tab_a_/tab_b_ keys every
+#   time a different tabular attribute is selected, the placement editor makes folder_sec_ keys per level and condition, and the
+#   mapping grids make a new editor key per page and search. Streamlit drops the values of widgets that were not drawn in a
+#   rerun, but keeps the mapping from each key it has ever seen to its widget id, so a session that switches attributes or pages
+#   many times grows without bound.
+#
+#   At the end of each rerun collect_garbage() removes every key of these families that was not drawn in that rerun, together with
+#   its widget id. Keys of other families (the configuration, flags, caches) are never touched. Removing the widget ids needs
+#   internals of the Streamlit session state (checked against Streamlit 1.28); on versions without them only the values are
+#   removed, through the public st.session_state.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import logging
+import os
+import re
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Set the Widget Key Families
+# -- (family, pattern, collected): keys of collected families are removed when they are not drawn in a rerun
+FAMILIES = [
+    ('Tabular Editor', re.compile(r'tab_[ab]_\d+(_cat)?$'), True),
+    ('Placement Editor', re.compile(r'folder_(sec_[a-f]_\d+_\d+|lev_[ab]_\d+)(_cat)?$'), True),
+    ('Single Value Editor', re.compile(r'single_val_b_\d+(_cat)?$'), True),
+    ('Functional Editor', re.compile(r'func_([bc]|dec_[mpt])_\d+(_cat)?$'), True),
+    ('Mapping Grids', re.compile(r'(single|func)_grid_grid_.*$'), True),
+    ('Configuration', re.compile(r'(Config|Atts|Fingerprints|Schema_.*|Writer|Journal.*)$'), False),
+    ('Diagnostics', re.compile(r'(Profile_History|Profile_Reruns|show_diagnostics)$'), False),
+]
+OTHER = 'Other'
+
+# -- Keys written by earlier versions of the app that are no longer used
+RETIRED_KEYS = ('col_names',)
+
+# -- Private attributes of the Streamlit session state used to find and remove widget ids
+STATE_INTERNALS = ('_key_id_mapping', '_new_session_state', '_old_state')
+
+STATE_BUDGET = int(os.environ.get('SCHEMA_STATE_BUDGET', 0))   # Session state size in bytes logged as a warning (0 = no limit)
+
+logger = logging.getLogger(__name__)
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the family of a session state key
+# -- Returns the family name and whether its keys are collected
+def key_family(key):
+    for family, pattern, collected in FAMILIES:
+        if pattern.match(key):
+            return family, collected
+    return OTHER, False
+
+# Check whether a session state key can be removed
+# -- drawn: user keys of the widgets drawn in this rerun
+def _collectable(key, drawn):
+    if key in RETIRED_KEYS:
+        return True
+    family, collected = key_family(key)
+    return collected and key not in drawn
+
+# Get the Streamlit session state of the current script run
+# -- Returns None when there is no script run or this Streamlit version does not have the internals used here
+def _session_state(ctx):
+    if ctx == None or ctx.session_state == None or not hasattr(ctx.session_state, '_lock'):
+        return None
+    state = getattr(ctx.session_state, '_state', None)
+    if state == None or not all(hasattr(state, name) for name in STATE_INTERNALS):
+        return None
+    return state
+
+# Remove the keys of editors that were not drawn in this rerun
+# -- Call at the end of the script, after every editor has been drawn
+# -- Returns the number of values and of orphaned widget ids removed
+def collect_garbage():
+    ctx = get_script_run_ctx()
+    removed = {'values':0, 'widget_ids':0}
+    drawn = getattr(ctx, 'widget_user_keys_this_run', None) if ctx != None else None
+    if drawn == None:
+        return removed
+    state = _session_state(ctx)
+    if state == None:
+        # -- Without the internals only the values are removed, the widget ids are left to Streamlit
+        for key in list(st.session_state.keys()):
+            if isinstance(key, str) and _collectable(key, drawn):
+                del st.session_state[key]
+                removed['values'] = removed['values'] + 1
+        return removed
+
+    with ctx.session_state._lock:
+        keys = set(state._key_id_mapping.keys())
+        keys.update(key for key in state._new_session_state.keys() if isinstance(key, str))
+        keys.update(key for key in state._old_state.keys() if isinstance(key, str))
+        for key in keys:
+            if not _collectable(key, drawn):
+                continue
+            if key in state:
+                del state[key]
+                removed['values'] = removed['values'] + 1
+            elif key in state._key_id_mapping:
+                # -- Widget value already dropped by Streamlit, only its id is left
+                del state._key_id_mapping[key]
+                removed['widget_ids'] = removed['widget_ids'] + 1
+    return removed
+
+# Summarize the session state memory by key family
+# -- sizes: {key: estimated bytes} (see Profiler.session_state_sizes)
+# -- Returns {'families':{family: {'keys', 'bytes'}}, 'widget_ids', 'bytes', 'over_budget'}
+def memory_report(sizes):
+    Families = {}
+    for key, size in sizes.items():
+        family, collected = key_family(key)
+        if family not in Families:
+            Families[family] = {'keys':0, 'bytes':0}
+        Families[family]['keys'] = Families[family]['keys'] + 1
+        Families[family]['bytes'] = Families[family]['bytes'] + size
+
+    state = _session_state(get_script_run_ctx())
+    total = sum(sizes.values())
+    Report = {'families':Families,
+              'widget_ids':len(state._key_id_mapping) if state != None else 0,
+              'bytes':total,
+              'over_budget':STATE_BUDGET > 0 and total > STATE_BUDGET}
+    if Report['over_budget']:
+        largest = max(Families.items(), key=lambda item: item[1]['bytes'])[0]
+        logger.warning('Session state is %.1f kB, over the %.1f kB budget (largest: %s)', total/1024, STATE_BUDGET/1024, largest)
+    return Report
@@ -0,0 +1,165 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Tabular Assembler
+#
+#   PURPOSE: Build the rows of a tabular attribute from the Py MI Lab values mapped to its Granta MI columns
+#
+#   The Py MI Lab attributes mapped to the columns of a tabular attribute (Config['Tabular'][att]['PyCols']) can be of any type
+#   but dict: point arrays, string arrays, points and strings. The table is built column by column:
+#       arrays      become one buffer per column, float64 for numbers and object for strings
+#       scalars     (points and strings) are repeated down the whole column
+#       unmapped    columns, and mapped attributes missing from the record, are left empty
+#   Arrays of different lengths are aligned with one of the ALIGNMENTS, and every column whose length differed from the table
+#   is reported so the writer can flag it. Padding cells are NaN in numeric buffers and None in object buffers, and both are
+#   written as empty cells.
+#
+#   The finished table is a list of contiguous column buffers of the same length, which a writer streams as rows in one pass.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import itertools
+
+import numpy as np
+
+# Set the Alignment Policies
+PAD = 'pad'                 # Shorter arrays are padded with empty cells to the longest array
+TRUNCATE = 'truncate'       # Every array is cut to the shortest array
+STRICT = 'strict'           # Arrays that are not as long as the first mapped array are left empty
+ALIGNMENTS = (PAD, TRUNCATE, STRICT)
+
+#==================================================================================================================================================================
+# FUNCTIONS
+
+# Get the column buffer of a mapped value
+# -- Returns the buffer and whether it is an array (scalars are returned as one-element buffers)
+def column_buffer(value):
+    if isinstance(value, np.ndarray):
+        array = value.ravel() if value.ndim != 1 else value
+        is_array = value.ndim > 0
+    elif isinstance(value, (list, tuple)):
+        array = value
+        is_array = True
+    else:
+        array = [value]
+        is_array = False
+
+    # -- Numbers (with None as a missing number) go in float64 buffers, anything else in object buffers
+    # -- Strings are never parsed as numbers, so string arrays such as specimen IDs are written as they are
+    if isinstance(array, np.ndarray) and array.dtype.kind in 'biuf':
+        return array.astype(np.float64, copy=False), is_array
+    if not any(isinstance(v, str) for v in array):
+        try:
+            return np.asarray(array, dtype=np.float64), is_array
+        except (TypeError, ValueError):
+            pass
+    buffer = np.empty(len(array), dtype=object)
+    buffer[:] = list(array)
+    return buffer, is_array
+
+# Get the empty buffer of a column of a given kind
+def empty_buffer(length, like=None):
+    if like is not None and like.dtype == object:
+        return np.full(length, None, dtype=object)
+    return np.full(length, np.nan)
+
+# Fit a buffer to the table length, padding with empty cells or cutting the end
+def fit_buffer(buffer, length):
+    if len(buffer) == length:
+        return buffer
+    if len(buffer) > length:
+        return buffer[:length]
+    padded = empty_buffer(length, buffer)
+    padded[:len(buffer)] = buffer
+    return padded
+
+# Get the cell values of a column buffer
+# -- NaN padding and missing numbers are written as empty cells
+def buffer_cells(buffer):
+    if buffer.dtype == object:
+        return buffer.tolist()
+    missing = np.isnan(buffer)
+    if not missing.any():
+        return buffer.tolist()
+    cells = buffer.astype(object)
+    cells[missing] = None
+    return cells.tolist()
+
+#==================================================================================================================================================================
+# TABULAR TABLE
+
+class TabularTable:
+    # -- columns: Granta MI columns in table order
+    # -- buffers: column buffers of the same length (None for empty columns)
+    # -- mismatches: (Granta MI column, array length) of the arrays whose length differed from the table
+    def __init__(self, columns, buffers, length, mismatches):
+        self.columns = columns
+        self.buffers = buffers
+        self.length = length
+        self.mismatches = mismatches
+
+    def __len__(self):
+        return self.length
+
+    # Get the buffer of a Granta MI column
+    def column(self, name):
+        return self.buffers[self.columns.index(name)]
+
+    # Get the cell values of every column (an iterator of empty cells for empty columns)
+    def cells(self):
+        return [buffer_cells(buffer) if buffer is not None else itertools.repeat(None, self.length) for buffer in self.buffers]
+
+    # Iterate over the rows of the table
+    def rows(self):
+        return zip(*self.cells()) if len(self.buffers) > 0 else iter(())
+
+#==================================================================================================================================================================
+# ASSEMBLY
+
+# Assemble a tabular attribute from the values mapped to its columns
+# -- columns: Granta MI columns
+# -- values: value mapped to each column (None for unmapped columns and missing attributes)
+# -- align: how arrays of different lengths are aligned (see ALIGNMENTS)
+def assemble_tabular(columns, values, align=PAD):
+    if align not in ALIGNMENTS:
+        raise ValueError(f"Unknown alignment '{align}', expected one of {', '.join(ALIGNMENTS)}")
+    columns = list(columns)
+
+    # Get the buffer of each mapped column
+    buffers = []
+    arrays = []
+    for value in values:
+        if value is None:
+            buffers.append((None, False))
+            continue
+        buffer, is_array = column_buffer(value)
+        buffers.append((buffer, is_array))
+        if is_array:
+            arrays.append(len(buffer))
+
+    # Get the table length
+    # -- A table of scalars only has one row, a table with nothing mapped has none
+    if len(arrays) > 0:
+        length = {PAD:max(arrays), TRUNCATE:min(arrays), STRICT:arrays[0]}[align]
+    else:
+        length = 1 if any(buffer is not None for buffer, is_array in buffers) else 0
+
+    # Align the arrays and repeat the scalars down the columns
+    table = []
+    mismatches = []
+    for col, (buffer, is_array) in zip(columns, buffers):
+        if buffer is None:
+            table.append(None)
+        elif not is_array:
+            repeated = empty_buffer(length, buffer)
+            repeated[:] = buffer[0]
+            table.append(repeated)
+        else:
+            if len(buffer) != length:
+                mismatches.append((col, len(buffer)))
+                if align == STRICT:
+                    buffer = empty_buffer(length, buffer)
+            table.append(fit_buffer(buffer, length))
+    table = table + [None]*(len(columns) - len(table))
+    return TabularTable(columns, table, length, mismatches)
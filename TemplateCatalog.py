@@ -0,0 +1,89 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Template Catalog
+#
+#   PURPOSE: Index the Py MI Lab attributes in the Raw and Analysis templates once per template set
+#
+#   Attributes are named "Category - Attribute". The catalog holds the option lists used by each section of the configuration
+#   manager along with a name to index hash map, so selectbox indices are found without scanning the option lists.
+#
+#==================================================================================================================================================================
+# SETUP
+
+# Set the Attribute Types Allowed in Each Section
+SINGLE_TYPES = ('point', 'string')
+FUNCTIONAL_TYPES = ('point array',)
+EXCLUDED_TYPES = ('dict',)
+
+#==================================================================================================================================================================
+# OPTION VIEW
+# Option list for a selectbox with its name to index map
+
+class OptionView:
+    def __init__(self, label, names):
+        self.label = label
+        self.options = [''] + list(names)
+        self.positions = {}
+        for i in range(len(self.options)):
+            self.positions[self.options[i]] = i
+
+        # Group the options by category for the two-stage pickers (see CategoryPicker)
+        # -- Each category option list starts with the empty option like the full list
+        self.categories = {}
+        for name in self.options[1:]:
+            self.categories.setdefault(name.partition(' - ')[0], ['']).append(name)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def __len__(self):
+        return len(self.options)
+
+    # Get the category of an attribute (None for the empty option and attributes not in the view)
+    def category_of(self, name):
+        if name in (None, '') or name not in self.positions:
+            return None
+        return name.partition(' - ')[0]
+
+    # Get the selectbox index of an attribute
+    def index(self, name):
+        if name not in self.positions:
+            raise ValueError(f"'{name}' is not a {self.label} Py MI Lab attribute")
+        return self.positions[name]
+
+#==================================================================================================================================================================
+# TEMPLATE CATALOG
+
+class TemplateCatalog:
+    def __init__(self, Raw, Analysis):
+        # Get the type of every attribute in template order
+        # -- Raw Data then Analysis Data
+        # -- Units links are kept for the attributes that have one (see SchemaUnits)
+        self.types = {}
+        self.categories = {}
+        self.units_links = {}
+        for Template in (Raw, Analysis):
+            for cat in Template.keys():
+                self.categories.setdefault(cat, [])
+                for att in Template[cat].keys():
+                    att_name = cat + ' - ' + att
+                    self.types[att_name] = Template[cat][att]['Type']
+                    self.categories[cat].append(att_name)
+                    if Template[cat][att].get('UnitsLink') not in (None, ''):
+                        self.units_links[att_name] = Template[cat][att]['UnitsLink']
+
+        # Group the attributes by type
+        self.by_type = {}
+        for att_name in self.types:
+            self.by_type.setdefault(self.types[att_name], []).append(att_name)
+
+        # Create the section views
+        # -- Single Value: point or string
+        # -- Functional: point array
+        # -- Tabular: anything but a dictionary
+        self.single = OptionView('single value', [n for n in self.types if self.types[n] in SINGLE_TYPES])
+        self.functional = OptionView('functional', [n for n in self.types if self.types[n] in FUNCTIONAL_TYPES])
+        self.tabular = OptionView('tabular', [n for n in self.types if self.types[n] not in EXCLUDED_TYPES])
+
+    # Get the type of an attribute
+    def type_of(self, name):
+        return self.types.get(name)
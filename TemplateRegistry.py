@@ -0,0 +1,180 @@
+#==================================================================================================================================================================
+#   Schema Configuration Tool - Template Registry
+#
+#   PURPOSE: Load each version of the Py MI Lab Raw and Analysis templates once per server process and share it read-only with
+#            every session
+#
+#   A template version is the pair of Raw and Analysis template files together with everything derived from them: the catalog
+#   of option lists, its fingerprint and the auto-mapper index. Sessions only keep the name of the version they use and get the
+#   shared version on each rerun, so the memory used per session does not grow with the size of the templates.
+#
+#   Versions are reloaded from disk when the modification time of either file changes. The reload builds a new version object;
+#   sessions still holding the previous one keep a consistent snapshot until their next rerun. Files are read outside the registry
+#   lock, so a session loading one version never blocks the sessions using another, and a reload that fails (e.g. a template file
+#   still being written) keeps the last good version until the files change again.
+#
+#   Named versions are listed in a JSON file given by the SCHEMA_TEMPLATE_VERSIONS environment variable:
+#       {"2024.1": {"raw": "/path/Raw_Template.json", "analysis": "/path/Analysis_Template.json"}, ...}
+#   The templates next to this file are always available as the 'Default' version.
+#
+#==================================================================================================================================================================
+# SETUP
+# Import the necessary modules
+
+# Import Modules
+import json
+import logging
+import os
+import threading
+import time
+
+from AutoMapper import AutoMapper
+from ConfigFormat import template_fingerprint
+from TemplateCatalog import TemplateCatalog
+
+# Set Registry Defaults
+DEFAULT_VERSION = 'Default'
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+VERSIONS_FILE = os.environ.get('SCHEMA_TEMPLATE_VERSIONS')
+CHECK_INTERVAL = 2.0        # Minimum seconds between checks of the template file modification times
+
+logger = logging.getLogger(__name__)
+
+#==================================================================================================================================================================
+# TEMPLATE VERSION
+# One loaded set of templates; treat every attribute as read-only since it is shared between sessions
+
+class TemplateVersion:
+    def __init__(self, name, raw_path, analysis_path):
+        self.name = name
+        self.raw_path = raw_path
+        self.analysis_path = analysis_path
+        self.mtimes = file_mtimes(raw_path, analysis_path)
+        with open(raw_path, encoding='utf-8') as f:
+            self.Raw = json.load(f)
+        with open(analysis_path, encoding='utf-8') as f:
+            self.Analysis = json.load(f)
+        self.catalog = TemplateCatalog(self.Raw, self.Analysis)
+        self.fingerprint = template_fingerprint(self.catalog)
+        self.loaded = time.time()
+        self._mapper = None
+        self._lock = threading.Lock()
+
+    # Get the shared auto-mapper, built on first use
+    def mapper(self):
+        with self._lock:
+            if self._mapper == None:
+                self._mapper = AutoMapper(self.catalog)
+            return self._mapper
+
+# Get the modification times of the template files
+def file_mtimes(*paths):
+    return tuple(os.stat(path).st_mtime_ns for path in paths)
+
+#==================================================================================================================================================================
+# TEMPLATE REGISTRY
+
+class TemplateRegistry:
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.paths = {}         # name -> (raw path, analysis path)
+        self._versions = {}     # name -> TemplateVersion
+        self._checked = {}      # name -> time the files were last checked
+        self._loading = {}      # name -> lock held while the version is loaded
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.reloads = 0
+
+    # Register a template version
+    def register(self, name, raw_path, analysis_path):
+        with self._lock:
+            self.paths[name] = (raw_path, analysis_path)
+            self._versions.pop(name, None)
+            self._loading.setdefault(name, threading.Lock())
+
+    # Register the versions listed in a JSON file
+    def register_file(self, path):
+        with open(path, encoding='utf-8') as f:
+            Versions = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        for name, files in Versions.items():
+            self.register(name, os.path.join(base, files['raw']), os.path.join(base, files['analysis']))
+
+    # Get the names of the registered versions
+    def names(self):
+        with self._lock:
+            return list(self.paths.keys())
+
+    # Get a template version, loading it on first use and reloading it when its files change
+    # -- name = None returns the default version
+    def get(self, name=None):
+        if name == None:
+            name = DEFAULT_VERSION
+        with self._lock:
+            if name not in self.paths:
+                raise KeyError(f"Unknown template version '{name}', expected one of {', '.join(self.paths)}")
+            version = self._versions.get(name)
+            now = time.monotonic()
+
+            # Check the file modification times at most once per check interval
+            if version != None and now - self._checked.get(name, 0.0) < self.check_interval:
+                return version
+            self._checked[name] = now
+            raw_path, analysis_path = self.paths[name]
+            loading = self._loading[name]
+        try:
+            mtimes = file_mtimes(raw_path, analysis_path)
+        except OSError:
+            mtimes = None
+        if version != None and mtimes == version.mtimes:
+            return version
+
+        # Load (or reload) the version
+        # -- Only one session loads a version at a time, the others wait for it and use the version it loaded
+        with loading:
+            with self._lock:
+                current = self._versions.get(name)
+            if current is not version and current != None and current.mtimes == mtimes:
+                return current
+            try:
+                loaded = TemplateVersion(name, raw_path, analysis_path)
+            except (OSError, ValueError, KeyError, TypeError):
+                if version == None:
+                    raise
+                logger.warning('Keeping template version %s, unable to reload the template files', name, exc_info=True)
+                return version
+            with self._lock:
+                if version == None:
+                    self.loads = self.loads + 1
+                    logger.info('Loaded template version %s', name)
+                else:
+                    self.reloads = self.reloads + 1
+                    logger.info('Reloaded template version %s, the template files changed', name)
+                self._versions[name] = loaded
+            return loaded
+
+    # Get the load statistics
+    def stats(self):
+        with self._lock:
+            return {'versions':len(self.paths),
+                    'loaded':len(self._versions),
+                    'loads':self.loads,
+                    'reloads':self.reloads}
+
+#==================================================================================================================================================================
+# SHARED REGISTRY
+# One registry per server process, shared by all sessions
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry == None:
+            _registry = TemplateRegistry()
+            _registry.register(DEFAULT_VERSION, os.path.join(TEMPLATE_DIR, 'Raw_Template.json'),
+                               os.path.join(TEMPLATE_DIR, 'Analysis_Template.json'))
+            if VERSIONS_FILE != None:
+                _registry.register_file(VERSIONS_FILE)
+        return _registry